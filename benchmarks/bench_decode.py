@@ -0,0 +1,77 @@
+'''CPU time of decoding github responses, per response.
+
+    python -m benchmarks.bench_decode [PULLS] [RUNS]
+'''
+
+import json
+import logging
+import sys
+from time import process_time
+
+from requests.models import Response
+from tabulate import tabulate
+
+from benchmarks.fakehub import FakeHub
+from bro import api
+
+
+def make_response(pulls):
+    '''A response of a page of pull requests, as read from the wire.'''
+    resp = Response()
+    resp.status_code = 200
+    resp.encoding = None
+    with FakeHub() as hub:
+        resp._content = json.dumps([
+            hub.pull_request('bro', 'gitbro', number)
+            for number in range(1, pulls + 1)
+        ]).encode()
+    return resp
+
+
+def legacy_decode(resp):
+    '''retrive_response before lazy debug bodies, which built the text for
+    the debug log and decoded it again to parse json.
+    '''
+    api.LOGGER.debug('Raw response retrived: %s', resp.text)
+    return resp.json()
+
+
+def stream_decode(resp):
+    body, size = resp.content, api.ITEMS_CHUNK_SIZE
+    return list(
+        api.iter_json_items(body[i:i + size]
+                            for i in range(0, len(body), size)))
+
+
+def timed(resp, func, runs):
+    '''Median CPU milliseconds of decoding a fresh copy of the response.'''
+    timings = []
+    for _ in range(runs):
+        # Responses cache their text, every run starts from raw bytes.
+        copy = Response()
+        copy.__dict__.update(resp.__dict__)
+        begin = process_time()
+        func(copy)
+        timings.append((process_time() - begin) * 1000)
+    return sorted(timings)[runs // 2]
+
+
+def main(pulls=100, runs=50):
+    logging.disable(logging.CRITICAL)
+    resp = make_response(pulls)
+    stdlib = lambda r: json.loads(r.content) if r.content else None  # noqa
+    rows = [
+        ['legacy (text + json())', timed(resp, legacy_decode, runs)],
+        ['decode_json, json', timed(resp, stdlib, runs)],
+        [
+            f'decode_json, {api.json_loads.__module__}',
+            timed(resp, api.decode_json, runs)
+        ],
+        ['iter_json_items', timed(resp, stream_decode, runs)],
+    ]
+    print(f'{pulls} pull requests, {len(resp.content)} bytes')
+    print(tabulate(rows, headers=['decode', 'cpu (ms)'], floatfmt='.3f'))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
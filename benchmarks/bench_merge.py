@@ -0,0 +1,76 @@
+'''Merging branches on a repo with a large tree.
+
+    python -m benchmarks.bench_merge [FILES]
+'''
+
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tabulate import tabulate
+
+from benchmarks.synthetic import file_path, make_repo
+from bro.git import GitRepo
+
+
+def git(path, *args):
+    return subprocess.run(['git', *args],
+                          cwd=path,
+                          check=True,
+                          capture_output=True,
+                          text=True).stdout.strip()
+
+
+def change(path, branch, n):
+    git(path, 'checkout', '-q', branch)
+    (path / file_path(n)).write_text(f'changed on {branch}\n')
+    git(path, 'commit', '-q', '-am', f'Change {n} on {branch}.')
+    return git(path, 'rev-parse', 'HEAD')
+
+
+def legacy_merge(repo, branch):
+    '''GitRepo.merge before fast-forward detection and tree merging.'''
+    master, subster = repo.current_branch, repo.get_branch(branch)
+    merge_base = repo.repo.merge_base(master, subster)
+    repo.repo.index.merge_tree(subster, base=merge_base)
+    return repo.repo.index.commit('Merged.',
+                                  parent_commits=(master.commit,
+                                                  subster.commit))
+
+
+def timed(path, start, func):
+    git(path, 'checkout', '-q', '-f', '-B', 'work', start)
+    repo = GitRepo(path)
+    begin = perf_counter()
+    func(repo)
+    return (perf_counter() - begin) * 1000
+
+
+def main(files=50000):
+    with TemporaryDirectory() as tmp:
+        path = make_repo(f'{tmp}/repo', depth=1, width=files)
+        base = git(path, 'rev-parse', 'HEAD')
+        git(path, 'branch', 'feature')
+        change(path, 'feature', 1)
+        ours = change(path, 'master', files - 1)
+
+        rows = [
+            [
+                'legacy (merge)',
+                timed(path, ours, lambda r: legacy_merge(r, 'feature'))
+            ],
+            ['merge', timed(path, ours, lambda r: r.merge('feature'))],
+            [
+                'legacy (fast-forward)',
+                timed(path, base, lambda r: legacy_merge(r, 'feature'))
+            ],
+            ['fast-forward', timed(path, base, lambda r: r.merge('feature'))],
+            ['up to date', timed(path, ours, lambda r: r.merge('master'))],
+        ]
+    print(f'{files} files, {files // 100} directories')
+    print(tabulate(rows, headers=['merge', 'time (ms)'], floatfmt='.1f'))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
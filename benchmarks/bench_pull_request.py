@@ -0,0 +1,135 @@
+'''Memory and construction time of pull request objects.
+
+    python -m benchmarks.bench_pull_request [COUNT]
+'''
+
+import json
+import sys
+import tracemalloc
+from time import perf_counter
+
+from tabulate import tabulate
+
+from bro.hub import PullRequest, PullRequestBatch
+
+
+class LegacyPullRequest:
+    '''Pull request keeping every key of the payload as an attribute.'''
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+def fake_user(n):
+    return {
+        'login': f'user{n}',
+        'id': n,
+        'node_id': f'MDQ6VXNlcj{n}',
+        'type': 'User',
+        'site_admin': False,
+        **{
+            f'{key}_url': f'https://api.github.com/users/user{n}/{key}'
+            for key in ('html', 'followers', 'following', 'gists', 'starred',
+                        'subscriptions', 'organizations', 'repos', 'events',
+                        'received_events', 'avatar')
+        }
+    }
+
+
+def fake_repo(n):
+    return {
+        'id': n,
+        'name': 'gitbro',
+        'full_name': f'user{n}/gitbro',
+        'owner': fake_user(n),
+        'private': False,
+        'description': 'Git management tool for better workflow.',
+        **{
+            f'{key}_url': f'https://api.github.com/repos/user{n}/gitbro/{key}'
+            for key in ('forks', 'keys', 'collaborators', 'teams', 'hooks',
+                        'issue_events', 'events', 'assignees', 'branches',
+                        'tags', 'blobs', 'git_tags', 'git_refs', 'trees',
+                        'statuses', 'languages', 'stargazers', 'contributors',
+                        'subscribers', 'subscription', 'commits',
+                        'git_commits', 'comments', 'issue_comment', 'contents',
+                        'compare', 'merges', 'archive', 'downloads', 'issues',
+                        'pulls', 'milestones', 'notifications', 'labels',
+                        'releases', 'deployments')
+        }
+    }
+
+
+def fake_pull_request(n):
+    ref = {
+        'label': f'user{n}:dev-{n}',
+        'ref': f'dev-{n}',
+        'sha': '%040x' % n,
+        'user': fake_user(n),
+        'repo': fake_repo(n)
+    }
+    return {
+        'id': 100000 + n,
+        'number': n,
+        'state': 'open',
+        'title': f'Pull request {n}',
+        'body': 'Some description of the change.\n' * 5,
+        'user': fake_user(n),
+        'head': ref,
+        'base': dict(ref, label='xzy:master', ref='master'),
+        'requested_reviewers': [fake_user(n + 1)],
+        'labels': [],
+        'merged': False,
+        'mergeable': True,
+        'commits': 3,
+        'additions': 42,
+        'deletions': 7,
+        'changed_files': 2,
+        'created_at': '2019-12-08T00:00:00Z',
+        'updated_at': '2019-12-08T00:00:00Z',
+        **{
+            f'{key}_url': f'https://github.com/xzy/gitbro/pull/{n}/{key}'
+            for key in ('html', 'diff', 'patch', 'issue', 'commits',
+                        'review_comments', 'review_comment', 'comments',
+                        'statuses')
+        }
+    }
+
+
+def measure(name, build, payloads):
+    '''Build objects from freshly decoded payloads as the api does, then
+    measure memory retained by the objects alone.
+    '''
+    raw = [json.dumps(payload) for payload in payloads]
+    decoded = [json.loads(data) for data in raw]
+    start = perf_counter()
+    build(decoded)
+    elapsed = perf_counter() - start
+    del decoded
+
+    tracemalloc.start()
+    objects = build(json.loads(data) for data in raw)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return [name, f'{elapsed:.3f}', retained // 1024]
+
+
+def main(count=10000):
+    payloads = [fake_pull_request(n) for n in range(count)]
+    rows = [
+        measure('legacy', lambda items: [
+            LegacyPullRequest(**data) for data in items
+        ], payloads),
+        measure('slots', lambda items: [
+            PullRequest.from_json(**data) for data in items
+        ], payloads),
+        measure('batch', PullRequestBatch.from_json, payloads),
+    ]
+    print(f'{count} pull requests')
+    print(
+        tabulate(rows,
+                 headers=['class', 'build (s)', 'memory (KiB)']))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
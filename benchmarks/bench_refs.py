@@ -0,0 +1,66 @@
+'''Branch and remote lookups on a repo with many refs.
+
+    python -m benchmarks.bench_refs [BRANCHES] [LOOKUPS]
+'''
+
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tabulate import tabulate
+
+from benchmarks.synthetic import make_repo
+from bro.git import GitRepo
+
+
+def age(path, seconds=60):
+    '''Move mtimes out of the racy window, as for refs not just written.'''
+    for root, _, files in os.walk(path / '.git'):
+        for name in [root] + [os.path.join(root, f) for f in files]:
+            stat = os.stat(name)
+            os.utime(name,
+                     ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 10**9))
+
+
+def timed(func, lookups):
+    start = perf_counter()
+    for _ in range(lookups):
+        func()
+    return (perf_counter() - start) / lookups * 1000
+
+
+def main(branches=30000, lookups=3):
+    with TemporaryDirectory() as tmp:
+        path = make_repo(f'{tmp}/repo', depth=100, width=10,
+                         branches=branches, checkout=False)
+        age(path)
+        repo = GitRepo(path)
+        names = [f'branch-{n:05d}' for n in range(0, branches, 997)]
+
+        rows = [
+            [
+                'heads[branch]',
+                timed(lambda: [repo.repo.heads[name] for name in names],
+                      lookups)
+            ],
+            [
+                'get_branch',
+                timed(lambda: [repo.get_branch(name) for name in names],
+                      lookups)
+            ],
+            [
+                'branch in heads',
+                timed(lambda: 'missing' in repo.repo.heads, lookups)
+            ],
+            [
+                'refs.has_branch',
+                timed(lambda: repo.refs.has_branch('missing'), lookups)
+            ],
+        ]
+    print(f'{branches} branches, {len(names)} branches per lookup')
+    print(tabulate(rows, headers=['lookup', 'time (ms)'], floatfmt='.2f'))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
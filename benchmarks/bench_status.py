@@ -0,0 +1,82 @@
+'''Ahead and behind counts of many branches against the main branch and
+their upstreams.
+
+    python -m benchmarks.bench_status [BRANCHES] [DEPTH]
+'''
+
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tabulate import tabulate
+
+from benchmarks.synthetic import make_repo
+from bro.git import GitRepo
+from bro.stats import StatsCache, ahead_behind
+
+
+def track_master(path, branches):
+    '''Have every other branch track local master.'''
+    with open(path / '.git/config', 'a') as f:
+        f.writelines(f'[branch "branch-{branch:05d}"]\n'
+                     '\tremote = .\n\tmerge = refs/heads/master\n'
+                     for branch in range(0, branches, 2))
+
+
+def pairs_of(repo):
+    main = repo.resolve('refs/remotes/upstream/master')
+    pairs = []
+    for _, sha, upstream, _ in repo.branch_upstreams():
+        pairs.append((sha, main))
+        if upstream:
+            pairs.append((sha, repo.refs.sha(upstream)))
+    return pairs
+
+
+def per_pair(repo, pairs):
+    '''One rev-list per pair, as counting by hand does.'''
+    return {(left, right): tuple(
+        map(int,
+            repo.executor.rev_list('--left-right', '--count',
+                                   f'{left}...{right}').split()))
+            for left, right in pairs}
+
+
+def timed(func):
+    start = perf_counter()
+    result = func()
+    return (perf_counter() - start) * 1000, result
+
+
+def main(branches=300, depth=5000):
+    with TemporaryDirectory() as tmp:
+        path = make_repo(f'{tmp}/repo', depth=depth, width=1,
+                         branches=branches, forked=True, upstream=True)
+        track_master(path, branches)
+        repo = GitRepo(path)
+        cache = StatsCache(f'{tmp}/stats.sqlite')
+        pairs = pairs_of(repo)
+
+        rows = []
+        elapsed, expected = timed(lambda: per_pair(repo, pairs))
+        rows.append(['rev-list per pair', elapsed])
+        elapsed, counts = timed(lambda: ahead_behind(repo, pairs))
+        assert counts == expected
+        rows.append(['one walk', elapsed])
+        subprocess.run(['git', 'commit-graph', 'write', '--reachable'],
+                       cwd=path,
+                       check=True,
+                       capture_output=True)
+        elapsed, _ = timed(lambda: ahead_behind(repo, pairs, cache))
+        rows.append(['one walk, commit-graph', elapsed])
+        elapsed, counts = timed(lambda: ahead_behind(repo, pairs, cache))
+        assert counts == expected
+        rows.append(['cached', elapsed])
+        cache.close()
+    print(f'{branches} branches, {len(pairs)} pairs, {depth} commits')
+    print(tabulate(rows, headers=['count', 'time (ms)'], floatfmt='.1f'))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,257 @@
+'''A local fake of the github api for benchmarks.
+Pull requests are kept in memory, and every response can be delayed to
+emulate the latency of the real api.
+
+    with FakeHub(latency=0.05) as hub:
+        hub.seed('owner', 'repo', 1000)
+        API(hub.url).repos.path('owner', 'repo').pulls.get()
+'''
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PULLS = re.compile(r'^/repos/([^/]+)/([^/]+)/pulls$')
+PULL = re.compile(r'^/repos/([^/]+)/([^/]+)/pulls/(\d+)(/merge)?$')
+COMMENTS = re.compile(r'^/repos/([^/]+)/([^/]+)/issues/(\d+)/comments$')
+DIFF = re.compile(r'^/raw/([^/]+)/([^/]+)/pull/(\d+)\.diff$')
+ALIAS = re.compile(r'(\w+): pullRequest\(number: (\d+)\)')
+
+
+def fake_diff(number, files=10, lines=20):
+    '''Unified diff of a pull request changing a few files.'''
+    chunks = []
+    for n in range(files):
+        path = f'dir{number}/file{n}.txt'
+        chunks.append(f'diff --git a/{path} b/{path}\n'
+                      f'--- a/{path}\n+++ b/{path}\n'
+                      f'@@ -1,{lines} +1,{lines} @@\n')
+        chunks.extend(f'-old line {i}\n+new line {i}\n' for i in range(lines))
+    return ''.join(chunks).encode()
+
+
+class FakeHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send(self, status, payload, headers=None):
+        data = payload if isinstance(payload, bytes) else json.dumps(
+            payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        url = urlsplit(self.path)
+        hub = self.server.hub
+        if hub.latency:
+            time.sleep(hub.latency)
+        with hub.lock:
+            hub.requests += 1
+            status, payload, headers = hub.handle(self.command, url.path,
+                                                  parse_qs(url.query), body)
+            headers.update(hub.rate_limit_headers())
+        self._send(status, payload, headers)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeHub:
+    '''Fake github serving pull requests of any number of repos.
+    Rate limit headers are only sent if a rate limit per hour is given.
+    '''
+
+    def __init__(self, latency=0, rate_limit=None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.started = time.time()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.pulls = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), FakeHubHandler)
+        self._server.daemon_threads = True
+        self._server.hub = self
+        self._thread = None
+
+    def __str__(self):
+        return 'FakeHub:<{url}>'.format(url=self.url)
+
+    __repr__ = __str__
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self._server.server_port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def rate_limit_headers(self):
+        if not self.rate_limit:
+            return {}
+        return {
+            'X-RateLimit-Remaining': str(max(self.rate_limit - self.requests,
+                                             0)),
+            'X-RateLimit-Reset': str(int(self.started) + 3600)
+        }
+
+    def pull_request(self, owner, repo, number, **fields):
+        user = {'login': owner, 'id': 1, 'type': 'User', 'html_url': ''}
+        ref = {'label': f'{owner}:master', 'ref': 'master', 'sha': '0' * 40}
+        pull = {
+            'id': number,
+            'number': number,
+            'state': 'open',
+            'merged': False,
+            'title': f'Pull request {number}',
+            'body': '',
+            'user': user,
+            'head': dict(ref),
+            'base': dict(ref),
+            'html_url': f'{self.url}/{owner}/{repo}/pull/{number}',
+            'requested_reviewers': [],
+        }
+        pull.update(fields)
+        return pull
+
+    def seed(self, owner, repo, count):
+        '''Add count open pull requests to a repo.'''
+        pulls = self.pulls.setdefault((owner, repo), {})
+        start = len(pulls) + 1
+        for number in range(start, start + count):
+            pulls[number] = self.pull_request(owner, repo, number)
+
+    def _list(self, path, pulls, query):
+        state = query.get('state', ['open'])[0]
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        selected = [
+            pull for pull in pulls.values()
+            if state == 'all' or pull['state'] == state
+        ]
+        headers = {}
+        if page * per_page < len(selected):
+            headers['Link'] = (f'<{self.url}{path}?state={state}&'
+                               f'per_page={per_page}&page={page + 1}>; '
+                               'rel="next"')
+        return 200, selected[(page - 1) * per_page:page * per_page], headers
+
+    def graphql_node(self, pull):
+        '''A pull request as the graphql api returns it.'''
+        state = 'MERGED' if pull['merged'] else pull['state'].upper()
+        return {
+            'databaseId': pull['id'],
+            'number': pull['number'],
+            'state': state,
+            'merged': pull['merged'],
+            'mergeable': 'MERGEABLE',
+            'title': pull['title'],
+            'body': pull['body'],
+            'url': pull['html_url'],
+            'commits': {
+                'totalCount': 1
+            },
+            'author': {
+                '__typename': 'User',
+                'login': pull['user']['login'],
+                'databaseId': pull['user']['id']
+            },
+            'headRefName': pull['head']['ref'],
+            'headRefOid': pull['head']['sha'],
+            'baseRefName': pull['base']['ref'],
+            'baseRefOid': pull['base']['sha'],
+            'reviewRequests': {
+                'nodes': []
+            }
+        }
+
+    def _graphql(self, body):
+        variables = body.get('variables') or {}
+        pulls = self.pulls.get((variables.get('owner'), variables.get('repo')))
+        if pulls is None:
+            return 200, {
+                'data': {
+                    'repository': None
+                },
+                'errors': [{
+                    'message': 'Could not resolve to a Repository.'
+                }]
+            }, {}
+        repository = {}
+        for alias, number in ALIAS.findall(body.get('query', '')):
+            pull = pulls.get(int(number))
+            repository[alias] = self.graphql_node(pull) if pull else None
+        return 200, {'data': {'repository': repository}}, {}
+
+    def handle(self, method, path, query, body):
+        '''Return status, payload and headers of a request.'''
+        if path == '/graphql' and method == 'POST':
+            return self._graphql(body)
+
+        match = PULLS.match(path)
+        if match:
+            owner, repo = match.groups()
+            pulls = self.pulls.setdefault((owner, repo), {})
+            if method == 'GET':
+                return self._list(path, pulls, query)
+            number = len(pulls) + 1
+            head, base = body.get('head', ''), body.get('base', 'master')
+            pulls[number] = self.pull_request(
+                owner,
+                repo,
+                number,
+                title=body.get('title', ''),
+                body=body.get('body', ''),
+                head={
+                    'label': head,
+                    'ref': head.partition(':')[2],
+                    'sha': '0' * 40
+                },
+                base={
+                    'label': f'{owner}:{base}',
+                    'ref': base,
+                    'sha': '0' * 40
+                })
+            return 201, pulls[number], {}
+
+        match = PULL.match(path) or COMMENTS.match(path) or DIFF.match(path)
+        if not match:
+            return 404, {'message': 'Not Found'}, {}
+        owner, repo, number = match.groups()[:3]
+        pull = self.pulls.get((owner, repo), {}).get(int(number))
+        if pull is None:
+            return 404, {'message': 'Not Found'}, {}
+
+        if DIFF.match(path):
+            return 200, fake_diff(pull['number']), {}
+        if COMMENTS.match(path):
+            return 201, {'id': pull['number'], 'body': body.get('body')}, {}
+        if match.group(4):
+            pull.update(state='closed', merged=True)
+            return 200, {'merged': True, 'message': 'Merged'}, {}
+        if method == 'PATCH':
+            pull.update(body)
+        return 200, pull, {}
@@ -0,0 +1,342 @@
+'''Benchmark suite of cli workflows and github functions.
+Workflows run on synthetic repos and github functions against a local fake
+github with injected latency. Results are saved as json, named after the
+version of the tree, so that runs of two versions can be compared.
+
+    python -m benchmarks.run --branches 1000 --width 10000 --latency 0.05
+    python -m benchmarks.run --compare benchmarks/results/v0.1.2.json
+'''
+
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+from click.testing import CliRunner
+from tabulate import tabulate
+
+from benchmarks.fakehub import FakeHub
+from benchmarks.synthetic import make_workspace
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+OWNER, REPO = 'bro', 'clone'
+AUTH = ('bro', 'token')
+SCENARIOS = {}
+
+
+def scenario(name):
+    '''Register a scenario, a function taking the bench and the number of
+    the run, doing any setup and returning the callable to time.
+    '''
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+
+    return decorator
+
+
+def git(path, *args):
+    subprocess.run(['git', *args], cwd=path, check=True, capture_output=True)
+
+
+def version():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty', '--tags'],
+            cwd=Path(__file__).parent,
+            check=True,
+            capture_output=True,
+            text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+@contextmanager
+def patched(obj, **attrs):
+    saved = {name: getattr(obj, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(obj, name, value)
+
+
+class Bench:
+    '''Synthetic repo, fake github and cli runner shared by scenarios.'''
+
+    def __init__(self, tmp, hub, **size):
+        self.clone = make_workspace(Path(tmp) / 'workspace', **size)
+        self.hub = hub
+        self.runner = CliRunner()
+        self.config = Path(tmp) / 'config'
+        self.config.write_text('[git]\n[github]\nusername = bro\n'
+                               'access_token = token\n')
+
+    def cli(self, *args):
+        from bro.cli import bro
+
+        result = self.runner.invoke(bro, ['-p', str(self.clone), *args])
+        if result.exit_code:
+            raise RuntimeError(f'bro {" ".join(args)} failed: '
+                               f'{result.output}{result.exception or ""}')
+        return result
+
+    @contextmanager
+    def github(self):
+        '''Point the cli and bro.hub to the fake github.'''
+        from bro import cli, hub
+        from bro.api import API, AsyncAPI, RateLimitScheduler
+
+        scheduler = RateLimitScheduler()
+        apis = dict(GITHUB_SCHEDULER=scheduler,
+                    GITHUB_API=API(self.hub.url, scheduler=scheduler),
+                    GITHUB_PATCH_API=API(self.hub.url),
+                    GITHUB_ASYNC_API=AsyncAPI(self.hub.url,
+                                              scheduler=scheduler))
+        with patched(hub, **apis), patched(
+                cli,
+                CONFIG_FILE=self.config,
+                get_pr_msg=lambda: ('Benchmark.', 'Made by benchmarks.')):
+            try:
+                yield
+            finally:
+                apis['GITHUB_ASYNC_API'].close()
+
+
+@scenario('pickup')
+def pickup(bench, run):
+    git(bench.clone, 'checkout', '-q', 'master')
+    return lambda: bench.cli('pickup', f'pickup-{run}')
+
+
+@scenario('pipeline')
+def pipeline(bench, run):
+    return lambda: bench.cli('pipeline')
+
+
+@scenario('putout')
+def putout(bench, run):
+    branch = f'putout-{run}'
+    git(bench.clone, 'checkout', '-q', '-b', branch, 'upstream/master')
+    git(bench.clone, 'push', '-q', 'origin', branch)
+    return lambda: bench.cli('putout', branch)
+
+
+@scenario('pull-request make')
+def pull_request_make(bench, run):
+    git(bench.clone, 'checkout', '-q', '-b', f'make-{run}', 'master')
+    return lambda: bench.cli('pull-request', 'make', OWNER)
+
+
+@scenario('pull-request get')
+def pull_request_get(bench, run):
+    return lambda: bench.cli('pull-request', 'get', str(run + 1),
+                             f'get-{run}')
+
+
+@scenario('hub.create_pull_request')
+def hub_create(bench, run):
+    from bro.hub import create_pull_request
+
+    return lambda: create_pull_request(
+        OWNER, REPO, 'Benchmark.', f'bro:create-{run}', 'master', AUTH)
+
+
+@scenario('hub.get_pull_request')
+def hub_get(bench, run):
+    from bro.hub import get_pull_request
+
+    return lambda: get_pull_request(OWNER, REPO, 1, AUTH)
+
+
+@scenario('hub.get_pull_request x100')
+def hub_get_many(bench, run):
+    from bro.hub import get_pull_request
+
+    return lambda: [
+        get_pull_request(OWNER, REPO, number, AUTH)
+        for number in range(1, 101)
+    ]
+
+
+@scenario('hub.get_pull_requests x100')
+def hub_get_batch(bench, run):
+    from bro.hub import get_pull_requests
+
+    return lambda: get_pull_requests(OWNER, REPO, range(1, 101), AUTH)
+
+
+@scenario('hub.list_pull_requests')
+def hub_list(bench, run):
+    from bro.hub import list_pull_requests
+
+    return lambda: sum(1 for _ in list_pull_requests(OWNER, REPO, AUTH))
+
+
+@scenario('hub.batch_pull_requests')
+def hub_batch(bench, run):
+    from bro.hub import batch_pull_requests
+
+    numbers = range(1, 51)
+    return lambda: list(
+        batch_pull_requests(OWNER, REPO, AUTH, 'comment', numbers,
+                            comment='Benchmark.'))
+
+
+@scenario('hub.async_get_pull_request')
+def hub_async_get(bench, run):
+    from bro.hub import async_get_pull_request
+
+    async def get_many():
+        return await asyncio.gather(*(async_get_pull_request(
+            OWNER, REPO, number, AUTH) for number in range(1, 51)))
+
+    return lambda: asyncio.run(get_many())
+
+
+@scenario('hub.download_pull_request_diff')
+def hub_diff(bench, run):
+    from bro.hub import download_pull_request_diff
+
+    path = bench.clone.parent / 'pr.diff'
+    return lambda: download_pull_request_diff(OWNER, REPO, 1, path)
+
+
+def run_suite(names, repeat, latency, rate_limit, pulls, **size):
+    results = {}
+    with TemporaryDirectory() as tmp, FakeHub(latency=latency,
+                                              rate_limit=rate_limit) as hub:
+        hub.seed(OWNER, REPO, pulls)
+        bench = Bench(tmp, hub, pulls=repeat, **size)
+        with bench.github():
+            for name in names:
+                timings = []
+                for run in range(repeat):
+                    func = SCENARIOS[name](bench, run)
+                    start = perf_counter()
+                    func()
+                    timings.append((perf_counter() - start) * 1000)
+                results[name] = {
+                    'median_ms': statistics.median(timings),
+                    'min_ms': min(timings),
+                    'max_ms': max(timings),
+                    'runs': repeat
+                }
+                click.echo(f'{name}: {results[name]["median_ms"]:.1f} ms',
+                           err=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Tabulate results against a baseline.
+    Return:
+        Names of scenarios slower than the baseline by more than threshold.
+    '''
+    rows, regressions = [], []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            rows.append([name, None, result['median_ms'], None, 'new'])
+            continue
+        ratio = result['median_ms'] / max(before['median_ms'], 1e-9)
+        status = 'ok'
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        rows.append(
+            [name, before['median_ms'], result['median_ms'], ratio, status])
+    click.echo(f'Compared with {baseline["version"]}:')
+    click.echo(
+        tabulate(rows,
+                 headers=['scenario', 'before (ms)', 'after (ms)', 'ratio',
+                          ''],
+                 floatfmt='.2f'))
+    return regressions
+
+
+@click.command()
+@click.option('-s',
+              '--scenario',
+              'names',
+              multiple=True,
+              type=click.Choice(list(SCENARIOS)),
+              help='Scenarios to run, default all.')
+@click.option('--branches', default=100, help='Branches of synthetic repo.')
+@click.option('--depth', default=100, help='Commits of synthetic repo.')
+@click.option('--width', default=1000, help='Files of synthetic repo.')
+@click.option('--pulls',
+              default=500,
+              type=click.IntRange(min=100),
+              help='Pull requests on fake github, at least the 100 that '
+              'x100 scenarios get.')
+@click.option('--latency',
+              default=0.02,
+              help='Seconds added to every fake github response.')
+@click.option('--rate-limit',
+              type=int,
+              help='Requests per hour of fake github, default unlimited.')
+@click.option('-n', '--repeat', default=5, help='Runs of every scenario.')
+@click.option('-o', '--output', type=click.Path(), help='Result file.')
+@click.option('-c',
+              '--compare',
+              'baseline',
+              type=click.File(),
+              help='Result file of another version to compare with.')
+@click.option('--threshold',
+              default=0.2,
+              help='Slowdown ratio reported as a regression.')
+def main(names, branches, depth, width, pulls, latency, rate_limit, repeat,
+         output, baseline, threshold):
+    '''Run benchmarks and save results.'''
+    params = dict(branches=branches,
+                  depth=depth,
+                  width=width,
+                  pulls=pulls,
+                  latency=latency,
+                  rate_limit=rate_limit,
+                  repeat=repeat)
+    results = run_suite(names or list(SCENARIOS), repeat, latency,
+                        rate_limit, pulls,
+                        branches=branches, depth=depth, width=width)
+    report = {
+        'version': version(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results
+    }
+
+    output = Path(output or RESULTS_DIR / f'{report["version"]}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + '\n')
+    click.echo(
+        tabulate([[name, r['median_ms'], r['min_ms'], r['max_ms']]
+                  for name, r in results.items()],
+                 headers=['scenario', 'median (ms)', 'min (ms)', 'max (ms)'],
+                 floatfmt='.2f'))
+    click.echo(f'Saved results to {output}.')
+
+    if baseline:
+        baseline = json.load(baseline)
+        if baseline['params'] != params:
+            click.echo('Warning: baseline was run with other parameters.',
+                       err=True)
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''Synthetic git repos of configurable size for benchmarks.'''
+
+import subprocess
+from pathlib import Path
+
+AUTHOR = 'bro <bro@gitbro> 1575763200 +0000'
+
+
+def file_path(n):
+    return f'dir{n // 100:04d}/file{n:06d}.txt'
+
+
+def commit(ref, mark, message, parent=None):
+    lines = [f'commit {ref}', f'mark :{mark}', f'author {AUTHOR}',
+             f'committer {AUTHOR}', f'data {len(message)}', message]
+    if parent:
+        lines.append(f'from :{parent}')
+    return '\n'.join(lines) + '\n'
+
+
+def fast_import_stream(depth, width, branches, forked=False, upstream=False):
+    '''Linear history of `depth` commits, the first adding `width` files and
+    every other changing one file, with `branches` branches spread along it.
+    Forked branches get a few commits of their own instead of pointing at
+    master, and upstream adds `upstream/master` one commit ahead of master.
+    '''
+    yield 'blob\nmark :1\ndata 8\ncontent\n'
+    for n in range(depth):
+        yield commit('refs/heads/master', n + 2, f'commit {n:04d}')
+        if n == 0:
+            yield ''.join(f'M 100644 :1 {file_path(f)}\n'
+                          for f in range(width))
+        else:
+            change = f'change {n}\n'
+            yield (f'M 100644 inline {file_path(n % width)}\n'
+                   f'data {len(change)}\n{change}')
+    mark = depth + 1
+    if upstream:
+        mark += 1
+        yield commit('refs/remotes/upstream/master', mark, 'upstream',
+                     parent=depth + 1)
+    for branch in range(branches):
+        ref = f'refs/heads/branch-{branch:05d}'
+        if not forked:
+            yield f'reset {ref}\nfrom :{branch % depth + 2}\n\n'
+            continue
+        parent = branch * 7 % depth + 2
+        for n in range(branch % 3 + 1):
+            mark += 1
+            yield commit(ref, mark, f'branch {branch} {n}', parent=parent)
+            parent = mark
+
+
+def make_repo(path, depth=10, width=100, branches=0, forked=False,
+              upstream=False, packed=True, checkout=True):
+    '''Create a synthetic repo at path and return its path.'''
+    path = Path(path)
+    subprocess.run(['git', 'init', '-q', '-b', 'master', str(path)],
+                   check=True)
+    stream = ''.join(
+        fast_import_stream(depth, width, branches, forked, upstream))
+    subprocess.run(['git', 'fast-import', '--quiet'],
+                   input=stream.encode(),
+                   cwd=path,
+                   check=True)
+    if packed:
+        subprocess.run(['git', 'pack-refs', '--all'], cwd=path, check=True)
+    if checkout:
+        subprocess.run(['git', 'reset', '-q', '--hard', 'master'],
+                       cwd=path,
+                       check=True)
+    for key, value in (('user.name', 'bro'), ('user.email', 'bro@gitbro')):
+        subprocess.run(['git', 'config', key, value], cwd=path, check=True)
+    return path
+
+
+def make_workspace(path, pulls=0, **kwargs):
+    '''Create a synthetic repo as the bare `upstream`, a bare fork of it as
+    `origin` and a clone with both remotes, like a repo gitbro works on.
+    Upstream gets `refs/pull/N/head` refs of `pulls` pull requests.
+    Return:
+        Path of the clone.
+    '''
+    path = Path(path)
+    seed = make_repo(path / 'seed', checkout=False, **kwargs)
+    upstream, origin = path / 'upstream.git', path / 'origin.git'
+    for source, target in ((seed, upstream), (upstream, origin)):
+        subprocess.run(
+            ['git', 'clone', '-q', '--bare',
+             str(source), str(target)],
+            check=True)
+    for number in range(1, pulls + 1):
+        subprocess.run(
+            ['git', 'update-ref', f'refs/pull/{number}/head', 'master'],
+            cwd=upstream,
+            check=True)
+
+    clone = path / 'clone'
+    subprocess.run(
+        ['git', 'clone', '-q', '-o', 'upstream',
+         str(upstream), str(clone)],
+        check=True)
+    subprocess.run(['git', 'remote', 'add', 'origin',
+                    str(origin)],
+                   cwd=clone,
+                   check=True)
+    subprocess.run(['git', 'fetch', '-q', 'origin'], cwd=clone, check=True)
+    for key, value in (('user.name', 'bro'), ('user.email', 'bro@gitbro')):
+        subprocess.run(['git', 'config', key, value], cwd=clone, check=True)
+    return clone
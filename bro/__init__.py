@@ -1,8 +1,42 @@
-from .api import API
-from .hub import (PullRequest, comment_pull_request, create_pull_request,
-                  get_pull_request, merge_pull_request, update_pull_request)
-
-__all__ = [
-    'API', 'PullRequest', 'create_pull_request', 'update_pull_request',
-    'get_pull_request', 'comment_pull_request', 'merge_pull_request'
-]
+'''Api of gitbro, loaded on first use so that commands which do not talk to
+github never import requests.
+'''
+
+from importlib import import_module
+from pathlib import Path
+
+# Where gitbro keeps its caches and state, next to the config file.
+DATA_DIR = Path.home() / '.config/bro.d'
+
+_EXPORTS = {
+    'API': 'api',
+    'AsyncAPI': 'api',
+    'PullRequest': 'hub',
+    'PullRequestBatch': 'hub',
+    'create_pull_request': 'hub',
+    'update_pull_request': 'hub',
+    'get_pull_request': 'hub',
+    'get_pull_requests': 'hub',
+    'list_pull_requests': 'hub',
+    'comment_pull_request': 'hub',
+    'merge_pull_request': 'hub',
+    'async_create_pull_request': 'hub',
+    'async_update_pull_request': 'hub',
+    'async_get_pull_request': 'hub',
+    'async_comment_pull_request': 'hub',
+    'async_merge_pull_request': 'hub',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
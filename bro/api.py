@@ -1,83 +1,302 @@
 '''This module defines a thin wrapper class of requests for chaining usage.'''
 
-from logging import getLogger
-from os.path import join
+import asyncio
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import lru_cache, partial
+from heapq import heapify, heappop, heappush
+from itertools import count
+from json import JSONDecodeError, JSONDecoder
+from logging import DEBUG, getLogger
+from threading import Condition
+from time import monotonic, time
 
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from requests.sessions import Session
 
+from bro.trace import span
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 LOGGER = getLogger(__name__)
 DEFAULT_TIMEOUT = 5
+DEBUG_BODY_LIMIT = 2048
+ITEMS_CHUNK_SIZE = 64 * 1024
+NUMBER_CHARS = '0123456789.eE+-'
+DEFAULT_CONCURRENCY = 10
+DEFAULT_BURST = 20
+# Remaining requests of a resource below which they are paced.
+DEFAULT_LOW_WATER = 100
+MAX_RETRIES = 3
+SECONDARY_LIMIT_WAIT = 60
 
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+_PRIORITY = ContextVar('priority', default=PRIORITY_INTERACTIVE)
 
-class API:
-    '''Chaining wrapper class of requests.'''
 
-    def __init__(self, host, timeout=None):
-        self.host = host.rstrip('/')
-        self.timeout = timeout or DEFAULT_TIMEOUT
-        self.paths = []
+@contextmanager
+def priority(level):
+    '''Run requests made within the block with certain priority.
+    Background bulk jobs should use PRIORITY_BULK, so that interactive
+    commands sharing the same scheduler are served first.
+    '''
+    token = _PRIORITY.set(level)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
 
-        self._session = Session()
 
-    def __getattr__(self, key):
-        '''Chain up for later url building.'''
-        if key:
-            self.paths.append(key)
-        return self
+def rate_limit_resource(url):
+    '''Budget of github a request to url is counted in, until a response
+    tells it by `X-RateLimit-Resource`.
+    '''
+    path = url.split('?')[0].rstrip('/')
+    if path.endswith('/graphql'):
+        return 'graphql'
+    if '/search/' in path:
+        return 'search'
+    return 'core'
+
+
+class RateLimitBucket:
+    '''Token bucket of one rate limit resource of github.
+    While the remaining budget is above the low-water mark, the bucket holds
+    all of it, so requests are not paced at all. Below it, the bucket holds
+    a small burst refilled at the rate of remaining budget over the time
+    left until reset. An exhausted budget pauses the resource until reset.
+    '''
+
+    def __init__(self, resource, burst=None, low_water=None):
+        self.resource = resource
+        self.burst = burst or DEFAULT_BURST
+        self.low_water = low_water or DEFAULT_LOW_WATER
+        self.capacity = self.tokens = self.burst
+        self.rate = None
+        self.remaining = self.reset_at = None
+        self.paused_until = 0
+        self.queue = []
+        self._refilled = monotonic()
 
     def __str__(self):
-        return 'RequestApi:<{host}>'.format(host=self.host)
+        return 'RateLimitBucket:<{resource} {remaining} until {reset}>'.format(
+            resource=self.resource,
+            remaining=self.remaining,
+            reset=self.reset_at)
 
     __repr__ = __str__
 
-    def path(self, *args):
-        '''For parameter parts in a url.'''
-        for key in args:
-            if key:
-                self.paths.append(key)
-        return self
+    def delay(self, now):
+        '''Seconds to wait before next request, refill tokens meanwhile.'''
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate is None:
+            return 0
 
-    def build_url_path(self, append_slash=False):
-        '''Build endpoint from host and paths.
-        If append_slash is True, an ending slash will be appended
-        to the final url.
-        '''
-        if append_slash:
-            self.paths.append('')
-        endpoint = join(self.host, *self.paths)
+        elapsed, self._refilled = now - self._refilled, now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
 
-        LOGGER.debug('Built endpoint: %s', endpoint)
-        self.paths = []
+    def take(self):
+        if self.rate is not None:
+            self.tokens -= 1
 
-        return endpoint
+    def update(self, remaining, reset_at):
+        self.remaining, self.reset_at = remaining, reset_at
+        window = max(reset_at - time(), 1)
+        if not remaining:
+            # Budget is back in full after reset.
+            self.rate = None
+            self.paused_until = monotonic() + window
+        elif remaining > self.low_water:
+            self.rate = remaining / window
+            self.capacity = self.tokens = remaining
+        else:
+            self.rate = remaining / window
+            self.capacity = min(remaining, self.burst)
+            self.tokens = min(self.tokens, self.capacity)
 
-    def retrive_response(self,
-                         method,
-                         url=None,
-                         append_slash=False,
-                         response_type='json',
-                         auth=None,
-                         **kwargs):
-        '''Actual funtion to make requests and get response.
-        Args:
-            response_type: type of response to return, could be `text` or `status`, default to `json`.  # noqa
-            auth: two items in a tuple, like (username, password)
+
+class RateLimitScheduler:
+    '''Pace outgoing requests by the rate limit headers of github, with a
+    bucket for every rate limit resource, like `core` and `graphql`.
+    Throttled responses pause all requests until they may be retried.
+    Waiting requests of a resource are served by priority, then in order.
+    '''
+
+    def __init__(self, burst=None, low_water=None):
+        self.burst = burst
+        self.low_water = low_water
+        self.buckets = {}
+        self.paused_until = 0
+
+        self._cond = Condition()
+        self._seq = count()
+
+    def __str__(self):
+        return 'RateLimitScheduler:<{buckets}>'.format(
+            buckets=', '.join(map(str, self.buckets.values())))
+
+    __repr__ = __str__
+
+    def bucket(self, resource='core'):
+        if resource not in self.buckets:
+            self.buckets[resource] = RateLimitBucket(resource, self.burst,
+                                                     self.low_water)
+        return self.buckets[resource]
+
+    def _delay(self, bucket):
+        now = monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        return bucket.delay(now)
+
+    def acquire(self, resource='core'):
+        '''Block until the request is allowed to go.'''
+        ticket = (_PRIORITY.get(), next(self._seq))
+        with self._cond:
+            bucket = self.bucket(resource)
+            heappush(bucket.queue, ticket)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if bucket.queue[0] == ticket:
+                        delay = self._delay(bucket)
+                        if delay == 0:
+                            break
+                    else:
+                        delay = None
+                    self._cond.wait(delay)
+            except BaseException:
+                bucket.queue.remove(ticket)
+                heapify(bucket.queue)
+                self._cond.notify_all()
+                raise
+
+            heappop(bucket.queue)
+            bucket.take()
+            self._cond.notify_all()
+
+    def observe(self, resp, resource='core'):
+        '''Update budget of the resource of a response from its headers.
         Return:
-            Depend on response_type, use response.text, response.status_code or response.json().  # noqa
+            True if the request was throttled and should be requeued.
         '''
-        if not url:
-            url = self.build_url_path(append_slash)
-        if auth:
-            auth = HTTPBasicAuth(*auth)
-        resp = self._session.request(method, url=url, auth=auth, **kwargs)
+        headers = resp.headers
+        with self._cond:
+            bucket = self.bucket(
+                headers.get('X-RateLimit-Resource', resource))
+            if 'X-RateLimit-Remaining' in headers:
+                bucket.update(int(headers['X-RateLimit-Remaining']),
+                              int(headers.get('X-RateLimit-Reset', 0)))
 
-        LOGGER.debug('Raw response retrived: %s', resp.text)
-        resp.raise_for_status()
+            delay = self._retry_delay(resp, bucket)
+            if delay is not None and bucket.remaining != 0:
+                # Retry-After and secondary limits hold off every request.
+                self.paused_until = max(self.paused_until,
+                                        monotonic() + delay)
+            self._cond.notify_all()
 
-        if response_type:
-            attr = getattr(resp, response_type, None)
-            return attr() if callable(attr) else attr
+        return delay is not None
+
+    @staticmethod
+    def _retry_delay(resp, bucket):
+        if resp.status_code not in (403, 429):
+            return None
+        if 'Retry-After' in resp.headers:
+            return int(resp.headers['Retry-After'])
+        if bucket.remaining == 0:
+            return max(bucket.reset_at - time(), 1)
+        if 'rate limit' in resp.text.lower():
+            # Secondary rate limit without a hint, github advises a minute.
+            return SECONDARY_LIMIT_WAIT
+        return None
+
+
+def decode_json(resp):
+    '''Parse the raw body of a response, skipping the decode to text.
+    Return:
+        The json value, or None if the body is empty.
+    '''
+    return json_loads(resp.content) if resp.content else None
+
+
+def preview_body(content, limit=None):
+    '''Head of a body for logging, decoding only what is shown.'''
+    limit = limit or DEBUG_BODY_LIMIT
+    text = content[:limit].decode('utf-8', 'replace')
+    if len(content) > limit:
+        text += f'... ({len(content)} bytes)'
+    return text
+
+
+def _skip_space(buffer, pos):
+    while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+        pos += 1
+    return pos
+
+
+def iter_json_items(chunks):
+    '''Yield items of a json array as chunks of its body arrive.
+    Only one item and the unparsed tail are held at a time, so the memory
+    used stays flat no matter how long the array is.
+    '''
+    decoder = JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer, pos, started = '', 0, False
+    for chunk in chunks:
+        buffer = buffer[pos:] + text.decode(chunk)
+        pos = _skip_space(buffer, 0)
+        if not started and pos < len(buffer):
+            if buffer[pos] != '[':
+                raise ValueError('Response is not a json array.')
+            started, pos = True, pos + 1
+        while started:
+            pos = _skip_space(buffer, pos)
+            if buffer.startswith(',', pos):
+                pos = _skip_space(buffer, pos + 1)
+            if buffer.startswith(']', pos):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except JSONDecodeError:
+                break
+            # Items are followed by `,` or `]`. Until one arrives, a number
+            # parsed from `1500.` or `1e+` goes on in the next chunk.
+            after = _skip_space(buffer, end)
+            if after == len(buffer) or not buffer[end:].lstrip(NUMBER_CHARS):
+                break
+            if buffer[after] not in ',]':
+                raise ValueError(f'Unexpected {buffer[after]!r} after an item '
+                                 'of a json array.')
+            yield item
+            pos = end
+    raise ValueError('Response ended within a json array.')
+
+
+@lru_cache(maxsize=256)
+def compile_route(shape):
+    '''Compile a route shape into a url template.
+    Shape is a tuple of static segments with None as placeholder for
+    parameters, like ('repos', None, None, 'pulls', None).
+    '''
+    return '/'.join('{}' if segment is None else segment.replace(
+        '{', '{{').replace('}', '}}') for segment in shape)
+
+
+class Requester:
+    '''Request methods shared by API and its routes.'''
+
+    __slots__ = ()
 
     def get(self,
             headers=None,
@@ -85,15 +304,19 @@ class API:
             timeout=None,
             auth=None,
             append_slash=False,
-            response_type='json'):
-        '''Wrapper method of get.'''
-        return self.retrive_response('get',
-                                     headers=headers,
-                                     params=params,
-                                     timeout=timeout or self.timeout,
-                                     append_slash=append_slash,
-                                     response_type=response_type,
-                                     auth=auth)
+            response_type='json',
+            stream=False):
+        '''Wrapper method of get.
+        With stream, the body is left unread for `response` type.
+        '''
+        return self.api.retrive_response('get',
+                                         headers=headers,
+                                         params=params,
+                                         url=self.build_url_path(append_slash),
+                                         timeout=timeout or self.api.timeout,
+                                         response_type=response_type,
+                                         auth=auth,
+                                         stream=stream)
 
     def post(self,
              headers=None,
@@ -103,13 +326,13 @@ class API:
              append_slash=False,
              response_type='json'):
         '''Wrapper method of post.'''
-        return self.retrive_response('post',
-                                     headers=headers,
-                                     json=json,
-                                     timeout=timeout or self.timeout,
-                                     append_slash=append_slash,
-                                     response_type=response_type,
-                                     auth=auth)
+        return self.api.retrive_response('post',
+                                         headers=headers,
+                                         json=json,
+                                         url=self.build_url_path(append_slash),
+                                         timeout=timeout or self.api.timeout,
+                                         response_type=response_type,
+                                         auth=auth)
 
     def put(self,
             headers=None,
@@ -119,13 +342,13 @@ class API:
             append_slash=False,
             response_type='json'):
         '''Wrapper method of put.'''
-        return self.retrive_response('put',
-                                     headers=headers,
-                                     json=json,
-                                     timeout=timeout or self.timeout,
-                                     append_slash=append_slash,
-                                     response_type=response_type,
-                                     auth=auth)
+        return self.api.retrive_response('put',
+                                         headers=headers,
+                                         json=json,
+                                         url=self.build_url_path(append_slash),
+                                         timeout=timeout or self.api.timeout,
+                                         response_type=response_type,
+                                         auth=auth)
 
     def patch(self,
               headers=None,
@@ -135,13 +358,13 @@ class API:
               append_slash=False,
               response_type='json'):
         '''Wrapper method of patch.'''
-        return self.retrive_response('patch',
-                                     headers=headers,
-                                     json=json,
-                                     timeout=timeout or self.timeout,
-                                     append_slash=append_slash,
-                                     response_type=response_type,
-                                     auth=auth)
+        return self.api.retrive_response('patch',
+                                         headers=headers,
+                                         json=json,
+                                         url=self.build_url_path(append_slash),
+                                         timeout=timeout or self.api.timeout,
+                                         response_type=response_type,
+                                         auth=auth)
 
     def delete(self,
                headers=None,
@@ -151,10 +374,215 @@ class API:
                append_slash=False,
                response_type='json'):
         '''Wrapper method of delete.'''
-        return self.retrive_response('delete',
-                                     headers=headers,
-                                     json=json,
-                                     timeout=timeout or self.timeout,
-                                     append_slash=append_slash,
-                                     response_type=response_type,
-                                     auth=auth)
+        return self.api.retrive_response('delete',
+                                         headers=headers,
+                                         json=json,
+                                         url=self.build_url_path(append_slash),
+                                         timeout=timeout or self.api.timeout,
+                                         response_type=response_type,
+                                         auth=auth)
+
+
+class Route(Requester):
+    '''Immutable url path of an API built by chaining.
+    Every step of chaining returns a new route, so routes can be built and
+    used from many threads at once.
+    '''
+
+    __slots__ = ('api', 'shape', 'args')
+
+    def __init__(self, api, shape=(), args=()):
+        self.api = api
+        self.shape = shape
+        self.args = args
+
+    def __getattr__(self, key):
+        '''Chain up a static segment.'''
+        if key.startswith('__'):
+            raise AttributeError(key)
+        return Route(self.api, self.shape + (key, ), self.args)
+
+    def __str__(self):
+        return 'Route:<{url}>'.format(url=self.build_url_path())
+
+    __repr__ = __str__
+
+    def path(self, *args):
+        '''For parameter parts in a url.'''
+        args = tuple(str(arg) for arg in args if arg not in (None, ''))
+        return Route(self.api, self.shape + (None, ) * len(args),
+                     self.args + args)
+
+    def build_url_path(self, append_slash=False):
+        '''Build endpoint from host and paths.
+        If append_slash is True, an ending slash will be appended
+        to the final url.
+        '''
+        endpoint = '/'.join(
+            (self.api.host, compile_route(self.shape).format(*self.args)))
+        if append_slash:
+            endpoint += '/'
+
+        LOGGER.debug('Built endpoint: %s', endpoint)
+        return endpoint
+
+
+class API(Requester):
+    '''Chaining wrapper class of requests.'''
+
+    def __init__(self, host, timeout=None, cache=None, scheduler=None):
+        self.host = host.rstrip('/')
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.cache = cache
+        self.scheduler = scheduler
+
+        self._session = Session()
+
+    def __getattr__(self, key):
+        '''Chain up for later url building.'''
+        return getattr(Route(self), key)
+
+    def __str__(self):
+        return 'RequestApi:<{host}>'.format(host=self.host)
+
+    __repr__ = __str__
+
+    @property
+    def api(self):
+        return self
+
+    def path(self, *args):
+        '''For parameter parts in a url.'''
+        return Route(self).path(*args)
+
+    def build_url_path(self, append_slash=False):
+        '''Build endpoint of the host itself.'''
+        return self.host + '/' if append_slash else self.host
+
+    def retrive_response(self,
+                         method,
+                         url=None,
+                         append_slash=False,
+                         response_type='json',
+                         auth=None,
+                         **kwargs):
+        '''Actual funtion to make requests and get response.
+        Args:
+            response_type: type of response to return, could be `text`, `status_code`, `items` or `response`, default to `json`.  # noqa
+            auth: two items in a tuple, like (username, password)
+        Return:
+            Depend on response_type, use response.text, response.status_code, the parsed json, a generator of items of a json array streamed from the body or the response itself.  # noqa
+        '''
+        if not url:
+            url = self.build_url_path(append_slash)
+        if response_type == 'items':
+            kwargs['stream'] = True
+
+        cache_key = cached = None
+        if (self.cache is not None and method == 'get'
+                and not kwargs.get('stream')):
+            cache_key = self.cache.make_key(url, kwargs.get('params'), auth)
+            cached = self.cache.get(cache_key)
+            if cached:
+                kwargs['headers'] = dict(kwargs.get('headers') or {},
+                                         **cached.validators)
+
+        if auth:
+            auth = HTTPBasicAuth(*auth)
+        resource = rate_limit_resource(url)
+        with span(f'{method.upper()} {url}', cat='http') as request_span:
+            for _ in range(MAX_RETRIES + 1):
+                if self.scheduler:
+                    with span('rate limit wait', cat='http'):
+                        self.scheduler.acquire(resource)
+                resp = self._session.request(method,
+                                             url=url,
+                                             auth=auth,
+                                             **kwargs)
+                if not self.scheduler or not self.scheduler.observe(
+                        resp, resource):
+                    break
+                LOGGER.info('Rate limited on %s %s, requeued.',
+                            method.upper(), url)
+            if cache_key:
+                self.cache.update(cache_key, cached, resp)
+            # Elapsed covers the request until headers are parsed, the rest
+            # of the span is mostly transfer of the body.
+            request_span.set(status=resp.status_code,
+                             headers_ms=resp.elapsed.total_seconds() * 1000)
+
+        if not kwargs.get('stream') and LOGGER.isEnabledFor(DEBUG):
+            LOGGER.debug('Raw response retrived: %s',
+                         preview_body(resp.content))
+        resp.raise_for_status()
+
+        if response_type == 'response':
+            return resp
+        if response_type == 'json':
+            return decode_json(resp)
+        if response_type == 'items':
+            return iter_json_items(resp.iter_content(ITEMS_CHUNK_SIZE))
+        if response_type:
+            attr = getattr(resp, response_type, None)
+            return attr() if callable(attr) else attr
+
+
+class AsyncAPI(API):
+    '''Asyncio counterpart of API.
+    Chaining works the same way, but every request method returns a coroutine.
+    Requests share one connection pool and at most `concurrency` of them are
+    in flight at the same time.
+    '''
+
+    def __init__(self,
+                 host,
+                 timeout=None,
+                 cache=None,
+                 scheduler=None,
+                 concurrency=None):
+        super().__init__(host, timeout, cache, scheduler)
+        self.concurrency = concurrency or DEFAULT_CONCURRENCY
+
+        adapter = HTTPAdapter(pool_connections=self.concurrency,
+                              pool_maxsize=self.concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='bro-api')
+
+    def __str__(self):
+        return 'AsyncRequestApi:<{host}>'.format(host=self.host)
+
+    __repr__ = __str__
+
+    def retrive_response(self,
+                         method,
+                         url=None,
+                         append_slash=False,
+                         response_type='json',
+                         auth=None,
+                         **kwargs):
+        '''Same as API.retrive_response but returns an awaitable.
+        The url is built right away, so chained paths of calls which are
+        awaited later never mix up.
+        '''
+        if not url:
+            url = self.build_url_path(append_slash)
+        call = partial(super().retrive_response,
+                       method,
+                       url=url,
+                       response_type=response_type,
+                       auth=auth,
+                       **kwargs)
+        return self._run(call)
+
+    async def _run(self, call):
+        loop = asyncio.get_running_loop()
+        # Carry the request priority over to the worker thread.
+        return await loop.run_in_executor(self._executor,
+                                          copy_context().run, call)
+
+    def close(self):
+        '''Release worker threads and pooled connections.'''
+        self._executor.shutdown(wait=True)
+        self._session.close()
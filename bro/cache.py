@@ -0,0 +1,147 @@
+'''This module provides an on-disk cache of http responses.
+Cached responses are revalidated with conditional requests, so that unchanged
+resources cost a `304 Not Modified` instead of a full download.
+'''
+
+import sqlite3
+from collections import namedtuple
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import time
+from urllib.parse import urlencode
+
+from bro import DATA_DIR
+
+LOGGER = getLogger(__name__)
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class CachedResponse(
+        namedtuple('CachedResponse', 'etag last_modified content')):
+    @property
+    def validators(self):
+        '''Headers to make a conditional request with.'''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    '''LRU cache of responses with validators, capped by total body size.'''
+
+    def __init__(self, path=None, max_size=None):
+        self.path = Path(path or DATA_DIR / 'http-cache.sqlite')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size or DEFAULT_MAX_SIZE
+        self.hits = self.misses = self.evictions = 0
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(str(self.path),
+                                   check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content BLOB,
+                size INTEGER,
+                accessed REAL)''')
+
+    def __str__(self):
+        return 'ResponseCache:<{path}>'.format(path=self.path)
+
+    __repr__ = __str__
+
+    @staticmethod
+    def make_key(url, params=None, auth=None):
+        '''Key a response by its full url and the identity requesting it.'''
+        if params:
+            url = f'{url}?{urlencode(sorted(params.items()), doseq=True)}'
+        identity = sha256(repr(auth).encode()).hexdigest() if auth else ''
+        return sha256(f'{identity}\n{url}'.encode()).hexdigest()
+
+    @property
+    def size(self):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return row[0]
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, content FROM responses '
+                'WHERE key = ?', (key, )).fetchone()
+            if row:
+                self._db.execute(
+                    'UPDATE responses SET accessed = ? WHERE key = ?',
+                    (time(), key))
+        return CachedResponse(*row) if row else None
+
+    def set(self, key, resp):
+        '''Store a response if it carries any validator.'''
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        if len(resp.content) > self.max_size:
+            return
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, resp.content, len(
+                    resp.content), time()))
+            self._evict()
+
+    def update(self, key, entry, resp):
+        '''Fill a `304 Not Modified` response from its cache entry,
+        or cache the fresh response otherwise.
+        '''
+        if resp.status_code == 304 and entry:
+            # Let json() and text work on the revalidated body.
+            resp._content = entry.content
+            with self._lock:
+                self.hits += 1
+            LOGGER.debug('Cache hit: %s', resp.url)
+            return
+
+        with self._lock:
+            self.misses += 1
+        if resp.ok:
+            self.set(key, resp)
+
+    def _evict(self):
+        total = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        rows = self._db.execute(
+            'SELECT key, size FROM responses ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key, ))
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+
+    def close(self):
+        self._db.close()
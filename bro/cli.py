@@ -1,23 +1,37 @@
 '''This module contains cli functions.'''
 
+import json
+import sys
 from configparser import ConfigParser
+from functools import partial
 from pathlib import Path
-from webbrowser import open_new
+from time import time
 
 import click
 from click import argument, command, option
 
-from bro.git import GitRepo
-from bro.hub import create_pull_request, request_github_access_token
+from bro import DATA_DIR
+from bro.exceptions import BranchAlreadyExists
 from bro.utils import (error_handler, get_pr_msg, print_error, print_normal,
                        validate_branch)
 
+# Modules of git, github and output formatting are imported by the commands
+# using them, to keep startup fast for the others.
+
 CONFIG_FILE = Path.home() / '.config/bro'
+BATCH_JOURNAL_DIR = DATA_DIR / 'batch'
+PULLS_STORE = DATA_DIR / 'pulls.sqlite'
+STATS_CACHE = DATA_DIR / 'stats.sqlite'
+WORKSPACE_FILE = DATA_DIR / 'workspace'
 
 REMOTE_UPSTREAM = 'upstream'
 REMOTE_ORIGIN = 'origin'
 BRANCH_MAIN = 'master'
 
+# Repos and config kept across commands by the daemon, None while every
+# command starts cold.
+SHARED_STATE = None
+
 
 class AliasedGroup(click.Group):
 
@@ -33,12 +47,7 @@ class AliasedGroup(click.Group):
         return super().get_command(ctx, cmd_name)
 
 
-@command(cls=AliasedGroup)
-@option('-p', '--path', default='.')
-@click.pass_context
-@error_handler
-def bro(ctx, path):
-    '''Git workflow management tool.'''
+def load_config():
     config_parser = ConfigParser()
     if not CONFIG_FILE.exists():
         config_parser['git'] = {
@@ -47,50 +56,188 @@ def bro(ctx, path):
             'upstream_remote': REMOTE_UPSTREAM
         }
         config_parser['github'] = {}
+        CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
         with open(CONFIG_FILE, 'w') as f:
             config_parser.write(f)
     else:
         config_parser.read(CONFIG_FILE)
 
-    ctx.obj = {
-        'repo': GitRepo.from_path(path),
-        'config': {
-            'main_branch':
-            config_parser.get('git', 'main_branch', fallback=BRANCH_MAIN),
-            'origin_remote':
-            config_parser.get('git', 'origin_remote', fallback=REMOTE_ORIGIN),
-            'upstream_remote':
-            config_parser.get('git',
-                              'upstream_remote',
-                              fallback=REMOTE_UPSTREAM),
-            'username':
-            config_parser.get('github', 'username', fallback=''),
-            'access_token':
-            config_parser.get('github', 'access_token', fallback='')
-        }
+    if config_parser.getboolean('github', 'http_cache', fallback=False):
+        from bro.cache import ResponseCache
+        from bro.hub import GITHUB_API
+        GITHUB_API.cache = ResponseCache()
+
+    return {
+        'main_branch':
+        config_parser.get('git', 'main_branch', fallback=BRANCH_MAIN),
+        'origin_remote':
+        config_parser.get('git', 'origin_remote', fallback=REMOTE_ORIGIN),
+        'upstream_remote':
+        config_parser.get('git', 'upstream_remote', fallback=REMOTE_UPSTREAM),
+        'fetch': {
+            'depth':
+            config_parser.getint('git', 'fetch_depth', fallback=None),
+            'shallow_since':
+            config_parser.get('git', 'fetch_shallow_since', fallback=None),
+            'filter_spec':
+            config_parser.get('git', 'fetch_filter', fallback=None)
+        },
+        'username':
+        config_parser.get('github', 'username', fallback=''),
+        'access_token':
+        config_parser.get('github', 'access_token', fallback='')
+    }
+
+
+class LazyContext(dict):
+    '''Context object building `repo` and `config` on first access.
+    With shared state, they are reused across contexts, config until its
+    file changes.
+    '''
+
+    def __init__(self, path, shared=None):
+        super().__init__()
+        self.path = path
+        self.shared = shared
+
+    def _build(self, key):
+        if key == 'repo':
+            from bro.git import GitRepo
+            return GitRepo.from_path(self.path)
+        if key == 'config':
+            return load_config()
+        raise KeyError(key)
+
+    def _shared_key(self, key):
+        if key == 'repo':
+            return key, str(Path(self.path).absolute())
+        try:
+            return key, CONFIG_FILE.stat().st_mtime_ns
+        except FileNotFoundError:
+            return key, None
+
+    def __missing__(self, key):
+        if self.shared is None:
+            value = self._build(key)
+        else:
+            shared_key = self._shared_key(key)
+            value = self.shared.get(shared_key)
+            if value is None:
+                value = self._build(key)
+                # Loading config may write the file, key it afterwards.
+                self.shared[self._shared_key(key)] = value
+            if key == 'repo':
+                value.show_progress = sys.stderr.isatty()
+        self[key] = value
+        return value
+
+
+def write_profile(path, command_span):
+    from tabulate import tabulate
+
+    from bro import trace
+
+    command_span.__exit__(None, None, None)
+    tracer = trace.disable()
+    tracer.write(path)
+    click.echo(tabulate(tracer.summary(),
+                        headers=['operation', 'calls', 'total (ms)',
+                                 'max (ms)'],
+                        floatfmt='.1f'),
+               err=True)
+    click.echo(f'Trace of {len(tracer.events)} spans written to {path}.',
+               err=True)
+
+
+@command(cls=AliasedGroup)
+@option('-p', '--path', default='.')
+@option('--profile',
+        type=click.Path(dir_okay=False),
+        help='Write a chrome trace of the command to this file and show its '
+        'slowest operations.')
+@click.pass_context
+def bro(ctx, path, profile):
+    '''Git workflow management tool.'''
+    ctx.obj = LazyContext(path, SHARED_STATE)
+    if profile:
+        from bro import trace
+
+        trace.enable()
+        command_span = trace.span(f'bro {ctx.invoked_subcommand}')
+        command_span.__enter__()
+        ctx.call_on_close(partial(write_profile, profile, command_span))
+
+
+def fetch_options(func):
+    '''Options limiting what is fetched, defaults are taken from config.'''
+    for decorator in reversed([
+            option('--depth',
+                   type=click.IntRange(min=1),
+                   help='Fetch only this many commits of history.'),
+            option('--shallow-since',
+                   metavar='DATE',
+                   help='Fetch only commits after this date.'),
+            option('--filter',
+                   'filter_spec',
+                   metavar='FILTER',
+                   help='Leave out objects, like blob:none or tree:0, which '
+                   'are then fetched on demand.')
+    ]):
+        func = decorator(func)
+    return func
+
+
+def fetch_kwargs(config, **options):
+    '''Fetch options given on command line over those of config.'''
+    return {
+        key: options.get(key) or value
+        for key, value in config['fetch'].items()
     }
 
 
 @bro.command()
-@argument('branch')
+@argument('branches', nargs=-1, required=True, metavar='BRANCH[:SINCE]...')
 @option('-s',
         '--since',
         type=str,
         default='master',
-        help='Start point of the new branch, default master.')
+        help='Start point of branches without one, default master.')
+@fetch_options
 @click.pass_obj
 @error_handler
-def pickup(ctx, branch, since):
-    '''Start a new branch to work on.'''
+def pickup(ctx, branches, since, **options):
+    '''Start new branches to work on.'''
     repo, config = ctx['repo'], ctx['config']
-    validate_branch(repo, since)
-
-    repo.fetch(config['upstream_remote'], since)
-    remote_branch = f'{config["upstream_remote"]}/{since}'
-    print_normal(f'Fetched remote branch {remote_branch}.')
-
-    repo.branch_checkout(branch, create=True, start_point=remote_branch)
-    print_normal(f'Start branch {branch} from {remote_branch}.')
+    remote = config['upstream_remote']
+    pairs = []
+    for spec in branches:
+        branch, _, start_point = spec.partition(':')
+        pairs.append((branch, start_point or since))
+    start_points = list(dict.fromkeys(start for _, start in pairs))
+    validate_branch(repo, *start_points)
+    # Fail before creating any, rather than leave some created.
+    names = [branch for branch, _ in pairs]
+    existing = [
+        branch for i, branch in enumerate(names)
+        if repo.refs.has_branch(branch) or branch in names[:i]
+    ]
+    if existing:
+        raise BranchAlreadyExists(
+            f'Branch {", ".join(existing)} already exists.')
+
+    stats = repo.fetch(remote, *start_points,
+                       **fetch_kwargs(config, **options))
+    print_normal('Fetched remote branch ' +
+                 ', '.join(f'{remote}/{start}' for start in start_points) +
+                 f' ({stats.summary()}).')
+
+    for branch, start_point in pairs:
+        remote_branch = f'{remote}/{start_point}'
+        repo.branch_create(branch, start_point=remote_branch)
+        print_normal(f'Start branch {branch} from {remote_branch}.')
+
+    branch = pairs[0][0]
+    repo.branch_checkout(branch)
     print_normal(f'You are in branch {branch} now.')
 
 
@@ -137,12 +284,209 @@ def putout(ctx, branch, keep_remote):
             f'Deleted remote branch {config["origin_remote"]}/{branch}.')
 
 
+@bro.command()
+@option('-i',
+        '--into',
+        help='Branch to check merges into, default the main branch of '
+        'upstream.')
+@option('-k', '--keep-remote', is_flag=True, help='Keep remote branches.')
+@option('-n', '--dry-run', is_flag=True, help='Only show branches to delete.')
+@option('-y', '--yes', is_flag=True, help='Delete without confirmation.')
+@click.pass_obj
+@error_handler
+def sweep(ctx, into, keep_remote, dry_run, yes):
+    '''Delete all branches merged into the main branch.'''
+    repo, config = ctx['repo'], ctx['config']
+    upstream, origin = config['upstream_remote'], config['origin_remote']
+    main_branch = config['main_branch']
+    if not into:
+        repo.fetch(upstream, main_branch)
+        into = f'{upstream}/{main_branch}'
+    remotes = []
+    if not keep_remote:
+        # Prune first, a branch already gone would fail the push.
+        repo.fetch(origin, prune=True)
+        remotes.append(origin)
+
+    # The target is kept under its branch name too, on every remote.
+    into_branch = into
+    for prefix in ('refs/heads/', 'refs/remotes/'):
+        if into_branch.startswith(prefix):
+            into_branch = into_branch[len(prefix):]
+    remote, _, branch = into_branch.partition('/')
+    if branch and remote in repo.refs.remotes:
+        into_branch = branch
+    protected = {main_branch, into, into_branch}
+    if not repo.repo.head.is_detached:
+        protected.add(repo.current_branch.name)
+    merged, merged_remote = repo.merged_branches(into, *remotes)
+    branches = [branch for branch in merged if branch not in protected]
+    remote_branches = [
+        branch for _, branch in merged_remote if branch not in protected
+    ]
+    if not branches and not remote_branches:
+        print_normal(f'No branches merged into {into}.')
+        return
+
+    print_normal(f'Branches merged into {into}:')
+    for branch in branches:
+        click.echo(f'  {branch}')
+    for branch in remote_branches:
+        click.echo(f'  {origin}/{branch}')
+    if dry_run:
+        return
+    if not yes:
+        click.confirm(
+            f'Delete {len(branches)} local and {len(remote_branches)} '
+            'remote branches?',
+            abort=True)
+
+    if branches:
+        # Merged into the target, even if not into the current branch.
+        repo.branch_delete(*branches, force=True)
+        print_normal(f'Deleted {len(branches)} local branches.')
+    if remote_branches:
+        repo.push_delete(origin, *remote_branches)
+        print_normal(f'Deleted {len(remote_branches)} branches of {origin}.')
+
+
+@bro.command(name='status')
+@click.pass_obj
+@error_handler
+def status_(ctx):
+    '''Show how far local branches are ahead of and behind their upstreams
+    and the main branch, as of the last fetch.
+    '''
+    from tabulate import tabulate
+
+    from bro.stats import StatsCache, ahead_behind
+
+    repo, config = ctx['repo'], ctx['config']
+    main = f'{config["upstream_remote"]}/{config["main_branch"]}'
+    main_sha = repo.resolve(f'refs/remotes/{main}')
+    refs = repo.refs.refs
+    branches = [(branch, sha, upstream, upstream and refs.get(upstream),
+                 current)
+                for branch, sha, upstream, current in repo.branch_upstreams()]
+
+    pairs = [(sha, main_sha) for _, sha, _, _, _ in branches]
+    pairs.extend((sha, upstream_sha)
+                 for _, sha, _, upstream_sha, _ in branches if upstream_sha)
+    cache = StatsCache(STATS_CACHE)
+    counts = ahead_behind(repo, pairs, cache)
+    cache.close()
+
+    def drift(sha, other):
+        ahead, behind = counts[sha, other]
+        return f'+{ahead} -{behind}'
+
+    rows = []
+    for branch, sha, upstream, upstream_sha, current in branches:
+        if not upstream:
+            tracking = ''
+        elif not upstream_sha:
+            tracking = 'gone'
+        else:
+            tracking = drift(sha, upstream_sha)
+        short = upstream and upstream.split('/', 2)[-1]
+        rows.append(['*' if current else '', branch, short or '', tracking,
+                     drift(sha, main_sha)])
+    click.echo(
+        tabulate(rows, headers=['', 'branch', 'upstream', 'vs upstream',
+                                f'vs {main}']))
+
+
+@bro.group()
+@option('-m',
+        '--manifest',
+        type=click.Path(exists=True, dir_okay=False),
+        default=str(WORKSPACE_FILE),
+        show_default=True,
+        help='File listing one repo path per line.')
+@option('-w', '--workers', type=int, help='Number of repos run at once.')
+@click.pass_obj
+def workspace(ctx, manifest, workers):
+    '''Run workflows across all repos of a workspace.'''
+    from bro.workspace import read_manifest
+
+    ctx['workspace'] = {
+        'paths': read_manifest(manifest),
+        'workers': workers,
+    }
+
+
+def run_workspace(ctx, task, *args):
+    from tabulate import tabulate
+
+    from bro.workspace import run
+
+    paths, config = ctx['workspace']['paths'], ctx['config']
+    rows, failed = [], 0
+    with click.progressbar(run(task,
+                               paths,
+                               config,
+                               *args,
+                               workers=ctx['workspace']['workers']),
+                           length=len(paths),
+                           label=f'Running {task}') as results:
+        for result in results:
+            failed += not result.ok
+            rows.append([
+                result.path, 'ok' if result.ok else 'failed',
+                f'{result.elapsed:.1f}s', result.message
+            ])
+
+    click.echo(tabulate(sorted(rows),
+                        headers=['repo', 'status', 'time', 'message']))
+    if failed:
+        print_error(f'{failed} of {len(paths)} repos failed.')
+        sys.exit(1)
+    else:
+        print_normal(f'All {len(paths)} repos done.')
+
+
+@workspace.command(name='pickup')
+@argument('branch')
+@option('-s',
+        '--since',
+        type=str,
+        default='master',
+        help='Start point of the new branch, default master.')
+@click.pass_obj
+def workspace_pickup(ctx, branch, since):
+    '''Start a new branch in every repo.'''
+    run_workspace(ctx, 'pickup', branch, since)
+
+
+@workspace.command(name='pipeline')
+@option('-t',
+        '--through',
+        default='master',
+        help='Remote branch to sync from.')
+@option('-m', '--merge', is_flag=True, help='Merge instead of rebase.')
+@click.pass_obj
+def workspace_pipeline(ctx, through, merge):
+    '''Sync every repo with certain remote branch.'''
+    run_workspace(ctx, 'pipeline', through, merge)
+
+
+@workspace.command(name='putout')
+@argument('branch')
+@option('-k', '--keep-remote', is_flag=True, help='Keep remote branch.')
+@click.pass_obj
+def workspace_putout(ctx, branch, keep_remote):
+    '''End the branch in every repo.'''
+    run_workspace(ctx, 'putout', branch, keep_remote)
+
+
 @bro.group()
 @click.pass_obj
 def pull_request(ctx):
     '''Manage pull requests of github.'''
     config = ctx['config']
     if not config['username'] or not config['access_token']:
+        from bro.hub import request_github_access_token
+
         username = click.prompt('Please enter github username', type=str)
         password = click.prompt('Please enter github password',
                                 hide_input=True,
@@ -172,8 +516,13 @@ def pull_request(ctx):
 @option('-b', '--base', default='master')
 @option('-o', '--open-browser', is_flag=True, help='Display pr on browser.')
 @click.pass_obj
+@error_handler
 def make(ctx, owner, base, open_browser):
     '''Create a pull request.'''
+    from webbrowser import open_new
+
+    from bro.hub import create_pull_request
+
     repo, config = ctx['repo'], ctx['config']
     # Push to remote first.
     repo.push(config['origin_remote'], repo.current_branch)
@@ -199,19 +548,470 @@ def make(ctx, owner, base, open_browser):
             print_error('Unable to find valid url for new pull request.')
 
 
+def parse_pull_requests(specs):
+    '''Pairs of pull request id and branch from `PR_ID[:BRANCH]` specs,
+    branches default to `pr-PR_ID`.
+    '''
+    # The form `PR_ID BRANCH` of a single pull request is still accepted.
+    if len(specs) == 2 and not specs[1].partition(':')[0].isdigit():
+        specs = [f'{specs[0]}:{specs[1]}']
+    pairs = []
+    for spec in specs:
+        pr_id, _, branch = spec.partition(':')
+        if not pr_id.isdigit():
+            raise click.BadParameter(f'{spec} is not a pull request id.',
+                                     param_hint='PR_ID[:BRANCH]')
+        pairs.append((pr_id, branch or f'pr-{pr_id}'))
+    return pairs
+
+
 @pull_request.command()
-@argument('pr_id')
-@argument('branch')
-@option('-c', '--checkout', is_flag=True, help='Checkout to the pr branch.')
+@argument('specs', nargs=-1, required=True, metavar='PR_ID[:BRANCH]...')
+@option('-c',
+        '--checkout',
+        is_flag=True,
+        help='Checkout to the branch of the first pr.')
+@option('-w',
+        '--worktree',
+        is_flag=True,
+        help='Check out every pr into its own worktree, reused next time.')
+@option('--worktree-dir',
+        type=click.Path(file_okay=False),
+        help='Directory of pr worktrees, default REPO-worktrees next to the '
+        'repo.')
+@fetch_options
 @click.pass_obj
-def get(ctx, pr_id, branch, checkout):
-    '''Pull a pull request to local.'''
+@error_handler
+def get(ctx, specs, checkout, worktree, worktree_dir, **options):
+    '''Pull pull requests to local, all in one fetch.'''
+    pairs = parse_pull_requests(specs)
     repo, config = ctx['repo'], ctx['config']
+    remote = config['upstream_remote']
+    options = fetch_kwargs(config, **options)
+    names = ', '.join(f'{remote}/{pr_id}' for pr_id, _ in pairs)
+
+    if not worktree:
+        stats = repo.fetch_pull_requests(remote, pairs, **options)
+        for pr_id, branch in pairs:
+            print_normal(f'Pulled pr {remote}/{pr_id} to local branch '
+                         f'{branch}.')
+        print_normal(f'Fetched {names} ({stats.summary()}).')
+        if checkout:
+            branch = pairs[0][1]
+            repo.branch_checkout(branch)
+            print_normal(f'You are in branch {branch} now.')
+        return
+
+    # Heads go to remote-tracking refs, as fetching into branches checked
+    # out in worktrees is refused.
+    heads = [(pr_id, f'refs/remotes/{remote}/pull/{pr_id}')
+             for pr_id, _ in pairs]
+    stats = repo.fetch_pull_requests(remote, heads, force=True, **options)
+    print_normal(f'Fetched {names} ({stats.summary()}).')
+
+    worktree_dir = Path(worktree_dir or
+                        repo.path.parent / f'{repo.name}-worktrees')
+    worktrees = [(worktree_dir / branch, branch, head)
+                 for (_, branch), (_, head) in zip(pairs, heads)]
+    errors = repo.worktrees_checkout(worktrees)
+    for (path, branch, _), error in zip(worktrees, errors):
+        if error:
+            print_error(error.message)
+        else:
+            print_normal(f'Checked out {branch} at {path}.')
+    if any(errors):
+        sys.exit(1)
+
 
+@pull_request.command()
+@argument('pr_ids', nargs=-1, required=True, type=int, metavar='PR_ID...')
+@option('-b', '--base', help='Base branch, default the main branch.')
+@option('-d',
+        '--dirs',
+        type=int,
+        default=0,
+        help='Break changes down by directories this many levels deep.')
+@option('--fetch',
+        'refresh',
+        is_flag=True,
+        help='Fetch base and prs even if they were fetched before.')
+@option('-f',
+        '--format',
+        'fmt',
+        type=click.Choice(['table', 'jsonl']),
+        default='table',
+        help='Output rows or json lines.')
+@click.pass_obj
+@error_handler
+def stats(ctx, pr_ids, base, dirs, refresh, fmt):
+    '''Show commits and changes of pull requests from local objects.
+    Only prs and a base not fetched yet are fetched, and stats of the same
+    base and head are computed once.
+    '''
+    from tabulate import tabulate
+
+    from bro.stats import StatsCache, diff_stats
+
+    repo, config = ctx['repo'], ctx['config']
     remote = config['upstream_remote']
-    repo.fetch_pull_request(remote, pr_id, branch)
-    print_normal(f'Pulled pr {remote}/{pr_id} to local branch {branch}.')
+    base = base or config['main_branch']
+    base_ref = f'refs/remotes/{remote}/{base}'
+    heads = [(pr_id, f'refs/remotes/{remote}/pull/{pr_id}')
+             for pr_id in pr_ids]
+
+    missing = [(pr_id, ref) for pr_id, ref in heads
+               if refresh or ref not in repo.refs]
+    if missing:
+        repo.fetch_pull_requests(remote, missing, force=True)
+    if refresh or base_ref not in repo.refs:
+        repo.fetch(remote, base)
+
+    cache = StatsCache(STATS_CACHE)
+    rows = []
+    for pr_id, ref in heads:
+        base_sha, head_sha, pr_stats = diff_stats(repo, base_ref, ref, cache)
+        directories = pr_stats.directories(dirs) if dirs else []
+        if fmt == 'jsonl':
+            click.echo(
+                json.dumps({
+                    'number': pr_id,
+                    'base': base_sha,
+                    'head': head_sha,
+                    'commits': pr_stats.commits,
+                    'additions': pr_stats.additions,
+                    'deletions': pr_stats.deletions,
+                    'changed_files': pr_stats.changed_files,
+                    'directories': {
+                        directory: dict(zip(
+                            ('additions', 'deletions', 'changed_files'),
+                            totals))
+                        for directory, totals in directories
+                    }
+                }))
+            continue
+        rows.append([
+            f'#{pr_id}', '', pr_stats.commits, pr_stats.changed_files,
+            f'+{pr_stats.additions}', f'-{pr_stats.deletions}'
+        ])
+        rows.extend(
+            ['', directory, '', files, f'+{additions}', f'-{deletions}']
+            for directory, (additions, deletions, files) in directories)
+    cache.close()
+
+    if fmt == 'table':
+        headers = ['pr', 'directory', 'commits', 'files', 'additions',
+                   'deletions']
+        if not dirs:
+            rows = [row[:1] + row[2:] for row in rows]
+            headers.remove('directory')
+        click.echo(tabulate(rows, headers=headers))
+
+
+@pull_request.command(name='list')
+@argument('owner')
+@option('-s',
+        '--state',
+        type=click.Choice(['open', 'closed', 'all']),
+        default='open')
+@option('-b', '--base', help='Filter by base branch.')
+@option('-h', '--head', help='Filter by head in the format of user:branch.')
+@option('-f',
+        '--format',
+        'fmt',
+        type=click.Choice(['table', 'jsonl']),
+        default='table',
+        help='Output rows or json lines.')
+@click.pass_obj
+@error_handler
+def list_(ctx, owner, state, base, head, fmt):
+    '''List pull requests, streaming as pages arrive.'''
+    from bro.hub import list_pull_requests
+
+    repo, config = ctx['repo'], ctx['config']
+    auth = (config['username'], config['access_token'])
+
+    for pr in list_pull_requests(owner,
+                                 repo.name,
+                                 auth,
+                                 state=state,
+                                 base=base,
+                                 head=head):
+        if fmt == 'jsonl':
+            click.echo(json.dumps(dict(pr.meta, title=pr.content['title'])))
+        else:
+            meta = pr.meta
+            click.echo(f'#{meta["number"]:<7} {meta["state"]:<7} '
+                       f'{meta["head"]} -> {meta["base"]}  '
+                       f'{pr.content["title"]}')
+
+
+@pull_request.command()
+@argument('owner')
+@argument('pr_id')
+@option('-o', '--output', type=click.Path(), help='Save diff to a file.')
+@option('--stat', is_flag=True, help='Show changes per file only.')
+@click.pass_obj
+@error_handler
+def diff(ctx, owner, pr_id, output, stat):
+    '''Stream the diff of a pull request.'''
+    from bro.diff import FileDiff, iter_lines, parse_diff
+    from bro.hub import download_pull_request_diff, iter_pull_request_diff
+
+    repo = ctx['repo']
+    if output:
+        size = download_pull_request_diff(owner, repo.name, pr_id, output)
+        print_normal(f'Saved diff of pr {pr_id} to {output} ({size} bytes).')
+        return
+
+    chunks = iter_pull_request_diff(owner, repo.name, pr_id)
+    if not stat:
+        stdout = click.get_binary_stream('stdout')
+        for chunk in chunks:
+            stdout.write(chunk)
+        return
+
+    for record in parse_diff(iter_lines(chunks)):
+        if isinstance(record, FileDiff):
+            path = record.new_path or record.old_path
+            click.echo(f'{record.status:<9} +{record.additions:<6} '
+                       f'-{record.deletions:<6} {path}')
+
+
+@pull_request.command()
+@argument('owner')
+@argument('action', type=click.Choice(['close', 'comment', 'merge']))
+@argument('numbers', nargs=-1, type=int)
+@option('-m', '--message', help='Comment, or commit message of merge.')
+@option('-b', '--base', help='Select open pull requests by base branch.')
+@option('-h', '--head', help='Select open pull requests by head.')
+@option('-w', '--workers', default=8, help='Number of concurrent calls.')
+@option('-r',
+        '--resume',
+        is_flag=True,
+        help='Skip pull requests done by the last partial run.')
+@click.pass_obj
+@error_handler
+def batch(ctx, owner, action, numbers, message, base, head, workers, resume):
+    '''Merge, comment or close many pull requests at once.'''
+    from tabulate import tabulate
+
+    from bro.hub import batch_pull_requests, list_pull_requests
+
+    repo, config = ctx['repo'], ctx['config']
+    auth = (config['username'], config['access_token'])
+
+    payload = {}
+    if action == 'comment':
+        if not message:
+            print_error('A --message is needed to comment.')
+            sys.exit(1)
+        payload['comment'] = message
+    elif action == 'merge' and message:
+        payload['commit_message'] = message
+
+    if not numbers:
+        if not base and not head:
+            print_error('Give pull request numbers, or --base/--head.')
+            sys.exit(1)
+        numbers = [
+            int(pr.number) for pr in list_pull_requests(
+                owner, repo.name, auth, base=base, head=head)
+        ]
+
+    journal = BATCH_JOURNAL_DIR / f'{owner}-{repo.name}-{action}'
+    done = set()
+    if resume and journal.exists():
+        done = {int(number) for number in journal.read_text().split()}
+    todo = [number for number in numbers if number not in done]
+    if done:
+        print_normal(f'Skipped {len(numbers) - len(todo)} done before.')
+
+    BATCH_JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+    rows, failed = [], 0
+    with open(journal, 'a' if resume else 'w') as f:
+        for result in batch_pull_requests(owner,
+                                          repo.name,
+                                          auth,
+                                          action,
+                                          todo,
+                                          workers=workers,
+                                          **payload):
+            if result.ok:
+                f.write(f'{result.number}\n')
+                f.flush()
+                print_normal(f'#{result.number} {action} done.')
+            else:
+                failed += 1
+                print_error(f'#{result.number} {action} failed.')
+            rows.append([
+                result.number, 'ok' if result.ok else 'failed',
+                '' if result.ok else result.result
+            ])
+
+    click.echo(tabulate(sorted(rows, key=lambda row: row[0]),
+                        headers=['pr', 'status', 'error']))
+    if failed:
+        print_error(f'{failed} of {len(todo)} failed, '
+                    'rerun with --resume to retry them.')
+        sys.exit(1)
+    journal.unlink()
+
+
+def start_background_sync(path, owner):
+    '''Sync pull requests in a detached process, which outlives this one.'''
+    from subprocess import DEVNULL, Popen
+
+    Popen([
+        sys.executable, '-c', 'from bro.cli import bro; bro()', '--path',
+        path, 'pull-request', 'sync', owner
+    ],
+          stdin=DEVNULL,
+          stdout=DEVNULL,
+          stderr=DEVNULL,
+          start_new_session=True)
+
+
+@pull_request.command()
+@argument('owner')
+@option('-b',
+        '--background',
+        is_flag=True,
+        help='Sync in a background process.')
+@click.pass_obj
+@error_handler
+def sync(ctx, owner, background):
+    '''Sync pull requests updated since last time to the local store.'''
+    from bro.store import PullRequestStore, sync as sync_store
 
-    if checkout:
-        repo.branch_checkout(branch)
-        print_normal(f'You are in branch {branch} now.')
+    if background:
+        start_background_sync(ctx.path, owner)
+        print_normal('Started syncing pull requests in background.')
+        return
+
+    config = ctx['config']
+    repo_name = Path(ctx.path).absolute().name
+    count = sync_store(PullRequestStore(PULLS_STORE), owner, repo_name,
+                       (config['username'], config['access_token']))
+    print_normal(f'Synced {count} pull requests of {owner}/{repo_name}.')
+
+
+@pull_request.command()
+@argument('owner')
+@option('-s',
+        '--sync',
+        'sync_after',
+        is_flag=True,
+        help='Sync in background after showing the status.')
+@click.pass_obj
+@error_handler
+def status(ctx, owner, sync_after):
+    '''Show my pull requests and review requests from the local store.'''
+    from tabulate import tabulate
+
+    from bro.store import PullRequestStore, sync as sync_store
+
+    config = ctx['config']
+    login = config['username']
+    repo_name = Path(ctx.path).absolute().name
+    store = PullRequestStore(PULLS_STORE)
+    _, synced_at = store.last_sync(owner, repo_name)
+    if synced_at is None:
+        print_normal('Syncing pull requests for the first time.')
+        sync_store(store, owner, repo_name, (login, config['access_token']))
+        _, synced_at = store.last_sync(owner, repo_name)
+        sync_after = False
+
+    mergeable = {True: 'yes', False: 'conflicts', None: 'unknown'}
+    print_normal('My pull requests:')
+    click.echo(
+        tabulate([[
+            pr.number, pr.title, pr.base['label'], mergeable[pr.mergeable],
+            pr.updated_at
+        ] for pr in store.authored(owner, repo_name, login)],
+                 headers=['pr', 'title', 'base', 'mergeable', 'updated']))
+    print_normal('Review requests:')
+    click.echo(
+        tabulate([[pr.number, pr.title, pr.user['login'], pr.updated_at]
+                  for pr in store.review_requests(owner, repo_name, login)],
+                 headers=['pr', 'title', 'author', 'updated']))
+    click.echo(f'Synced {int(time() - synced_at) // 60} minutes ago.')
+
+    if sync_after:
+        start_background_sync(ctx.path, owner)
+
+
+@bro.group()
+def daemon():
+    '''Run commands in a background process keeping repos, connections
+    and caches warm.
+    '''
+
+
+@daemon.command(name='start')
+@option('-f',
+        '--foreground',
+        is_flag=True,
+        help='Serve in this process until stopped.')
+@option('--idle-timeout',
+        type=int,
+        default=30 * 60,
+        show_default=True,
+        help='Seconds without commands before the daemon exits.')
+def daemon_start(foreground, idle_timeout):
+    '''Start the daemon.'''
+    from subprocess import DEVNULL, Popen
+    from time import sleep
+
+    from bro.daemon import SOCKET_PATH, request, serve
+
+    if request({'ping': True}):
+        print_normal('Daemon is already running.')
+        return
+    if foreground:
+        serve(idle_timeout=idle_timeout)
+        return
+
+    Popen([
+        sys.executable, '-c', 'from bro.cli import bro; bro()', 'daemon',
+        'start', '--foreground', '--idle-timeout',
+        str(idle_timeout)
+    ],
+          stdin=DEVNULL,
+          stdout=DEVNULL,
+          stderr=DEVNULL,
+          start_new_session=True)
+    for _ in range(50):
+        status = request({'ping': True})
+        if status:
+            print_normal(f'Daemon {status["pid"]} serving at {SOCKET_PATH}.')
+            return
+        sleep(0.1)
+    print_error('Daemon did not start in 5 seconds.')
+    sys.exit(1)
+
+
+@daemon.command(name='stop')
+def daemon_stop():
+    '''Stop the daemon.'''
+    from bro.daemon import request
+
+    if request({'stop': True}):
+        print_normal('Daemon stopped.')
+    else:
+        print_normal('Daemon is not running.')
+
+
+@daemon.command(name='status')
+def daemon_status():
+    '''Show whether the daemon is running and its warm repos.'''
+    from bro.daemon import request
+
+    status = request({'ping': True})
+    if not status:
+        print_normal('Daemon is not running.')
+        return
+    uptime = int(time() - status['started'])
+    print_normal(f'Daemon {status["pid"]} up for {uptime}s, served '
+                 f'{status["served"]} commands.')
+    for path in status['repos']:
+        click.echo(f'  {path}')
@@ -0,0 +1,347 @@
+'''This module runs commands in a long lived background process.
+The daemon keeps repos, config, http connections and caches of earlier
+commands, and serves one command at a time over a unix socket. The `bro`
+script hands commands to it when it is running and runs them in process
+otherwise, so it only imports the standard library until then.
+'''
+
+import io
+import json
+import os
+import socket
+import sys
+from logging import getLogger
+from pathlib import Path
+from time import time
+
+from bro import DATA_DIR
+
+LOGGER = getLogger(__name__)
+SOCKET_PATH = DATA_DIR / 'daemon.sock'
+IDLE_TIMEOUT = 30 * 60
+NO_DAEMON_ENV = 'BRO_NO_DAEMON'
+
+# Options of the bro group taking a value, skipped to find the command.
+GROUP_OPTIONS = ('-p', '--path', '--profile')
+
+
+class Channel:
+    '''Frames over a connection, each a json header line optionally followed
+    by `size` bytes of data.
+    '''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, header, data=b''):
+        if data:
+            header = dict(header, size=len(data))
+        self.writer.write(json.dumps(header).encode() + b'\n' + data)
+        self.writer.flush()
+
+    def receive(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed.')
+        header = json.loads(line)
+        return header, self.reader.read(header.get('size', 0))
+
+
+class RemoteBuffer(io.RawIOBase):
+    '''Binary stream writing to stdout or stderr of the client.'''
+
+    def __init__(self, channel, fd):
+        self.channel = channel
+        self.fd = fd
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            self.channel.send({'fd': self.fd}, bytes(data))
+        return len(data)
+
+
+class RemoteOutput(io.TextIOBase):
+    '''Text stream writing to stdout or stderr of the client.'''
+
+    encoding = 'utf-8'
+    errors = 'replace'
+
+    def __init__(self, channel, fd, tty):
+        self.buffer = RemoteBuffer(channel, fd)
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.buffer.write(text.encode(self.encoding, self.errors))
+        return len(text)
+
+
+class RemoteInput(io.TextIOBase):
+    '''Text stream reading lines from stdin of the client on demand.'''
+
+    encoding = 'utf-8'
+    errors = 'replace'
+
+    def __init__(self, channel, tty):
+        self.channel = channel
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+    def readable(self):
+        return True
+
+    def readline(self, size=-1):
+        self.channel.send({'input': True})
+        _, data = self.channel.receive()
+        return data.decode(self.encoding, self.errors)
+
+    def read(self, size=-1):
+        return self.readline(size)
+
+
+def command_words(argv):
+    '''First two words of the command in argv, like `pull-request make`.'''
+    from bro.cli import AliasedGroup
+
+    words, args = [], iter(argv)
+    for arg in args:
+        if arg in GROUP_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            words.append(AliasedGroup.ALIAS.get(arg, arg))
+            if len(words) == 2:
+                break
+    return words
+
+
+def needs_terminal(argv, config):
+    '''Whether a command uses the terminal beyond reading lines, like an
+    editor or a password prompt, and must run in the client.
+    '''
+    words = command_words(argv)
+    if words[:1] == ['daemon'] or words == ['pull-request', 'make']:
+        return True
+    return (words[:1] == ['pull-request'] and '--help' not in argv
+            and not (config['username'] and config['access_token']))
+
+
+class Daemon:
+    '''State of the daemon process and the command runner.'''
+
+    def __init__(self):
+        from bro import cli
+
+        cli.SHARED_STATE = self.shared = {}
+        self.started = time()
+        self.served = 0
+        self.stopping = False
+
+    def __str__(self):
+        return 'Daemon:<{pid}>'.format(pid=os.getpid())
+
+    __repr__ = __str__
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'started': self.started,
+            'served': self.served,
+            'repos': sorted(path for key, path in self.shared
+                            if key == 'repo')
+        }
+
+    def handle(self, channel):
+        header, _ = channel.receive()
+        if header.get('stop'):
+            self.stopping = True
+            channel.send({'exit': 0})
+        elif header.get('ping'):
+            channel.send(self.status())
+        elif needs_terminal(header['argv'], self.config()):
+            channel.send({'local': True})
+        else:
+            self.served += 1
+            channel.send({'exit': self.run(channel, **header)})
+
+    def config(self):
+        from bro.cli import LazyContext
+
+        return LazyContext('.', self.shared)['config']
+
+    def run(self, channel, argv, cwd, tty, env=None):
+        '''Run a command in the working directory of the client with its
+        standard streams and environment. Git and every other process the
+        command starts get the agent, credentials and `GIT_*` settings of
+        the client, not those the daemon started with.
+        Return:
+            Exit code of the command.
+        '''
+        from bro.cli import bro
+
+        saved = sys.stdin, sys.stdout, sys.stderr, os.getcwd()
+        saved_env = dict(os.environ)
+        sys.stdin = RemoteInput(channel, tty[0])
+        sys.stdout = RemoteOutput(channel, 1, tty[1])
+        sys.stderr = RemoteOutput(channel, 2, tty[2])
+        try:
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(env)
+            os.chdir(cwd)
+            bro.main(args=argv, prog_name='bro')
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(
+                e.code is not None)
+        except ConnectionError:
+            raise
+        except Exception:
+            import traceback
+
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdin, sys.stdout, sys.stderr, cwd = saved
+            os.environ.clear()
+            os.environ.update(saved_env)
+            os.chdir(cwd)
+        return code
+
+
+def _connect(path=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path or SOCKET_PATH))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def request(header, path=None):
+    '''Send a single request to the daemon.
+    Return:
+        Header of the reply, or None if the daemon is not running.
+    '''
+    sock = _connect(path)
+    if sock is None:
+        return None
+    with sock, sock.makefile('rb') as reader, sock.makefile('wb') as writer:
+        channel = Channel(reader, writer)
+        try:
+            channel.send(header)
+            return channel.receive()[0]
+        except (ConnectionError, ValueError):
+            return None
+
+
+def run_in_daemon(argv, path=None):
+    '''Run a command in the daemon, relaying standard streams.
+    Return:
+        Exit code of the command, or None if the daemon is not running or
+        the command has to run in process.
+    '''
+    if os.environ.get(NO_DAEMON_ENV):
+        return None
+    sock = _connect(path)
+    if sock is None:
+        return None
+
+    stdin, outputs = sys.stdin, {1: sys.stdout, 2: sys.stderr}
+    relayed = False
+    with sock, sock.makefile('rb') as reader, sock.makefile('wb') as writer:
+        channel = Channel(reader, writer)
+        try:
+            channel.send({
+                'argv': argv,
+                'cwd': os.getcwd(),
+                'env': dict(os.environ),
+                'tty': [stdin.isatty(), outputs[1].isatty(),
+                        outputs[2].isatty()]
+            })
+            while True:
+                header, data = channel.receive()
+                if 'local' in header:
+                    return None
+                if 'exit' in header:
+                    return header['exit']
+                relayed = True
+                if 'input' in header:
+                    channel.send({}, stdin.readline().encode())
+                    continue
+                stream = outputs[header['fd']]
+                stream.flush()
+                stream.buffer.write(data)
+                stream.buffer.flush()
+        except (ConnectionError, ValueError):
+            if not relayed:
+                return None
+            sys.stderr.write('Lost connection to bro daemon.\n')
+            return 1
+
+
+def serve(path=None, idle_timeout=IDLE_TIMEOUT):
+    '''Serve commands until stopped or idle for idle_timeout seconds.'''
+    from socketserver import StreamRequestHandler, UnixStreamServer
+
+    path = Path(path or SOCKET_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if request({'ping': True}, path):
+        raise RuntimeError(f'Daemon is already running at {path}.')
+    if path.exists():
+        path.unlink()
+
+    daemon = Daemon()
+    # Warm up modules of git, github and output formatting.
+    import bro.git  # noqa
+    import bro.hub  # noqa
+    import tabulate  # noqa
+
+    class Handler(StreamRequestHandler):
+        def handle(self):
+            try:
+                daemon.handle(Channel(self.rfile, self.wfile))
+            except (ConnectionError, ValueError) as e:
+                LOGGER.warning(f'Dropped a request: {e!r}')
+
+    umask = os.umask(0o077)
+    try:
+        server = UnixStreamServer(str(path), Handler)
+    finally:
+        os.umask(umask)
+
+    def stop_when_idle():
+        LOGGER.info(f'Daemon stopped after {idle_timeout}s idle.')
+        daemon.stopping = True
+
+    server.timeout = idle_timeout
+    server.handle_timeout = stop_when_idle
+    LOGGER.info(f'Daemon {os.getpid()} serving at {path}.')
+    try:
+        while not daemon.stopping:
+            server.handle_request()
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+    return daemon
+
+
+def main():
+    '''Entry point of the bro script.'''
+    code = run_in_daemon(sys.argv[1:])
+    if code is None:
+        from bro.cli import bro
+
+        bro()
+    sys.exit(code)
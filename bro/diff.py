@@ -0,0 +1,118 @@
+'''This module parses unified diffs incrementally.
+Records are emitted as soon as they are complete and hunk bodies are never
+kept, so diffs of any size can be inspected in bounded memory.
+'''
+
+import re
+from collections import namedtuple
+
+HUNK_HEADER = re.compile(
+    r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$')
+
+FileDiff = namedtuple(
+    'FileDiff', 'old_path new_path status additions deletions hunks')
+Hunk = namedtuple(
+    'Hunk', 'path old_start old_lines new_start new_lines section '
+    'additions deletions')
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    '''Split chunks of bytes into decoded lines without line endings.'''
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line.decode(encoding, errors='replace')
+    if pending:
+        yield pending.decode(encoding, errors='replace')
+
+
+def _strip_prefix(path):
+    if path == '/dev/null':
+        return None
+    return path[2:] if path[:2] in ('a/', 'b/') else path
+
+
+class _FileState:
+    def __init__(self, header):
+        old_path, _, new_path = header[len('diff --git '):].partition(' b/')
+        self.old_path = _strip_prefix(old_path)
+        self.new_path = new_path
+        self.status = 'modified'
+        self.additions = self.deletions = self.hunks = 0
+
+    def record(self):
+        return FileDiff(self.old_path, self.new_path, self.status,
+                        self.additions, self.deletions, self.hunks)
+
+
+def parse_diff(lines):
+    '''Yield a Hunk for every hunk and a FileDiff after the last hunk
+    of every file, from lines of a unified git diff.
+    '''
+    current = hunk = None
+    old_left = new_left = 0
+
+    for line in lines:
+        if hunk and (old_left > 0 or new_left > 0):
+            tag = line[:1]
+            if tag == '+':
+                hunk['additions'] += 1
+                new_left -= 1
+            elif tag == '-':
+                hunk['deletions'] += 1
+                old_left -= 1
+            elif tag in (' ', ''):
+                old_left -= 1
+                new_left -= 1
+            if old_left <= 0 and new_left <= 0:
+                current.additions += hunk['additions']
+                current.deletions += hunk['deletions']
+                yield Hunk(**hunk)
+                hunk = None
+            continue
+
+        if line.startswith('diff --git '):
+            if current:
+                yield current.record()
+            current, hunk = _FileState(line), None
+        elif current is None or line.startswith('\\'):
+            continue
+        elif line.startswith('@@'):
+            match = HUNK_HEADER.match(line)
+            if not match:
+                continue
+            old_start, old_lines, new_start, new_lines, section = (
+                match.groups())
+            old_left = 1 if old_lines is None else int(old_lines)
+            new_left = 1 if new_lines is None else int(new_lines)
+            current.hunks += 1
+            hunk = {
+                'path': current.new_path or current.old_path,
+                'old_start': int(old_start),
+                'old_lines': old_left,
+                'new_start': int(new_start),
+                'new_lines': new_left,
+                'section': section,
+                'additions': 0,
+                'deletions': 0
+            }
+        elif line.startswith('new file mode'):
+            current.status, current.old_path = 'added', None
+        elif line.startswith('deleted file mode'):
+            current.status, current.new_path = 'deleted', None
+        elif line.startswith('rename from '):
+            current.status = 'renamed'
+            current.old_path = line[len('rename from '):]
+        elif line.startswith('rename to '):
+            current.new_path = line[len('rename to '):]
+        elif line.startswith('Binary files '):
+            current.status = 'binary'
+        elif line.startswith('--- '):
+            current.old_path = _strip_prefix(line[4:])
+        elif line.startswith('+++ '):
+            current.new_path = _strip_prefix(line[4:])
+
+    if current:
+        yield current.record()
@@ -29,5 +29,11 @@ class GitCmdError(GitError):
         self.command = command
 
 
+class MergeConflict(GitError):
+    def __init__(self, message, paths):
+        super().__init__(message)
+        self.paths = paths
+
+
 class GithubError(Exception):
     pass
@@ -1,22 +1,25 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 from pathlib import Path
 
-from git import RemoteProgress, Repo
-from git.exc import GitCommandError, InvalidGitRepositoryError
+from git import Commit, Head, Remote, Repo, Tree
+from git.cmd import Git, handle_process_output
+from git.exc import (GitCommandError, InvalidGitRepositoryError,
+                     NoSuchPathError)
 from git.repo.fun import BadName
 
 from bro.exceptions import (BranchAlreadyExists, BranchCreateError,
                             BranchNotFound, GitCmdError, InvalidGitRepo,
                             RemoteNotFound)
+from bro.merge import merge_trees
+from bro.progress import ProgressDisplayer
+from bro.refs import RefIndex
+from bro.trace import traced
 
 LOGGER = getLogger(__name__)
-
-
-class ProgressDisplayer(RemoteProgress):
-    def update(self, op_code, cur_count, max_count=None, message=''):
-        progress = max(int((100 * cur_count) // max_count), 1)
-        end = '' if progress != 100 else '\n'
-        LOGGER.info('#' * progress, '\r', end=end)
+# Checkouts are bound by disk, a few at once keep it busy.
+WORKTREE_WORKERS = 4
 
 
 class GitRepo:
@@ -24,10 +27,12 @@ class GitRepo:
         self.path = Path(repo_path).absolute()
         try:
             self.repo = Repo(repo_path)
-        except InvalidGitRepositoryError:
+        except (InvalidGitRepositoryError, NoSuchPathError):
             raise InvalidGitRepo(f'Path {self.path} is not a git repo.')
         self.name = self.path.name
         self.executor = self.repo.git
+        self.refs = RefIndex(self.repo.common_dir)
+        self.show_progress = sys.stderr.isatty()
 
     @classmethod
     def from_path(cls, path):
@@ -37,44 +42,123 @@ class GitRepo:
     def current_branch(self):
         return self.repo.active_branch
 
+    def _progress(self):
+        return ProgressDisplayer(quiet=not self.show_progress)
+
+    def _transfer(self, command, args):
+        '''Run git fetch or push through the executor, showing progress
+        when enabled.
+        '''
+        if not self.show_progress:
+            return getattr(self.executor, command)(args)
+        progress = self._progress()
+
+        proc = getattr(self.executor, command)(args,
+                                               progress=True,
+                                               as_process=True,
+                                               universal_newlines=True)
+        handle_process_output(proc,
+                              None,
+                              progress.new_message_handler(),
+                              finalizer=None,
+                              decode_streams=False)
+        proc.wait(stderr='\n'.join(progress.error_lines))
+        LOGGER.info(f'Transferred {progress.summary()}.')
+
     def get_branch(self, branch):
-        try:
-            return self.repo.heads[branch]
-        except IndexError:
+        if not self.refs.has_branch(branch):
             raise BranchNotFound(f'Cannot find branch {branch}.')
+        return Head(self.repo, f'refs/heads/{branch}')
 
     def get_remote(self, remote):
-        try:
-            return self.repo.remotes[remote]
-        except IndexError:
+        if remote not in self.refs.remotes:
             raise RemoteNotFound(f'Remote {remote} does not exist.')
+        return Remote(self.repo, remote)
+
+    def _fetch(self, remote, refspecs, prune=False, depth=None,
+               shallow_since=None, filter_spec=None):
+        '''Fetch refspecs of a remote.
+        Args:
+            depth: Fetch only this many commits of every branch.
+            shallow_since: Fetch only commits after this date.
+            filter_spec: Leave out objects, like `blob:none` or `tree:0`.
+                Git marks the remote as promisor, which backfills missing
+                objects on demand.
+        Return:
+            Progress with bytes transferred and time elapsed.
+        '''
+        options = {
+            'prune': prune,
+            'depth': depth,
+            'shallow_since': shallow_since,
+            'filter': filter_spec
+        }
+        progress = self._progress()
+        remote_ref = self.get_remote(remote)
+        for info in remote_ref.fetch(refspecs,
+                                     progress=progress,
+                                     **{k: v
+                                        for k, v in options.items() if v}):
+            LOGGER.info(f'Fetched {info.name}.')
+        LOGGER.info(f'Fetched from {remote}, {progress.summary()}.')
+        return progress
 
-    def fetch(self, remote, branch='*'):
+    @traced()
+    def fetch(self, remote, *branches, prune=False, **options):
+        '''Fetch branches of a remote in one go, all branches by default.
+        With prune, remote-tracking branches gone from the remote are
+        removed as well. Options limit what is fetched, see `_fetch`.
+        '''
+        branches = branches or ('*', )
+        # Remote-tracking branches mirror the remote, force-pushed branches
+        # and cut history included, as the `+` of the refspec git configures
+        # for a remote does. Explicit refspecs need it spelled out.
+        refspecs = [
+            f'+refs/heads/{branch}:refs/remotes/{remote}/{branch}'
+            for branch in branches
+        ]
         try:
-            remote_ref = self.get_remote(remote)
-            refspec = f'refs/heads/{branch}:refs/remotes/{remote}/{branch}'
-            for info in remote_ref.fetch(refspec,
-                                         progress=ProgressDisplayer()):
-                LOGGER.info(f'Fetched {info.name} to {info.commit}.')
+            return self._fetch(remote, refspecs, prune=prune, **options)
         except GitCommandError as e:
-            raise GitCmdError(f'Failed to fetch {remote}/{branch}.',
-                              command=e.command)
+            names = ', '.join(f'{remote}/{branch}' for branch in branches)
+            raise GitCmdError(f'Failed to fetch {names}.', command=e.command)
 
-    def fetch_pull_request(self, remote, pr_id, branch):
-        args = [remote, f'pull/{pr_id}/head:{branch}']
+    @traced()
+    def fetch_pull_request(self, remote, pr_id, branch, **options):
+        '''Fetch head of a pull request to a local branch.
+        Options limit what is fetched, see `_fetch`.
+        '''
+        return self.fetch_pull_requests(remote, [(pr_id, branch)], **options)
+
+    @traced()
+    def fetch_pull_requests(self, remote, pull_requests, force=False,
+                            **options):
+        '''Fetch heads of many pull requests in one go.
+        Args:
+            pull_requests: Pairs of pull request id and the branch or ref to
+                fetch its head to.
+            force: Update refs even if the head was rewritten.
+        '''
+        prefix = '+' if force else ''
+        refspecs = [
+            f'{prefix}pull/{pr_id}/head:{ref}' for pr_id, ref in pull_requests
+        ]
         try:
-            self.executor.fetch(args)
+            return self._fetch(remote, refspecs, **options)
         except GitCommandError as e:
-            raise GitCmdError(f'Failed to fetch pr {remote}/{pr_id}.',
+            names = ', '.join(f'{remote}/{pr_id}'
+                              for pr_id, _ in pull_requests)
+            raise GitCmdError(f'Failed to fetch pr {names}.',
                               command=e.command)
 
+    @traced()
     def push(self, remote, branch, delete=False):
         args = [remote, branch]
         if delete:
             args.append('--delete')
 
         try:
-            self.executor.push(args)
+            self._transfer('push', args)
         except GitCommandError as e:
             if delete:
                 error_msg = f'Failed to delete {remote}/{branch}.'
@@ -87,6 +171,18 @@ class GitRepo:
         else:
             LOGGER.info(f'Pushed to {remote}/{branch}.')
 
+    @traced()
+    def push_delete(self, remote, *branches):
+        '''Delete many branches of a remote with one push.'''
+        try:
+            self._transfer('push', [remote, '--delete', *branches])
+        except GitCommandError as e:
+            names = ', '.join(f'{remote}/{branch}' for branch in branches)
+            raise GitCmdError(f'Failed to delete {names}.', command=e.command)
+
+        LOGGER.info(f'Deleted {len(branches)} branches of {remote}.')
+
+    @traced()
     def pull(self, remote, branch, rebase=False):
         args = [remote, branch]
         if rebase:
@@ -106,10 +202,11 @@ class GitRepo:
         else:
             LOGGER.info(f'Pulled from {remote}/{branch}.')
 
+    @traced()
     def branch_create(self, branch, start_point=None):
         # TODO: set tracking branch
         try:
-            assert branch not in self.repo.heads
+            assert not self.refs.has_branch(branch)
             if start_point:
                 branch_ref = self.repo.create_head(branch, commit=start_point)
                 LOGGER.info(f'Created branch {branch} based on {start_point}.')
@@ -124,6 +221,7 @@ class GitRepo:
 
         return branch_ref
 
+    @traced()
     def branch_checkout(self, branch, create=False, start_point=None):
         try:
             if create:
@@ -137,24 +235,234 @@ class GitRepo:
 
         return checked_out
 
-    def branch_delete(self, branch, force=False):
+    @traced()
+    def worktree_checkout(self, path, branch, start_point):
+        '''Check out a branch reset to start_point in its own worktree.
+        A worktree already at path is reused, local changes in it are kept
+        unless they conflict with the new start point.
+        '''
+        path = Path(path)
+        # Without tracking, git leaves the shared config alone, which
+        # checkouts running at once would otherwise fight to lock.
+        try:
+            if (path / '.git').exists():
+                Git(str(path)).checkout('--no-track', '-B', branch,
+                                        start_point)
+            else:
+                self.executor.worktree('add', '--no-track', '-B', branch,
+                                       str(path), start_point)
+        except GitCommandError as e:
+            raise GitCmdError(f'Failed to check out {branch} at {path}.',
+                              command=e.command)
+        LOGGER.info(f'Checked out {branch} at {path}.')
+
+    def worktrees_checkout(self, worktrees, workers=None):
+        '''Populate many worktrees at once, see `worktree_checkout`.
+        Args:
+            worktrees: Tuples of path, branch and start point.
+        Return:
+            Error of every worktree, None for those checked out.
+        '''
+        def checkout(worktree):
+            try:
+                self.worktree_checkout(*worktree)
+            except GitCmdError as e:
+                return e
+
+        workers = workers or min(len(worktrees), WORKTREE_WORKERS)
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            return list(executor.map(checkout, worktrees))
+
+    @traced()
+    def branch_delete(self, *branches, force=False):
+        '''Delete local branches with one git invocation.'''
+        try:
+            for branch in branches:
+                self.get_branch(branch)
+            self.repo.delete_head(*branches, force=force)
+        except GitCommandError as e:
+            names = ', '.join(branches)
+            raise GitCmdError(f'Failed to delete branch {names}.',
+                              command=e.command)
+
+        LOGGER.info(f'Deleted local branch {", ".join(branches)}.')
+
+    def merged_branches(self, target, *remotes):
+        '''Find local branches and branches of remotes merged into target,
+        with one reachability walk of git over all of them.
+        Local branches checked out in any worktree are left out, as git
+        refuses to delete them.
+        Return:
+            Names of local branches, and (remote, branch) pairs.
+        '''
+        patterns = ['refs/heads'] + [f'refs/remotes/{r}' for r in remotes]
+        try:
+            output = self.executor.for_each_ref(
+                '--merged', target, '--format=%(refname)%00%(worktreepath)',
+                *patterns)
+        except GitCommandError as e:
+            raise GitCmdError(f'Failed to find branches merged into {target}.',
+                              command=e.command)
+
+        branches, remote_branches = [], []
+        for line in output.splitlines():
+            ref, _, worktree = line.partition('\0')
+            if ref.startswith('refs/heads/'):
+                if not worktree:
+                    branches.append(ref[len('refs/heads/'):])
+                continue
+            remote, _, branch = ref[len('refs/remotes/'):].partition('/')
+            if branch != 'HEAD':
+                remote_branches.append((remote, branch))
+        return branches, remote_branches
+
+    def resolve(self, rev):
+        '''Sha of a full ref name from the ref index, or of any revision
+        from git.
+        '''
+        sha = self.refs.sha(rev)
+        if sha and not sha.startswith('ref: '):
+            return sha
+        try:
+            return self.executor.rev_parse('--verify', f'{rev}^{{commit}}')
+        except GitCommandError as e:
+            raise GitCmdError(f'Cannot find {rev}.', command=e.command)
+
+    @traced()
+    def numstat(self, base, head):
+        '''Changes of head since its merge base with base, like github
+        counts them for a pull request.
+        Return:
+            Number of commits, and (path, additions, deletions) of every
+            changed file, renamed files under their new path.
+        '''
         try:
-            self.get_branch(branch)
-            self.repo.delete_head(branch, force=force)
+            commits = self.executor.rev_list('--count', f'{base}..{head}')
+            output = self.executor.diff('--numstat', '-z', '-M',
+                                        f'{base}...{head}')
         except GitCommandError as e:
-            raise GitCmdError(f'Failed to delete branch {branch}.',
+            raise GitCmdError(f'Failed to diff {head} against {base}.',
                               command=e.command)
 
-        LOGGER.info(f'Deleted local branch {branch}.')
+        files, fields = [], iter(output.split('\0'))
+        for field in fields:
+            if not field:
+                continue
+            additions, deletions, path = field.split('\t', 2)
+            if not path:
+                # Renames give old and new paths as the next fields.
+                next(fields)
+                path = next(fields)
+            # Binary files show `-` for both.
+            files.append((path, int(additions) if additions != '-' else 0,
+                          int(deletions) if deletions != '-' else 0))
+        return int(commits), files
+
+    def branch_upstreams(self):
+        '''Local branches with their shas and upstream refs.
+        Return:
+            Tuples of branch, sha, full ref name of the upstream or None,
+            and whether the branch is checked out.
+        '''
+        output = self.executor.for_each_ref(
+            '--format=%(refname:short)%00%(objectname)%00%(upstream)'
+            '%00%(HEAD)', 'refs/heads')
+        branches = []
+        for line in output.splitlines():
+            branch, sha, upstream, head = line.split('\0')
+            branches.append((branch, sha, upstream or None, head == '*'))
+        return branches
 
+    @traced()
+    def ahead_behind(self, pairs):
+        '''Count commits of left not in right and of right not in left, for
+        many pairs of shas with one walk of git over all of them.
+        Commits reachable from the merge base of all tips are in every
+        pair's both sides and left out of the walk. Every other commit is
+        counted by the set of tips reaching it, which git lists children
+        first. Git speeds up both with generation numbers of the
+        commit-graph file, when the repo has one.
+        Return:
+            Dict of (left, right) pairs to (ahead, behind) counts.
+        '''
+        pairs = set(pairs)
+        tips = sorted({sha for pair in pairs for sha in pair})
+        try:
+            bases = self.executor.merge_base('--octopus', *tips).split()
+        except GitCommandError as e:
+            # Unrelated histories have no merge base.
+            if e.status != 1:
+                raise GitCmdError('Failed to find merge base of branches.',
+                                  command=e.command)
+            bases = []
+        try:
+            output = self.executor.rev_list('--topo-order', '--parents',
+                                            *tips, '--not', *bases)
+        except GitCommandError as e:
+            raise GitCmdError('Failed to walk commits of branches.',
+                              command=e.command)
+
+        bits = {sha: 1 << i for i, sha in enumerate(tips)}
+        reached, commits = {}, {}
+        for line in output.splitlines():
+            sha, *parents = line.split()
+            mask = reached.pop(sha, 0) | bits.get(sha, 0)
+            commits[mask] = commits.get(mask, 0) + 1
+            for parent in parents:
+                reached[parent] = reached.get(parent, 0) | mask
+
+        commits = list(commits.items())
+        counts = {}
+        for left, right in pairs:
+            if left == right:
+                counts[left, right] = (0, 0)
+                continue
+            both = bits[left] | bits[right]
+            ahead = sum(count for mask, count in commits
+                        if mask & both == bits[left])
+            behind = sum(count for mask, count in commits
+                         if mask & both == bits[right])
+            counts[left, right] = (ahead, behind)
+        return counts
+
+    def _move_branch(self, head, commit, reason):
+        '''Point the checked out branch to commit, updating only index
+        entries and files that differ between the two trees.
+        '''
+        self.executor.read_tree('-m', '-u', head.commit.hexsha, commit.hexsha)
+        head.set_commit(commit, logmsg=reason)
+
+    @traced()
     def merge(self, branch):
+        '''Merge branch into the current branch.
+        Fast-forward when the current branch has no commits of its own,
+        otherwise merge trees in the object database and commit the result.
+        '''
+        master, subster = self.current_branch, self.get_branch(branch)
+        ours, theirs = master.commit, subster.commit
         try:
-            master, subster = self.current_branch, self.get_branch(branch)
-            merge_base = self.repo.merge_base(master, subster)
-            self.repo.index.merge_tree(subster, base=merge_base)
-            return self.repo.index.commit(
+            bases = self.repo.merge_base(ours, theirs)
+            base = bases[0] if bases else None
+            if base == theirs:
+                LOGGER.info(f'{master.name} is already up to date with '
+                            f'{branch}.')
+                return ours
+            if base == ours:
+                self._move_branch(master, theirs,
+                                  f'merge {branch}: Fast-forward')
+                LOGGER.info(f'Fast-forwarded {master.name} to {branch}.')
+                return theirs
+
+            tree = merge_trees(self.repo, base, ours, theirs)
+            commit = Commit.create_from_tree(
+                self.repo,
+                Tree(self.repo, tree),
                 f'Merged {master.name} with {branch} by gitbro.',
-                parent_commits=(master.commit, subster.commit))
+                parent_commits=[ours, theirs])
+            self._move_branch(master, commit, f'merge {branch}')
         except GitCommandError as e:
-            raise GitCmdError(f'Failed to merge {subster} into {master}.',
+            raise GitCmdError(f'Failed to merge {branch} into {master}.',
                               command=e.command)
+
+        LOGGER.info(f'Merged {branch} into {master.name}.')
+        return commit
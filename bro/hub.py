@@ -2,13 +2,31 @@
 This module provides a class and all the management functions of pull request.
 '''
 
+from array import array
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from contextvars import copy_context
 from logging import getLogger
 
-from .api import API
+from requests.exceptions import RequestException
+
+from .api import (PRIORITY_BULK, API, AsyncAPI, RateLimitScheduler,
+                  decode_json, priority)
+from .exceptions import GithubError
 
 LOGGER = getLogger(__name__)
-GITHUB_API = API('https://api.github.com')
+DIFF_CHUNK_SIZE = 64 * 1024
+DEFAULT_WORKERS = 8
+# Pull requests per graphql query, and the node limit github puts on a query.
+GRAPHQL_CHUNK_SIZE = 50
+GRAPHQL_MAX_NODES = 500000
+GRAPHQL_REVIEWERS = 20
+GITHUB_SCHEDULER = RateLimitScheduler()
+GITHUB_API = API('https://api.github.com', scheduler=GITHUB_SCHEDULER)
 GITHUB_PATCH_API = API('https://patch-diff.githubusercontent.com')
+GITHUB_ASYNC_API = AsyncAPI('https://api.github.com',
+                            scheduler=GITHUB_SCHEDULER)
 
 
 def request_github_access_token(username,
@@ -33,74 +51,221 @@ def request_github_access_token(username,
 class PullRequest:
     '''Pull request object.
     Divides a pull request into 3 parts: metadata, main content and extra info.
+    Only fields used by these parts are kept. Nested sections are kept as
+    tuples and decoded to dicts on access, the parts are cached once built.
     '''
 
+    FIELDS = {
+        'id': -1,
+        'number': -1,
+        'state': '',
+        'merged': None,
+        'mergeable': None,
+        'created_at': '',
+        'updated_at': '',
+        'closed_at': '',
+        'merged_at': '',
+        'title': '',
+        'body': '',
+        'commits': -1,
+        'additions': -1,
+        'deletions': -1,
+        'changed_files': -1,
+        'html_url': '',
+        'diff_url': '',
+        'patch_url': '',
+        'comments_url': '',
+        'review_comments_url': '',
+    }
+    NESTED = {
+        'user': ('login', 'id', 'type', 'html_url'),
+        'head': ('label', 'ref', 'sha'),
+        'base': ('label', 'ref', 'sha'),
+    }
+
+    __slots__ = tuple(FIELDS) + tuple('_' + key for key in NESTED) + (
+        '_requested_reviewers', '_meta', '_content', '_extra')
+
     @classmethod
     def from_json(cls, **kwargs):
         '''Create an object from json data.'''
         return cls(**kwargs)
 
+    @classmethod
+    def columns(cls):
+        '''Names of the values an object is made of.'''
+        return tuple(cls.FIELDS) + tuple(
+            cls.NESTED) + ('requested_reviewers', )
+
+    @classmethod
+    def values_from_json(cls, data):
+        '''Project json data to values in the order of columns().'''
+        values = [
+            data.get(key, default) for key, default in cls.FIELDS.items()
+        ]
+        for key, fields in cls.NESTED.items():
+            section = data.get(key) or {}
+            values.append(tuple(section.get(field) for field in fields))
+        values.append(
+            tuple(reviewer.get('login')
+                  for reviewer in data.get('requested_reviewers') or ()))
+        return values
+
+    @classmethod
+    def from_values(cls, values):
+        '''Create an object from values in the order of columns().'''
+        pull_request = cls.__new__(cls)
+        for slot, value in zip(cls.__slots__, values):
+            setattr(pull_request, slot, value)
+        pull_request._meta = pull_request._content = pull_request._extra = None
+        return pull_request
+
+    def values(self):
+        '''Values in the order of columns(), as from_values() takes them.'''
+        return [
+            getattr(self, slot)
+            for slot in self.__slots__[:len(self.FIELDS) + len(self.NESTED) +
+                                       1]
+        ]
+
     def __init__(self, **kwargs):
-        for k, v in kwargs.items():
-            setattr(self, k, v)
+        for slot, value in zip(self.__slots__, self.values_from_json(kwargs)):
+            setattr(self, slot, value)
+        self._meta = self._content = self._extra = None
+
+    def __str__(self):
+        return 'PullRequest:<{number}>'.format(number=self.number)
+
+    __repr__ = __str__
+
+    def _decode(self, key):
+        return dict(zip(self.NESTED[key], getattr(self, '_' + key)))
+
+    @property
+    def user(self):
+        return self._decode('user')
+
+    @property
+    def head(self):
+        return self._decode('head')
+
+    @property
+    def base(self):
+        return self._decode('base')
+
+    @property
+    def requested_reviewers(self):
+        return [{'login': login} for login in self._requested_reviewers]
 
     @property
     def meta(self):
-        return {
-            'id': getattr(self, 'id', -1),
-            # 'node_id': getattr(self, 'node_id', ''),
-            'number': getattr(self, 'number', -1),
-            'base': getattr(self, 'base', {})['label'],
-            'head': getattr(self, 'head', {})['label'],
-            'state': getattr(self, 'state', ''),
-            'merged': getattr(self, 'merged', None),
-            'mergeable': getattr(self, 'mergeable', None),
-            # 'rebaseable': getattr(self, 'rebaseable', None),
-            'created_at': getattr(self, 'created_at', ''),
-            'updated_at': getattr(self, 'updated_at', ''),
-            'closed_at': getattr(self, 'closed_at', ''),
-            'merged_at': getattr(self, 'merged_at', ''),
-        }
+        if self._meta is None:
+            self._meta = {
+                'id': self.id,
+                'number': self.number,
+                'base': self._base[0] or '',
+                'head': self._head[0] or '',
+                'state': self.state,
+                'merged': self.merged,
+                'mergeable': self.mergeable,
+                'created_at': self.created_at,
+                'updated_at': self.updated_at,
+                'closed_at': self.closed_at,
+                'merged_at': self.merged_at,
+            }
+        return self._meta
 
     @property
     def content(self):
-        return {
-            'title':
-            getattr(self, 'title', ''),
-            'body':
-            getattr(self, 'body', ''),
-            'commits':
-            getattr(self, 'commits', -1),
-            'additions':
-            getattr(self, 'additions', -1),
-            'deletions':
-            getattr(self, 'deletions', -1),
-            'changed_files':
-            getattr(self, 'changed_files', -1),
-
-            # 'assignee': getattr(self, 'assignee', None),
-            # 'assignees': getattr(self, 'assignees', None) or '',
-            'requested_reviewers':
-            getattr(self, 'requested_reviewers', None) or '',
-
-            # 'labels': getattr(self, 'labels', None) or '',
-            # 'milestone': getattr(self, 'milestone', None)
-        }
+        if self._content is None:
+            self._content = {
+                'title': self.title,
+                'body': self.body,
+                'commits': self.commits,
+                'additions': self.additions,
+                'deletions': self.deletions,
+                'changed_files': self.changed_files,
+                'requested_reviewers': self.requested_reviewers or '',
+            }
+        return self._content
 
     @property
     def extra(self):
-        return {
-            'author': getattr(self, 'user', {}),
-            'urls': {
-                'html_url': getattr(self, 'html_url', ''),
-                'diff_url': getattr(self, 'diff_url', ''),
-                'patch_url': getattr(self, 'patch_url', ''),
-                'comments_url': getattr(self, 'comments_url', ''),
-                'review_comments_url': getattr(self, 'review_comments_url',
-                                               ''),
+        if self._extra is None:
+            self._extra = {
+                'author': self.user,
+                'urls': {
+                    'html_url': self.html_url,
+                    'diff_url': self.diff_url,
+                    'patch_url': self.patch_url,
+                    'comments_url': self.comments_url,
+                    'review_comments_url': self.review_comments_url,
+                }
             }
+        return self._extra
+
+
+class PullRequestBatch:
+    '''Columnar container of many pull requests.
+    Values are kept per column, with integer columns packed in arrays.
+    Pull request objects are only made when items are accessed.
+    '''
+
+    INT_COLUMNS = ('id', 'number', 'commits', 'additions', 'deletions',
+                   'changed_files')
+
+    def __init__(self):
+        self._columns = {
+            column: array('q') if column in self.INT_COLUMNS else []
+            for column in PullRequest.columns()
         }
 
+    @classmethod
+    def from_json(cls, items):
+        batch = cls()
+        for data in items:
+            batch.append(data)
+        return batch
+
+    def __len__(self):
+        return len(self._columns['number'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return PullRequest.from_values(
+            column[index] for column in self._columns.values())
+
+    def __iter__(self):
+        for values in zip(*self._columns.values()):
+            yield PullRequest.from_values(values)
+
+    def __str__(self):
+        return 'PullRequestBatch:<{size}>'.format(size=len(self))
+
+    __repr__ = __str__
+
+    def append(self, data):
+        values = PullRequest.values_from_json(data)
+        for (name, column), value in zip(self._columns.items(), values):
+            if value is None and name in self.INT_COLUMNS:
+                value = -1
+            column.append(value)
+
+    def column(self, name):
+        '''All values of a column, like `number` or `state`.'''
+        return self._columns[name]
+
+
+def _pull_request_payload(title, head, base, body, issue):
+    payload = {'head': head, 'base': base}
+    if issue:
+        payload['issue'] = issue
+    else:
+        payload['title'] = title
+        payload['body'] = body
+    return payload
+
 
 def create_pull_request(owner,
                         repo,
@@ -111,13 +276,7 @@ def create_pull_request(owner,
                         body='',
                         mcm=False,
                         issue=None):
-    payload = {'head': head, 'base': base}
-    if issue:
-        payload['issue'] = issue
-    else:
-        payload['title'] = title
-        payload['body'] = body
-
+    payload = _pull_request_payload(title, head, base, body, issue)
     json_resp = GITHUB_API.repos.path(owner, repo).pulls.post(json=payload,
                                                               auth=auth)
     pull_request = PullRequest.from_json(**json_resp)
@@ -135,6 +294,189 @@ def get_pull_request(owner, repo, number, auth, patch=False):
     return pull_request
 
 
+PULL_REQUEST_FRAGMENT = '''
+fragment pullRequest on PullRequest {
+  databaseId number state merged mergeable
+  createdAt updatedAt closedAt mergedAt
+  title body additions deletions changedFiles url
+  commits { totalCount }
+  author { __typename login url ... on User { databaseId } }
+  headRefName headRefOid headRepositoryOwner { login }
+  baseRefName baseRefOid
+  reviewRequests(first: %d) {
+    nodes { requestedReviewer { ... on User { login } } }
+  }
+}
+''' % GRAPHQL_REVIEWERS
+# A pull request, its review requests and their reviewers.
+PULL_REQUEST_NODES = 1 + 2 * GRAPHQL_REVIEWERS
+MERGEABLE = {'MERGEABLE': True, 'CONFLICTING': False}
+
+
+def _pull_requests_query(numbers):
+    fields = '\n'.join(f'pr{number}: pullRequest(number: {number}) '
+                       '{ ...pullRequest }' for number in numbers)
+    return ('query($owner: String!, $repo: String!) {\n'
+            f'repository(owner: $owner, name: $repo) {{\n{fields}\n}}\n}}'
+            f'{PULL_REQUEST_FRAGMENT}')
+
+
+def _pull_request_from_graphql(owner, repo, node):
+    '''Shape a graphql pull request like the rest api does.'''
+    number, url = node['number'], node['url']
+    api_url = f'{GITHUB_API.host}/repos/{owner}/{repo}'
+    author = node.get('author') or {}
+    head_owner = (node.get('headRepositoryOwner') or {}).get('login', owner)
+    return PullRequest.from_json(
+        id=node.get('databaseId'),
+        number=number,
+        state='closed' if node['state'] == 'MERGED' else node['state'].lower(),
+        merged=node.get('merged'),
+        mergeable=MERGEABLE.get(node.get('mergeable')),
+        created_at=node.get('createdAt'),
+        updated_at=node.get('updatedAt'),
+        closed_at=node.get('closedAt'),
+        merged_at=node.get('mergedAt'),
+        title=node.get('title'),
+        body=node.get('body'),
+        commits=(node.get('commits') or {}).get('totalCount'),
+        additions=node.get('additions'),
+        deletions=node.get('deletions'),
+        changed_files=node.get('changedFiles'),
+        html_url=url,
+        diff_url=f'{url}.diff',
+        patch_url=f'{url}.patch',
+        comments_url=f'{api_url}/issues/{number}/comments',
+        review_comments_url=f'{api_url}/pulls/{number}/comments',
+        user={
+            'login': author.get('login'),
+            'id': author.get('databaseId'),
+            'type': author.get('__typename'),
+            'html_url': author.get('url')
+        },
+        head={
+            'label': f'{head_owner}:{node["headRefName"]}',
+            'ref': node['headRefName'],
+            'sha': node.get('headRefOid')
+        },
+        base={
+            'label': f'{owner}:{node["baseRefName"]}',
+            'ref': node['baseRefName'],
+            'sha': node.get('baseRefOid')
+        },
+        requested_reviewers=[
+            request['requestedReviewer']
+            for request in (node.get('reviewRequests') or {}).get('nodes', ())
+            if (request.get('requestedReviewer') or {}).get('login')
+        ])
+
+
+def get_pull_requests(owner, repo, numbers, auth, chunk_size=None):
+    '''Get many pull requests with a few graphql queries.
+    Each query asks for up to chunk_size pull requests as aliased fields,
+    projected to the fields PullRequest keeps, and stays within the node
+    limit of github.
+    Return:
+        Pull requests in the order of numbers, missing ones are skipped.
+    '''
+    numbers = list(dict.fromkeys(int(number) for number in numbers))
+    chunk_size = min(chunk_size or GRAPHQL_CHUNK_SIZE,
+                     GRAPHQL_MAX_NODES // PULL_REQUEST_NODES)
+
+    pull_requests = []
+    for start in range(0, len(numbers), chunk_size):
+        chunk = numbers[start:start + chunk_size]
+        payload = {
+            'query': _pull_requests_query(chunk),
+            'variables': {
+                'owner': owner,
+                'repo': repo
+            }
+        }
+        json_resp = GITHUB_API.graphql.post(json=payload, auth=auth)
+        repository = (json_resp.get('data') or {}).get('repository')
+        if repository is None:
+            errors = json_resp.get('errors') or [{}]
+            raise GithubError(errors[0].get('message', 'Unknown error'))
+
+        for number in chunk:
+            node = repository.get(f'pr{number}')
+            if node is None:
+                LOGGER.warning(f'Pull request {number} is not found.')
+                continue
+            pull_requests.append(
+                _pull_request_from_graphql(owner, repo, node))
+    return pull_requests
+
+
+def iter_pull_request_diff(owner, repo, number, chunk_size=None):
+    '''Yield the diff of a pull request in chunks of bytes as downloaded.'''
+    resp = GITHUB_PATCH_API.raw.path(owner, repo).pull.path(
+        '%s.diff' % number).get(response_type='response', stream=True)
+    with closing(resp):
+        yield from resp.iter_content(chunk_size or DIFF_CHUNK_SIZE)
+
+
+def download_pull_request_diff(owner, repo, number, path, chunk_size=None):
+    '''Write the diff of a pull request to path chunk by chunk.
+    Return:
+        Number of bytes written.
+    '''
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in iter_pull_request_diff(owner, repo, number, chunk_size):
+            size += f.write(chunk)
+    LOGGER.info(f'Downloaded diff of pr {number} to {path}, {size} bytes.')
+    return size
+
+
+def list_pull_requests(owner,
+                       repo,
+                       auth,
+                       state='open',
+                       base=None,
+                       head=None,
+                       sort=None,
+                       direction=None,
+                       per_page=100):
+    '''Lazily yield pull requests page by page.
+    Pages are followed through the `next` link of github's pagination and the
+    next page is requested in background while the current one is consumed.
+    Args:
+        state: Either `open`, `closed` or `all`.
+        base: Filter by base branch name.
+        head: Filter by head in the format of `user:ref-name`.
+        sort: Either `created`, `updated`, `popularity` or `long-running`.
+        direction: Either `asc` or `desc`.
+    '''
+    params = {'state': state, 'per_page': per_page}
+    for key, value in (('base', base), ('head', head), ('sort', sort),
+                       ('direction', direction)):
+        if value:
+            params[key] = value
+
+    resp = GITHUB_API.repos.path(owner, repo).pulls.get(
+        params=params, auth=auth, response_type='response')
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            next_url = resp.links.get('next', {}).get('url')
+            next_page = executor.submit(copy_context().run,
+                                        GITHUB_API.retrive_response,
+                                        'get',
+                                        url=next_url,
+                                        auth=auth,
+                                        timeout=GITHUB_API.timeout,
+                                        response_type='response'
+                                        ) if next_url else None
+
+            for json_resp in decode_json(resp):
+                yield PullRequest.from_json(**json_resp)
+
+            if not next_page:
+                break
+            resp = next_page.result()
+
+
 def comment_pull_request(owner, repo, number, auth, comment):
     ''''''
     payload = {'body': comment}
@@ -167,3 +509,87 @@ def merge_pull_request(owner, repo, number, auth, **payload):
     json_resp = GITHUB_API.repos.path(
         owner, repo).pulls.path(number).merge.put(json=payload, auth=auth)
     return json_resp
+
+
+def close_pull_request(owner, repo, number, auth):
+    return update_pull_request(owner, repo, number, auth, state='closed')
+
+
+BatchResult = namedtuple('BatchResult', 'number ok result')
+BATCH_ACTIONS = {
+    'merge': merge_pull_request,
+    'comment': comment_pull_request,
+    'close': close_pull_request,
+}
+
+
+def batch_pull_requests(owner,
+                        repo,
+                        auth,
+                        action,
+                        numbers,
+                        workers=None,
+                        **payload):
+    '''Run one action on many pull requests with a pool of workers.
+    Requests are made with bulk priority, so interactive ones go first.
+    Args:
+        action: One of `merge`, `comment` or `close`.
+        payload: Arguments of the action, like comment or commit_message.
+    Yield:
+        BatchResult of every pull request as soon as it finishes.
+    '''
+    func = BATCH_ACTIONS[action]
+
+    def run(number):
+        try:
+            with priority(PRIORITY_BULK):
+                return BatchResult(number, True,
+                                   func(owner, repo, number, auth, **payload))
+        except RequestException as e:
+            return BatchResult(number, False, str(e))
+
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS,
+                            thread_name_prefix='bro-batch') as executor:
+        futures = [executor.submit(run, number) for number in numbers]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+async def async_create_pull_request(owner,
+                                    repo,
+                                    title,
+                                    head,
+                                    base,
+                                    auth,
+                                    body='',
+                                    mcm=False,
+                                    issue=None):
+    payload = _pull_request_payload(title, head, base, body, issue)
+    json_resp = await GITHUB_ASYNC_API.repos.path(owner, repo).pulls.post(
+        json=payload, auth=auth)
+    return PullRequest.from_json(**json_resp)
+
+
+async def async_get_pull_request(owner, repo, number, auth):
+    json_resp = await GITHUB_ASYNC_API.repos.path(
+        owner, repo).pulls.path(number).get(auth=auth)
+    return PullRequest.from_json(**json_resp)
+
+
+async def async_comment_pull_request(owner, repo, number, auth, comment):
+    payload = {'body': comment}
+    return await GITHUB_ASYNC_API.repos.path(
+        owner, repo).issues.path(number).comments.post(json=payload, auth=auth)
+
+
+async def async_update_pull_request(owner, repo, number, auth, **payload):
+    '''Async version of update_pull_request.'''
+    json_resp = await GITHUB_ASYNC_API.repos.path(
+        owner, repo).pulls.path(number).patch(json=payload, auth=auth)
+    return PullRequest.from_json(**json_resp)
+
+
+async def async_merge_pull_request(owner, repo, number, auth, **payload):
+    '''Async version of merge_pull_request.'''
+    return await GITHUB_ASYNC_API.repos.path(
+        owner, repo).pulls.path(number).merge.put(json=payload, auth=auth)
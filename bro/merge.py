@@ -0,0 +1,149 @@
+'''This module merges git trees without touching the index or worktree.
+Subtrees with the same id on both sides, or left untouched by one side, are
+taken as a whole, so the cost of a merge scales with the size of the change
+rather than the size of the repo.
+'''
+
+import os
+from io import BytesIO
+from logging import getLogger
+from tempfile import TemporaryDirectory
+
+from git.objects.fun import tree_entries_from_data, tree_to_stream
+from gitdb import IStream
+
+from bro.exceptions import MergeConflict
+
+LOGGER = getLogger(__name__)
+TREE_MODE = 0o040000
+FILE_MODES = (0o100644, 0o100755)
+
+
+def _sort_key(entry):
+    # Git orders tree entries as if directory names ended with a slash.
+    binsha, mode, name = entry
+    return name + '/' if mode == TREE_MODE else name
+
+
+class TreeMerger:
+    '''Three-way merge of trees, writing merged trees and blobs to the odb.'''
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.trees_read = 0
+        self.conflicts = []
+
+    def __str__(self):
+        return 'TreeMerger:<{path}>'.format(path=self.repo.working_dir)
+
+    __repr__ = __str__
+
+    def _entries(self, binsha):
+        if binsha is None:
+            return {}
+        self.trees_read += 1
+        data = self.repo.odb.stream(binsha).read()
+        return {
+            name: (sha, mode)
+            for sha, mode, name in tree_entries_from_data(data)
+        }
+
+    def _store(self, kind, data):
+        return self.repo.odb.store(IStream(kind, len(data),
+                                           BytesIO(data))).binsha
+
+    def _write_tree(self, entries):
+        stream = BytesIO()
+        tree_to_stream(sorted(entries, key=_sort_key), stream.write)
+        return self._store(b'tree', stream.getvalue())
+
+    def _merge_blobs(self, path, base, ours, theirs):
+        '''Merge contents of a file changed on both sides with
+        `git merge-file`, return the merged blob or None on conflict.
+        '''
+        with TemporaryDirectory() as tmp:
+            files = []
+            for name, binsha in (('ours', ours), ('base', base),
+                                 ('theirs', theirs)):
+                files.append(os.path.join(tmp, name))
+                with open(files[-1], 'wb') as f:
+                    if binsha:
+                        f.write(self.repo.odb.stream(binsha).read())
+            status, merged, _ = self.repo.git.merge_file(
+                '-p',
+                *files,
+                with_extended_output=True,
+                with_exceptions=False,
+                stdout_as_string=False,
+                strip_newline_in_stdout=False)
+        if status != 0:
+            return None
+        return self._store(b'blob', merged)
+
+    def _merge_entry(self, path, base, ours, theirs):
+        '''Merge one tree entry given as (binsha, mode) or None if absent.'''
+        if ours == theirs or base == theirs:
+            return ours
+        if base == ours:
+            return theirs
+        if ours and theirs and ours[1] == theirs[1] == TREE_MODE:
+            base_sha = base[0] if base and base[1] == TREE_MODE else None
+            return (self.merge(base_sha, ours[0], theirs[0], f'{path}/'),
+                    TREE_MODE)
+        if ours and theirs and ours[1] in FILE_MODES and (theirs[1]
+                                                          in FILE_MODES):
+            base = base if base and base[1] in FILE_MODES else None
+            base_mode = base[1] if base else None
+            if ours[1] != theirs[1] and base_mode not in (ours[1], theirs[1]):
+                mode = None
+            else:
+                mode = theirs[1] if ours[1] == base_mode else ours[1]
+            binsha = self._merge_blobs(path, base and base[0], ours[0],
+                                       theirs[0])
+            if mode and binsha:
+                return (binsha, mode)
+
+        # Both sides changed it in ways that cannot be combined.
+        self.conflicts.append(path)
+        return ours
+
+    def merge(self, base, ours, theirs, path=''):
+        '''Merge trees given as binshas, base may be None.
+        Return:
+            binsha of the merged tree.
+        '''
+        if ours == theirs or base == theirs:
+            return ours
+        if base == ours:
+            return theirs
+
+        base_entries, our_entries, their_entries = (self._entries(base),
+                                                    self._entries(ours),
+                                                    self._entries(theirs))
+        merged = []
+        for name in our_entries.keys() | their_entries.keys():
+            entry = self._merge_entry(f'{path}{name}', base_entries.get(name),
+                                      our_entries.get(name),
+                                      their_entries.get(name))
+            if entry:
+                merged.append((entry[0], entry[1], name))
+        return self._write_tree(merged)
+
+
+def merge_trees(repo, base, ours, theirs):
+    '''Merge trees of three commits, base may be None for unrelated ones.
+    Return:
+        binsha of the merged tree.
+    Raise:
+        MergeConflict listing paths changed on both sides.
+    '''
+    merger = TreeMerger(repo)
+    tree = merger.merge(base and base.tree.binsha, ours.tree.binsha,
+                        theirs.tree.binsha)
+    LOGGER.debug(f'Read {merger.trees_read} trees to merge {theirs} into '
+                 f'{ours}.')
+    if merger.conflicts:
+        raise MergeConflict(
+            f'Conflicts in {", ".join(sorted(merger.conflicts))}.',
+            paths=sorted(merger.conflicts))
+    return tree
@@ -0,0 +1,120 @@
+'''This module displays progress of git transfers.
+Lines are redrawn at a capped rate, so rendering costs next to nothing even
+when git reports thousands of updates.
+'''
+
+import re
+import sys
+from time import monotonic
+
+from git import RemoteProgress
+
+DEFAULT_INTERVAL = 0.1
+MIN_ELAPSED = 0.05
+SIZE = re.compile(r'(\d+(?:\.\d+)?) (B|KiB|MiB|GiB|bytes)')
+UNITS = {'B': 1, 'bytes': 1, 'KiB': 1 << 10, 'MiB': 1 << 20, 'GiB': 1 << 30}
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            precision = 0 if unit == 'B' else 1
+            return f'{size:.{precision}f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+class PhaseStats:
+    __slots__ = ('name', 'started', 'elapsed', 'objects', 'total', 'bytes')
+
+    def __init__(self, name, started):
+        self.name = name
+        self.started = started
+        self.elapsed = 0
+        self.objects = 0
+        self.total = None
+        self.bytes = 0
+
+    def __str__(self):
+        # Rates over a few milliseconds are noise rather than information.
+        elapsed = self.elapsed if self.elapsed >= MIN_ELAPSED else None
+        parts = [f'{self.name}: {self.objects}']
+        if self.total:
+            parts[0] += f'/{self.total} ({100 * self.objects // self.total}%)'
+        if elapsed:
+            parts.append(f'{self.objects / elapsed:.0f} objects/s')
+        if self.bytes:
+            parts.append(format_size(self.bytes))
+            if elapsed:
+                parts[-1] += f', {format_size(self.bytes / elapsed)}/s'
+        if elapsed and self.total and 0 < self.objects < self.total:
+            eta = (self.total - self.objects) * elapsed / self.objects
+            parts.append(f'eta {eta:.0f}s')
+        return ', '.join(parts)
+
+
+class ProgressDisplayer(RemoteProgress):
+    '''Display objects/s, bytes/s and eta of every phase of a git transfer,
+    redrawn at most once per interval. Quiet ones only collect the stats.
+    '''
+
+    PHASES = {
+        RemoteProgress.COUNTING: 'Counting',
+        RemoteProgress.COMPRESSING: 'Compressing',
+        RemoteProgress.WRITING: 'Writing',
+        RemoteProgress.RECEIVING: 'Receiving',
+        RemoteProgress.RESOLVING: 'Resolving',
+        RemoteProgress.FINDING_SOURCES: 'Finding sources',
+        RemoteProgress.CHECKING_OUT: 'Checking out',
+    }
+
+    def __init__(self, stream=None, interval=None, quiet=False):
+        super().__init__()
+        self.stream = stream or sys.stderr
+        self.quiet = quiet
+        self.interval = DEFAULT_INTERVAL if interval is None else interval
+        self.phases = []
+        self.started = monotonic()
+        self._drawn_at = 0
+        self._width = 0
+
+    @property
+    def bytes(self):
+        '''Bytes transferred as reported by git.'''
+        return sum(phase.bytes for phase in self.phases)
+
+    @property
+    def elapsed(self):
+        return monotonic() - self.started
+
+    def update(self, op_code, cur_count, max_count=None, message=''):
+        now = monotonic()
+        name = self.PHASES.get(op_code & self.OP_MASK, 'Working')
+        if op_code & self.BEGIN or not self.phases or (self.phases[-1].name
+                                                       != name):
+            self.phases.append(PhaseStats(name, now))
+
+        phase = self.phases[-1]
+        phase.elapsed = now - phase.started
+        phase.objects = int(cur_count)
+        phase.total = int(max_count) if max_count else None
+        size = SIZE.search(message or '')
+        if size:
+            phase.bytes = int(float(size.group(1)) * UNITS[size.group(2)])
+
+        end = op_code & self.END
+        if self.quiet or not end and now - self._drawn_at < self.interval:
+            return
+        self._drawn_at = now
+        self._draw(str(phase), end)
+
+    def _draw(self, line, end):
+        self.stream.write('\r' + line.ljust(self._width))
+        self._width = 0 if end else len(line)
+        if end:
+            self.stream.write('\n')
+        self.stream.flush()
+
+    def summary(self):
+        return (f'{format_size(self.bytes)} in {self.elapsed:.1f}s'
+                if self.bytes else f'done in {self.elapsed:.1f}s')
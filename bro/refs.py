@@ -0,0 +1,121 @@
+'''This module provides an in-memory index of refs of a git repo.
+Refs are read once from `packed-refs` and loose ref files, and read again only
+when any of them changes.
+'''
+
+import os
+import re
+from logging import getLogger
+from pathlib import Path
+from time import time_ns
+
+LOGGER = getLogger(__name__)
+REMOTE_SECTION = re.compile(r'^\s*\[remote\s+"(.+)"\]', re.MULTILINE)
+# Changes within this window of a load may share its mtime, see racy git.
+RACY_WINDOW_NS = 1000 * 1000 * 1000
+
+
+class RefIndex:
+    '''Snapshot of refs and remotes of a repo.
+    The snapshot is trusted while mtimes of `packed-refs`, `config` and every
+    directory under `refs` stay the same, as git renames a lock file into
+    place for every ref update.
+    '''
+
+    def __init__(self, git_dir):
+        self.git_dir = Path(git_dir)
+        self._refs = {}
+        self._remotes = set()
+        self._dirs = []
+        self._stamp = None
+        self._loaded_at = 0
+
+    def __str__(self):
+        return 'RefIndex:<{git_dir}>'.format(git_dir=self.git_dir)
+
+    __repr__ = __str__
+
+    def __contains__(self, ref):
+        return ref in self.refs
+
+    def _mtimes(self, paths):
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _current_stamp(self):
+        return self._mtimes([
+            self.git_dir / 'packed-refs', self.git_dir / 'config',
+            *self._dirs
+        ])
+
+    def _is_fresh(self):
+        if self._stamp is None or self._current_stamp() != self._stamp:
+            return False
+        newest = max((mtime for mtime in self._stamp if mtime), default=0)
+        return newest < self._loaded_at - RACY_WINDOW_NS
+
+    def invalidate(self):
+        self._stamp = None
+
+    def _load(self):
+        loaded_at = time_ns()
+        refs, dirs = {}, []
+
+        packed = self.git_dir / 'packed-refs'
+        if packed.exists():
+            with open(packed) as f:
+                for line in f:
+                    if line[0] in '#^':
+                        continue
+                    sha, _, name = line.rstrip('\n').partition(' ')
+                    refs[name] = sha
+
+        for root, _, files in os.walk(self.git_dir / 'refs'):
+            dirs.append(root)
+            prefix = Path(root).relative_to(self.git_dir).as_posix()
+            for name in files:
+                try:
+                    with open(os.path.join(root, name)) as f:
+                        refs[f'{prefix}/{name}'] = f.read().strip()
+                except (FileNotFoundError, IsADirectoryError):
+                    continue
+
+        config = self.git_dir / 'config'
+        remotes = set(REMOTE_SECTION.findall(
+            config.read_text())) if config.exists() else set()
+
+        self._refs, self._remotes, self._dirs = refs, remotes, dirs
+        self._stamp = self._current_stamp()
+        self._loaded_at = loaded_at
+        LOGGER.debug('Loaded %s refs of %s.', len(refs), self.git_dir)
+
+    @property
+    def refs(self):
+        '''Mapping of full ref names to shas, or `ref: ...` for symbolic ones.
+        '''
+        if not self._is_fresh():
+            self._load()
+        return self._refs
+
+    @property
+    def remotes(self):
+        if not self._is_fresh():
+            self._load()
+        return self._remotes
+
+    def sha(self, ref):
+        return self.refs.get(ref)
+
+    def branches(self):
+        return [
+            ref[len('refs/heads/'):] for ref in self.refs
+            if ref.startswith('refs/heads/')
+        ]
+
+    def has_branch(self, branch):
+        return f'refs/heads/{branch}' in self.refs
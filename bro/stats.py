@@ -0,0 +1,172 @@
+'''This module computes statistics of pull requests and branches from local
+objects.
+Figures of pull requests are those github reports, commits, additions,
+deletions and changed files, taken from the diff of head against its merge
+base with base. Figures of branches are how many commits they are ahead of
+and behind others. Both are cached by the pair of shas, which fixes them, so
+a pair is only ever computed once.
+'''
+
+import json
+import sqlite3
+from collections import namedtuple
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+
+from bro import DATA_DIR
+
+LOGGER = getLogger(__name__)
+
+
+class DiffStats(namedtuple('DiffStats', 'commits files')):
+    '''Commits of head not in base, and (path, additions, deletions) of
+    every changed file. Binary files count no lines.
+    '''
+
+    @property
+    def additions(self):
+        return sum(additions for _, additions, _ in self.files)
+
+    @property
+    def deletions(self):
+        return sum(deletions for _, _, deletions in self.files)
+
+    @property
+    def changed_files(self):
+        return len(self.files)
+
+    def directories(self, depth=1):
+        '''Additions, deletions and changed files per directory, keeping
+        depth levels of paths. Files at the top level go under `.`.
+        Return:
+            Pairs of directory and (additions, deletions, changed files),
+            sorted by directory.
+        '''
+        totals = {}
+        for path, additions, deletions in self.files:
+            parts = path.split('/')[:-1][:depth]
+            directory = '/'.join(parts) or '.'
+            adds, dels, files = totals.get(directory, (0, 0, 0))
+            totals[directory] = (adds + additions, dels + deletions,
+                                 files + 1)
+        return sorted(totals.items())
+
+
+class StatsCache:
+    '''Diff stats of (base sha, head sha) pairs and ahead and behind counts
+    of (left sha, right sha) pairs, kept forever as the pairs determine them.
+    '''
+
+    def __init__(self, path=None):
+        self.path = Path(path or DATA_DIR / 'stats.sqlite')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = self.misses = 0
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(str(self.path),
+                                   check_same_thread=False,
+                                   isolation_level=None,
+                                   timeout=30)
+        self._db.execute('''CREATE TABLE IF NOT EXISTS stats (
+                base TEXT,
+                head TEXT,
+                commits INTEGER,
+                files TEXT,
+                PRIMARY KEY (base, head))''')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS counts (
+                left TEXT,
+                right TEXT,
+                ahead INTEGER,
+                behind INTEGER,
+                PRIMARY KEY (left, right))''')
+
+    def __str__(self):
+        return 'StatsCache:<{path}>'.format(path=self.path)
+
+    __repr__ = __str__
+
+    def get(self, base, head):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT commits, files FROM stats WHERE base = ? AND head = ?',
+                (base, head)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        commits, files = row
+        return DiffStats(commits, [tuple(f) for f in json.loads(files)])
+
+    def put(self, base, head, stats):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?)',
+                (base, head, stats.commits, json.dumps(stats.files)))
+
+    def get_counts(self, pairs):
+        '''Ahead and behind counts of the cached ones of pairs.'''
+        counts = {}
+        with self._lock:
+            for left, right in pairs:
+                row = self._db.execute(
+                    'SELECT ahead, behind FROM counts '
+                    'WHERE left = ? AND right = ?', (left, right)).fetchone()
+                if row:
+                    counts[left, right] = row
+        self.hits += len(counts)
+        self.misses += len(pairs) - len(counts)
+        return counts
+
+    def put_counts(self, counts):
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                'INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?)',
+                [pair + tuple(count) for pair, count in counts.items()])
+            self._db.execute('COMMIT')
+
+    def clear(self):
+        with self._lock:
+            self._db.executescript('DELETE FROM stats; DELETE FROM counts;')
+
+    def close(self):
+        self._db.close()
+
+
+def diff_stats(repo, base, head, cache=None):
+    '''Stats of head against base, both full ref names or shas, computed
+    by git only when the cache misses.
+    Return:
+        The shas of base and head, and their `DiffStats`.
+    '''
+    base_sha, head_sha = repo.resolve(base), repo.resolve(head)
+    stats = cache.get(base_sha, head_sha) if cache else None
+    if stats is None:
+        stats = DiffStats(*repo.numstat(base_sha, head_sha))
+        if cache:
+            cache.put(base_sha, head_sha, stats)
+        LOGGER.info(f'Computed stats of {head} against {base}.')
+    return base_sha, head_sha, stats
+
+
+def ahead_behind(repo, pairs, cache=None):
+    '''Ahead and behind counts of (left sha, right sha) pairs, walking
+    git only for pairs the cache misses.
+    Return:
+        Dict of pairs to (ahead, behind) counts.
+    '''
+    pairs = set(pairs)
+    counts = cache.get_counts(pairs) if cache else {}
+    missing = [pair for pair in pairs if pair not in counts]
+    for left, right in missing:
+        if left == right:
+            counts[left, right] = (0, 0)
+    missing = [pair for pair in missing if pair not in counts]
+    if missing:
+        computed = repo.ahead_behind(missing)
+        if cache:
+            cache.put_counts(computed)
+        counts.update(computed)
+        LOGGER.info(f'Counted commits of {len(missing)} pairs of branches.')
+    return counts
@@ -0,0 +1,170 @@
+'''This module keeps a local index of pull requests in sqlite.
+The index is filled once and then synced incrementally: pull requests are
+listed by update time, newest first, and listing stops at the newest update
+already stored.
+'''
+
+import json
+import sqlite3
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import time
+
+from bro import DATA_DIR
+
+LOGGER = getLogger(__name__)
+
+
+class PullRequestStore:
+    '''Pull requests of any number of repos, with their sync watermarks.'''
+
+    def __init__(self, path=None):
+        self.path = Path(path or DATA_DIR / 'pulls.sqlite')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(str(self.path),
+                                   check_same_thread=False,
+                                   isolation_level=None,
+                                   timeout=30)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS pulls (
+                owner TEXT,
+                repo TEXT,
+                number INTEGER,
+                state TEXT,
+                author TEXT,
+                updated_at TEXT,
+                data TEXT,
+                PRIMARY KEY (owner, repo, number));
+            CREATE INDEX IF NOT EXISTS pulls_author
+                ON pulls (owner, repo, author, state);
+            CREATE TABLE IF NOT EXISTS reviewers (
+                owner TEXT,
+                repo TEXT,
+                number INTEGER,
+                login TEXT,
+                PRIMARY KEY (owner, repo, login, number));
+            CREATE TABLE IF NOT EXISTS syncs (
+                owner TEXT,
+                repo TEXT,
+                watermark TEXT,
+                synced_at REAL,
+                PRIMARY KEY (owner, repo));''')
+
+    def __str__(self):
+        return 'PullRequestStore:<{path}>'.format(path=self.path)
+
+    __repr__ = __str__
+
+    def last_sync(self, owner, repo):
+        '''Newest update stored and time of the last sync, or Nones.'''
+        with self._lock:
+            row = self._db.execute(
+                'SELECT watermark, synced_at FROM syncs '
+                'WHERE owner = ? AND repo = ?', (owner, repo)).fetchone()
+        return row or (None, None)
+
+    def upsert(self, owner, repo, pull_requests, watermark=None):
+        '''Store pull requests and move the watermark in one transaction.'''
+        rows, reviewers = [], []
+        for pr in pull_requests:
+            rows.append((owner, repo, pr.number, pr.state, pr.user['login'],
+                         pr.updated_at, json.dumps(pr.values())))
+            reviewers.extend((owner, repo, pr.number, reviewer['login'])
+                             for reviewer in pr.requested_reviewers)
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany(
+                    'DELETE FROM reviewers '
+                    'WHERE owner = ? AND repo = ? AND number = ?',
+                    [row[:3] for row in rows])
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO pulls '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO reviewers VALUES (?, ?, ?, ?)',
+                    reviewers)
+                if watermark is not None:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?)',
+                        (owner, repo, watermark, time()))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def _select(self, sql, params):
+        from bro.hub import PullRequest
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [PullRequest.from_values(json.loads(data)) for data, in rows]
+
+    def get(self, owner, repo, number):
+        pull_requests = self._select(
+            'SELECT data FROM pulls '
+            'WHERE owner = ? AND repo = ? AND number = ?',
+            (owner, repo, number))
+        return pull_requests[0] if pull_requests else None
+
+    def authored(self, owner, repo, login, state='open'):
+        '''Pull requests of an author, recently updated first.'''
+        return self._select(
+            'SELECT data FROM pulls WHERE owner = ? AND repo = ? '
+            'AND author = ? AND state = ? ORDER BY updated_at DESC',
+            (owner, repo, login, state))
+
+    def review_requests(self, owner, repo, login):
+        '''Open pull requests asking login for a review.'''
+        return self._select(
+            'SELECT data FROM pulls JOIN reviewers USING '
+            '(owner, repo, number) WHERE owner = ? AND repo = ? '
+            "AND login = ? AND state = 'open' ORDER BY updated_at DESC",
+            (owner, repo, login))
+
+    def clear(self):
+        with self._lock:
+            self._db.executescript('DELETE FROM pulls; DELETE FROM reviewers; '
+                                   'DELETE FROM syncs;')
+
+    def close(self):
+        self._db.close()
+
+
+def sync(store, owner, repo, auth):
+    '''Store pull requests updated since the last sync.
+    Open ones are then refreshed with one graphql query per chunk, as
+    listings of github leave out whether a pull request is mergeable.
+    Return:
+        Number of pull requests updated.
+    '''
+    from bro.hub import get_pull_requests, list_pull_requests
+
+    watermark, _ = store.last_sync(owner, repo)
+    changed = []
+    for pr in list_pull_requests(owner,
+                                 repo,
+                                 auth,
+                                 state='all',
+                                 sort='updated',
+                                 direction='desc'):
+        # Equal times are listed again, another update may share the second.
+        if watermark and pr.updated_at < watermark:
+            break
+        changed.append(pr)
+
+    open_numbers = [pr.number for pr in changed if pr.state == 'open']
+    refreshed = {
+        pr.number: pr
+        for pr in get_pull_requests(owner, repo, open_numbers, auth)
+    } if open_numbers else {}
+    changed = [refreshed.get(pr.number, pr) for pr in changed]
+
+    newest = max((pr.updated_at for pr in changed), default=watermark)
+    store.upsert(owner, repo, changed, watermark=newest or '')
+    LOGGER.info(f'Synced {len(changed)} pull requests of {owner}/{repo}.')
+    return len(changed)
@@ -0,0 +1,203 @@
+'''This module records timing spans of git and http calls.
+Tracing is off unless enabled, in which case every span costs a global lookup
+and nothing else. Traces are written in the chrome trace event format, which
+both `chrome://tracing` and perfetto open.
+'''
+
+import json
+import os
+import threading
+from functools import wraps
+from time import perf_counter_ns
+
+# The active tracer, None while tracing is disabled.
+TRACER = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.cat, self.start,
+                           perf_counter_ns() - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        '''Add arguments known only after the span started.'''
+        self.args.update(args)
+
+
+class Tracer:
+    '''Collector of spans of all threads.'''
+
+    def __init__(self):
+        self.events = []
+        self.started = perf_counter_ns()
+        self._hooks = []
+
+    def __str__(self):
+        return 'Tracer:<{count} spans>'.format(count=len(self.events))
+
+    __repr__ = __str__
+
+    def record(self, name, cat, start, duration, args):
+        # Appending to a list is atomic, no lock is needed among threads.
+        self.events.append((name, cat, start, duration,
+                            threading.get_ident(), args))
+
+    def hook(self, owner, attr, name, cat, describe=None):
+        '''Wrap a method of a third party class in spans until disabled.
+        describe takes the arguments of a call and returns the name and
+        arguments of its span.
+        '''
+        original = getattr(owner, attr)
+
+        @wraps(original)
+        def wrapper(*args, **kwargs):
+            label, span_args = describe(*args, **kwargs) if describe else (
+                name, {})
+            with Span(self, label, cat, span_args):
+                return original(*args, **kwargs)
+
+        setattr(owner, attr, wrapper)
+        self._hooks.append((owner, attr, original))
+
+    def unhook(self):
+        while self._hooks:
+            owner, attr, original = self._hooks.pop()
+            setattr(owner, attr, original)
+
+    def trace_events(self):
+        pid = os.getpid()
+        return [{
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start - self.started) / 1000,
+            'dur': duration / 1000,
+            'pid': pid,
+            'tid': tid,
+            'args': args
+        } for name, cat, start, duration, tid, args in self.events]
+
+    def write(self, path):
+        '''Write a chrome trace of the recorded spans.'''
+        with open(path, 'w') as f:
+            json.dump(
+                {
+                    'traceEvents': self.trace_events(),
+                    'displayTimeUnit': 'ms'
+                }, f)
+
+    def summary(self, limit=10):
+        '''Rows of (name, calls, total ms, max ms) of the slowest spans.'''
+        stats = {}
+        for name, _, _, duration, _, _ in self.events:
+            calls, total, longest = stats.get(name, (0, 0, 0))
+            stats[name] = (calls + 1, total + duration,
+                           max(longest, duration))
+        rows = sorted(stats.items(), key=lambda item: -item[1][1])[:limit]
+        return [(name, calls, total / 1e6, longest / 1e6)
+                for name, (calls, total, longest) in rows]
+
+
+def span(name, cat='bro', **args):
+    '''Context manager timing a block, a no-op while tracing is disabled.'''
+    if TRACER is None:
+        return NULL_SPAN
+    return Span(TRACER, name, cat, args)
+
+
+def traced(cat='bro'):
+    '''Decorate a method to time its calls as `Class.method`.'''
+    def decorator(func):
+        name = func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if TRACER is None:
+                return func(*args, **kwargs)
+            call_args = {'args': [str(arg) for arg in args[1:]]}
+            call_args.update((k, str(v)) for k, v in kwargs.items())
+            with Span(TRACER, name, cat, call_args):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _describe_git(self, command, *args, as_process=False, **kwargs):
+    '''Name a git call after its subcommand, like `git fetch`.
+    Calls run as a process return once it starts, their output is consumed
+    within the span of the caller.
+    '''
+    if not isinstance(command, (list, tuple)):
+        return 'git', {'command': str(command)}
+    span_args = {'command': ' '.join(map(str, command))}
+    if as_process:
+        span_args['as_process'] = True
+    words = iter(command[1:])
+    for word in words:
+        if word in ('-c', '-C'):
+            next(words, None)
+        elif not word.startswith('-'):
+            return f'git {word}', span_args
+    return 'git', span_args
+
+
+def enable():
+    '''Start tracing, including subprocesses of GitPython and connections
+    of urllib3.
+    '''
+    global TRACER
+    if TRACER is not None:
+        return TRACER
+    import socket
+
+    from git.cmd import Git
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+
+    tracer = Tracer()
+    tracer.hook(Git, 'execute', 'git', 'git', describe=_describe_git)
+    tracer.hook(socket, 'getaddrinfo', 'dns', 'http')
+    tracer.hook(HTTPConnection, '_new_conn', 'tcp connect', 'http')
+    tracer.hook(HTTPSConnection, 'connect', 'tls connect', 'http')
+    TRACER = tracer
+    return tracer
+
+
+def disable():
+    '''Stop tracing and return the tracer with recorded spans.'''
+    global TRACER
+    tracer, TRACER = TRACER, None
+    if tracer is not None:
+        tracer.unhook()
+    return tracer
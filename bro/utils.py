@@ -1,8 +1,6 @@
 from functools import partial, wraps
 from os import environ
-from subprocess import call
 from sys import exit
-from tempfile import NamedTemporaryFile
 
 from click import secho
 
@@ -40,13 +38,16 @@ def validate_branch(repo, *branches):
 def validate_remote(repo, *remotes):
     try:
         for remote in remotes:
-            repo.get_repo(remote)
+            repo.get_remote(remote)
     except RemoteNotFound:
         print_error(f'Remote {remote} does not exist.')
         exit(1)
 
 
 def pr_msg_editor():
+    from subprocess import call
+    from tempfile import NamedTemporaryFile
+
     EDITOR = environ.get('EDITOR', 'vim')
     msg = '# Title\n\n# Message'
     with NamedTemporaryFile(prefix='GITBRO_EDIT_PR') as tmp_file:
@@ -0,0 +1,93 @@
+'''This module runs git workflows across many repos in parallel.
+A workspace is a manifest file listing one repo path per line.
+'''
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+
+from bro import DATA_DIR
+from bro.exceptions import GitError
+
+WORKSPACE_FILE = DATA_DIR / 'workspace'
+
+RepoResult = namedtuple('RepoResult', 'path ok message elapsed')
+
+
+def read_manifest(manifest):
+    '''Read repo paths from a manifest, skipping blank lines and comments.
+    Relative paths are relative to the manifest.
+    '''
+    manifest = Path(manifest).expanduser().absolute()
+    paths = []
+    for line in manifest.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        path = Path(line).expanduser()
+        paths.append(str(path if path.is_absolute() else manifest.parent /
+                         path))
+    return paths
+
+
+def pickup(repo, config, branch, since):
+    repo.get_branch(since)
+    repo.fetch(config['upstream_remote'], since, **config.get('fetch', {}))
+    remote_branch = f'{config["upstream_remote"]}/{since}'
+    repo.branch_checkout(branch, create=True, start_point=remote_branch)
+    return f'Started branch {branch} from {remote_branch}.'
+
+
+def pipeline(repo, config, through, merge=False):
+    repo.get_branch(through)
+    repo.pull(config['upstream_remote'], through, rebase=not merge)
+    method = 'merged' if merge else 'rebased'
+    return f'Synced from {config["upstream_remote"]}/{through} ({method}).'
+
+
+def putout(repo, config, branch, keep_remote=False):
+    repo.get_branch(branch)
+    repo.branch_checkout(config['main_branch'])
+    repo.pull(config['upstream_remote'], config['main_branch'])
+    repo.branch_delete(branch)
+    if not keep_remote:
+        repo.push(config['origin_remote'], branch, delete=True)
+        return f'Deleted branch {branch} and its remote.'
+    return f'Deleted local branch {branch}.'
+
+
+TASKS = {'pickup': pickup, 'pipeline': pipeline, 'putout': putout}
+
+
+def run_task(task, path, config, *args):
+    '''Run a task on one repo, catching its errors into the result.'''
+    # Imported here so that only worker processes pay for loading git.
+    from bro.git import GitRepo
+
+    start = perf_counter()
+    try:
+        message = TASKS[task](GitRepo.from_path(path), config, *args)
+        ok = True
+    except GitError as e:
+        message, ok = e.message, False
+    except Exception as e:
+        # Anything else is a failure of this repo only, not of the run.
+        message, ok = f'{type(e).__name__}: {e}', False
+    return RepoResult(path, ok, message, perf_counter() - start)
+
+
+def run(task, paths, config, *args, workers=None):
+    '''Run a task on many repos with a pool of processes.
+    Yield:
+        RepoResult of every repo as soon as it finishes.
+    '''
+    workers = workers or min(len(paths), cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [
+            executor.submit(run_task, task, path, config, *args)
+            for path in paths
+        ]
+        for future in as_completed(futures):
+            yield future.result()
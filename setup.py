@@ -14,11 +14,14 @@ setup(name=NAME,
       author_email=EMAIL,
       python_requires='>=3.7.0',
       url=URL,
-      packages=find_packages(exclude=('tests', )),
+      packages=find_packages(exclude=('tests', 'benchmarks')),
       entry_points={
-          'console_scripts': ['bro=bro.cli:bro'],
+          'console_scripts': ['bro=bro.daemon:main'],
       },
       install_requires=['requests', 'click', 'tabulate'],
-      extras_require={'test': ['pytest', 'pytest-cov', 'pytest-mock']},
+      extras_require={
+          'fast': ['orjson'],
+          'test': ['pytest', 'pytest-cov', 'pytest-mock']
+      },
       include_package_data=True,
       license='MIT')
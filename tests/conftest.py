@@ -1,6 +1,11 @@
+import json
 import os
 import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
+import git
 import pytest
 
 from bro.git import GitRepo
@@ -19,3 +24,80 @@ def git_repo(mocker):
     repo = GitRepo(tmp_test_dir)
     repo.executor = mocker.Mock()
     return repo
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.requests.append(
+            (self.command, self.path, dict(self.headers), body))
+
+        route = self.server.routes.get((self.command, self.path.split('?')[0]))
+        if callable(route):
+            route = route(self)
+        status, headers, payload = route or (404, {}, {'message': 'Not Found'})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        data = payload if isinstance(payload, bytes) else json.dumps(
+            payload).encode()
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def github_server():
+    '''A local stand-in of the github api.
+    Register responses in `server.routes[(method, path)]` as a tuple of
+    (status, headers, payload) or a callable taking the handler.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGithubHandler)
+    server.routes, server.requests, server.latency = {}, [], 0
+    server.url = 'http://127.0.0.1:%s' % server.server_port
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_clone(tmp_path):
+    '''Factory of repos cloned from one upstream repo, which has `upstream`
+    and `origin` remotes and a commit on master.
+    '''
+    env = {
+        'GIT_AUTHOR_NAME': 'bro',
+        'GIT_AUTHOR_EMAIL': 'bro@gitbro',
+        'GIT_COMMITTER_NAME': 'bro',
+        'GIT_COMMITTER_EMAIL': 'bro@gitbro'
+    }
+    seed = git.Repo.init(tmp_path / 'seed', initial_branch='master')
+    (tmp_path / 'seed' / 'README.md').write_text('# gitbro\n')
+    seed.index.add(['README.md'])
+    seed.index.commit('Initial commit.')
+    upstream = git.Repo.clone_from(seed.working_dir,
+                                   tmp_path / 'upstream.git',
+                                   bare=True)
+    origin = upstream.clone(tmp_path / 'origin.git', bare=True)
+
+    def make(name):
+        clone = upstream.clone(tmp_path / name, origin='upstream')
+        clone.create_remote('origin', origin.working_dir)
+        with clone.config_writer() as config:
+            config.set_value('user', 'name', env['GIT_AUTHOR_NAME'])
+            config.set_value('user', 'email', env['GIT_AUTHOR_EMAIL'])
+        return clone
+
+    make.upstream, make.origin = upstream, origin
+    return make
@@ -0,0 +1,346 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from bro import api as api_module
+from bro import hub
+from bro.api import (PRIORITY_BULK, PRIORITY_INTERACTIVE, API, AsyncAPI,
+                     RateLimitScheduler, compile_route, iter_json_items,
+                     priority)
+from bro.cache import ResponseCache
+
+
+@pytest.fixture
+def async_api(github_server, monkeypatch):
+    api = AsyncAPI(github_server.url, concurrency=4)
+    monkeypatch.setattr(hub, 'GITHUB_ASYNC_API', api)
+    yield api
+    api.close()
+
+
+class TestAPI:
+    def test_chaining(self, github_server):
+        github_server.routes[('GET', '/repos/bro/gitbro/pulls/1')] = (
+            200, {}, {
+                'number': 1
+            })
+        api = API(github_server.url)
+        assert api.repos.path('bro', 'gitbro').pulls.path('1').get() == {
+            'number': 1
+        }
+
+    def test_route_immutable(self):
+        api = API('https://api.github.com')
+        repo = api.repos.path('bro', 'gitbro')
+        pulls, issues = repo.pulls, repo.issues
+
+        assert repo.build_url_path() == (
+            'https://api.github.com/repos/bro/gitbro')
+        assert pulls.path(1).build_url_path(append_slash=True) == (
+            'https://api.github.com/repos/bro/gitbro/pulls/1/')
+        assert issues.build_url_path() == (
+            'https://api.github.com/repos/bro/gitbro/issues')
+
+    def test_route_cached(self):
+        api = API('https://api.github.com')
+        compile_route.cache_clear()
+        for n in range(10):
+            api.repos.path('bro', 'gitbro').pulls.path(n).build_url_path()
+
+        assert compile_route.cache_info().misses == 1
+        assert compile_route.cache_info().hits == 9
+
+    def test_concurrent_chaining(self):
+        api = API('https://api.github.com')
+
+        def build(n):
+            return api.repos.path('bro', f'repo{n}').pulls.path(
+                n).build_url_path()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            urls = list(executor.map(build, range(200)))
+
+        assert urls == [
+            f'https://api.github.com/repos/bro/repo{n}/pulls/{n}'
+            for n in range(200)
+        ]
+
+
+class TestAsyncAPI:
+    def test_chaining(self, github_server, async_api):
+        github_server.routes[('GET', '/repos/bro/gitbro')] = (200, {}, {
+            'name': 'gitbro'
+        })
+        coro = async_api.repos.path('bro', 'gitbro').get()
+        assert asyncio.run(coro) == {'name': 'gitbro'}
+
+    def test_response_type(self, github_server, async_api):
+        github_server.routes[('GET', '/zen')] = (200, {}, b'Keep it simple.')
+        text = asyncio.run(async_api.zen.get(response_type='text'))
+        assert text == 'Keep it simple.'
+
+    def test_bounded_concurrency(self, github_server, async_api):
+        github_server.latency = 0.2
+        for n in range(8):
+            github_server.routes[('GET', f'/repos/bro/gitbro/pulls/{n}')] = (
+                200, {}, {
+                    'number': n,
+                    'head': {
+                        'label': 'bro:dev'
+                    },
+                    'base': {
+                        'label': 'bro:master'
+                    }
+                })
+
+        async def fan_out():
+            return await asyncio.gather(*[
+                hub.async_get_pull_request('bro', 'gitbro', str(n), None)
+                for n in range(8)
+            ])
+
+        start = time.monotonic()
+        prs = asyncio.run(fan_out())
+        elapsed = time.monotonic() - start
+
+        assert [pr.number for pr in prs] == list(range(8))
+        # 8 calls with concurrency 4 take two rounds of latency.
+        assert 0.4 <= elapsed < 0.8
+
+    def test_merge_pull_request(self, github_server, async_api):
+        github_server.routes[('PUT', '/repos/bro/gitbro/pulls/3/merge')] = (
+            200, {}, {
+                'merged': True
+            })
+        resp = asyncio.run(
+            hub.async_merge_pull_request('bro',
+                                         'gitbro',
+                                         '3',
+                                         auth=('bro', 'token'),
+                                         commit_message='Ship it.'))
+        assert resp == {'merged': True}
+
+        method, path, headers, body = github_server.requests[-1]
+        assert 'Authorization' in headers
+        assert b'Ship it.' in body
+
+
+class TestDecoding:
+    ITEMS = [{
+        'title': 'Tschüß',
+        'n': [1, 2.5]
+    }, 12345, 1500.0, 2.5e-08, 'a, ]', None, []]
+
+    @pytest.mark.parametrize('size', [1, 2, 3, 7, 1024])
+    def test_iter_json_items(self, size):
+        body = json.dumps(self.ITEMS, ensure_ascii=False).encode()
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        assert list(iter_json_items(chunks)) == self.ITEMS
+        assert list(iter_json_items([b' [ ] '])) == []
+        # Numbers split after `.`, `e` or `e+` are not taken for ints.
+        body = b'[1500.0 , 1e+5]'
+        items = list(
+            iter_json_items(body[i:i + size]
+                            for i in range(0, len(body), size)))
+        assert items == [1500.0, 100000.0]
+        assert all(isinstance(item, float) for item in items)
+
+    @pytest.mark.parametrize('body',
+                             [b'{"a": 1}', b'[1, 2', b'', b'[1 2]', b'[1}'])
+    def test_iter_json_items_invalid(self, body):
+        with pytest.raises(ValueError):
+            list(iter_json_items([body]))
+
+    def test_items(self, github_server):
+        github_server.routes[('GET', '/pulls')] = (200, {}, self.ITEMS)
+        items = API(github_server.url).pulls.get(response_type='items')
+        assert not isinstance(items, list)
+        assert list(items) == self.ITEMS
+
+    @pytest.mark.parametrize('backend', [json.loads, api_module.json_loads])
+    def test_json(self, github_server, monkeypatch, backend):
+        monkeypatch.setattr(api_module, 'json_loads', backend)
+        github_server.routes[('GET', '/pulls')] = (200, {}, self.ITEMS)
+        github_server.routes[('DELETE', '/pulls')] = (204, {}, b'')
+        api = API(github_server.url)
+        assert api.pulls.get() == self.ITEMS
+        assert api.pulls.delete() is None
+
+    def test_debug_preview(self, github_server, monkeypatch, caplog):
+        monkeypatch.setattr(api_module, 'DEBUG_BODY_LIMIT', 10)
+        github_server.routes[('GET', '/blob')] = (200, {}, b'x' * 100)
+        with caplog.at_level(logging.DEBUG, logger='bro.api'):
+            API(github_server.url).blob.get(response_type='status_code')
+        assert 'Raw response retrived: xxxxxxxxxx... (100 bytes)' in (
+            caplog.text)
+
+
+class TestResponseCache:
+    @pytest.fixture
+    def cache(self, tmp_path):
+        cache = ResponseCache(tmp_path / 'cache.sqlite', max_size=1024)
+        yield cache
+        cache.close()
+
+    def etag_route(self, etag, payload):
+        def route(handler):
+            if handler.headers.get('If-None-Match') == etag:
+                return 304, {'ETag': etag}, b''
+            return 200, {'ETag': etag}, payload
+
+        return route
+
+    def test_revalidate(self, github_server, cache):
+        github_server.routes[('GET', '/repos/bro/gitbro')] = self.etag_route(
+            '"v1"', {'name': 'gitbro'})
+        api = API(github_server.url, cache=cache)
+
+        for _ in range(3):
+            assert api.repos.path('bro', 'gitbro').get() == {'name': 'gitbro'}
+
+        assert cache.stats == {'hits': 2, 'misses': 1, 'evictions': 0}
+        assert github_server.requests[-1][2]['If-None-Match'] == '"v1"'
+
+    def test_keyed_by_identity(self, github_server, cache):
+        github_server.routes[('GET', '/user')] = self.etag_route(
+            '"v1"', {'login': 'bro'})
+        api = API(github_server.url, cache=cache)
+
+        api.user.get(auth=('bro', 'token'))
+        api.user.get(auth=('sis', 'token'))
+        assert cache.stats['misses'] == 2
+        assert 'If-None-Match' not in github_server.requests[-1][2]
+
+    def test_evict_lru(self, github_server, cache):
+        for n in range(3):
+            github_server.routes[('GET', f'/blob/{n}')] = self.etag_route(
+                f'"{n}"', b'x' * 400)
+        api = API(github_server.url, cache=cache)
+
+        api.blob.path('0').get(response_type='text')
+        api.blob.path('1').get(response_type='text')
+        api.blob.path('0').get(response_type='text')
+        api.blob.path('2').get(response_type='text')
+
+        assert cache.evictions == 1
+        assert cache.size <= 1024
+        # Blob 1 is the least recently used one.
+        assert cache.get(cache.make_key(f'{github_server.url}/blob/1')) is None
+        assert cache.get(cache.make_key(f'{github_server.url}/blob/0'))
+
+
+class TestRateLimitScheduler:
+    def test_pace_by_budget(self, github_server):
+        github_server.routes[('GET', '/user')] = (200, {
+            'X-RateLimit-Remaining': '10',
+            'X-RateLimit-Reset': str(int(time.time()) + 1),
+        }, {})
+        scheduler = RateLimitScheduler()
+        api = API(github_server.url, scheduler=scheduler)
+
+        api.user.get()
+        bucket = scheduler.buckets['core']
+        assert bucket.remaining == 10
+        assert bucket.capacity == 10
+        assert 0 < bucket.rate <= 10
+
+    def test_full_budget_no_delay(self):
+        scheduler = RateLimitScheduler()
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers.update({
+            'X-RateLimit-Remaining': '4900',
+            'X-RateLimit-Reset': str(int(time.time()) + 3600),
+        })
+        assert not scheduler.observe(resp)
+
+        start = time.monotonic()
+        for _ in range(200):
+            scheduler.acquire()
+        assert time.monotonic() - start < 0.5
+        assert 4700 <= scheduler.buckets['core'].tokens < 4701
+
+    def test_pace_below_low_water(self):
+        scheduler = RateLimitScheduler(burst=5, low_water=100)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers.update({
+            'X-RateLimit-Remaining': '50',
+            'X-RateLimit-Reset': str(int(time.time()) + 3600),
+        })
+        scheduler.observe(resp)
+        assert scheduler.buckets['core'].capacity == 5
+
+    def test_buckets_by_resource(self, github_server):
+        reset = str(int(time.time()) + 3600)
+        github_server.routes[('POST', '/graphql')] = (200, {
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': reset,
+            'X-RateLimit-Resource': 'graphql',
+        }, {})
+        github_server.routes[('GET', '/user')] = (200, {
+            'X-RateLimit-Remaining': '4000',
+            'X-RateLimit-Reset': reset,
+            'X-RateLimit-Resource': 'core',
+        }, {})
+        scheduler = RateLimitScheduler()
+        api = API(github_server.url, scheduler=scheduler)
+
+        api.graphql.post(json={})
+        assert scheduler.buckets['graphql'].remaining == 0
+        # Rest calls go on while the graphql budget is out.
+        start = time.monotonic()
+        api.user.get()
+        assert time.monotonic() - start < 1
+        assert scheduler.buckets['core'].remaining == 4000
+
+    def test_requeue_on_retry_after(self, github_server):
+        responses = iter([(429, {'Retry-After': '1'}, {}), (200, {}, {})])
+        github_server.routes[('GET', '/user')] = lambda _: next(responses)
+        api = API(github_server.url, scheduler=RateLimitScheduler())
+
+        start = time.monotonic()
+        assert api.user.get() == {}
+        assert time.monotonic() - start >= 1
+        assert len(github_server.requests) == 2
+
+    def test_pause_until_reset(self):
+        scheduler = RateLimitScheduler()
+        resp = requests.Response()
+        resp.status_code = 403
+        resp.headers.update({
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': str(int(time.time()) + 30),
+        })
+
+        assert scheduler.observe(resp)
+        assert scheduler.buckets['core'].paused_until - time.monotonic() > 25
+        assert scheduler.paused_until == 0
+
+    def test_interactive_first(self):
+        scheduler = RateLimitScheduler()
+        bucket = scheduler.bucket()
+        bucket.rate, bucket.tokens = 10, 0
+        served = []
+
+        def request(level):
+            with priority(level):
+                scheduler.acquire()
+            served.append(level)
+
+        bulk = threading.Thread(target=request, args=(PRIORITY_BULK, ))
+        bulk.start()
+        time.sleep(0.02)
+        interactive = threading.Thread(target=request,
+                                       args=(PRIORITY_INTERACTIVE, ))
+        interactive.start()
+        bulk.join()
+        interactive.join()
+
+        assert served == [PRIORITY_INTERACTIVE, PRIORITY_BULK]
@@ -0,0 +1,367 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import git
+import pytest
+from click.testing import CliRunner
+
+from bro import cli
+
+# Budget of importing bro.cli in microseconds, click itself takes most of it.
+IMPORT_BUDGET = 100 * 1000
+HEAVY_MODULES = ('git', 'requests', 'tabulate', 'bro.git', 'bro.hub')
+
+
+def import_time(module):
+    '''Cumulative import time of a module in a fresh interpreter.'''
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True).stderr
+    pattern = rf'^import time:\s+\d+ \|\s+(\d+) \| {re.escape(module)}$'
+    return int(re.search(pattern, output, re.MULTILINE).group(1))
+
+
+def test_import_time():
+    assert min(import_time('bro.cli') for _ in range(3)) < IMPORT_BUDGET
+
+
+def test_lazy_imports():
+    code = ('import sys, bro.cli; '
+            f'print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules])')
+    output = subprocess.run([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE,
+                            check=True,
+                            universal_newlines=True).stdout
+    assert output.strip() == ''
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    config_file = tmp_path / '.config/bro'
+    monkeypatch.setattr(cli, 'CONFIG_FILE', config_file)
+    return config_file
+
+
+@pytest.mark.parametrize('args', [['--help'], ['pu', '--help'],
+                                  ['pull-request', '--help']])
+def test_help_outside_repo(args, tmp_path, config_file):
+    result = CliRunner().invoke(cli.bro, ['--path', str(tmp_path)] + args)
+    assert result.exit_code == 0
+    assert 'Usage' in result.output
+
+
+def test_lazy_context(tmp_path, config_file):
+    ctx = cli.LazyContext(str(tmp_path))
+    assert ctx['config']['main_branch'] == 'master'
+    assert config_file.exists()
+    assert 'repo' not in ctx
+
+
+def test_profile(tmp_path, config_file, make_clone):
+    clone = make_clone('clone')
+    trace_file = tmp_path / 'trace.json'
+    result = CliRunner().invoke(cli.bro, [
+        '--path', clone.working_dir, '--profile',
+        str(trace_file), 'pickup', 'feature'
+    ])
+
+    assert result.exit_code == 0
+    names = {
+        event['name']
+        for event in json.loads(trace_file.read_text())['traceEvents']
+    }
+    assert {'bro pickup', 'GitRepo.fetch', 'git fetch'} <= names
+    assert 'GitRepo.fetch' in result.output
+
+
+def test_pickup_shallow(config_file, make_clone):
+    clone = make_clone('clone')
+    writer = make_clone('writer')
+    for n in range(3):
+        writer.git.commit('--allow-empty', '-m', f'Commit {n}.')
+    writer.git.push('upstream', 'master')
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text('[git]\nfetch_depth = 2\n')
+    args = ['--path', clone.working_dir, 'pickup']
+
+    result = CliRunner().invoke(cli.bro, args + ['dev', '--depth', '1'])
+    assert result.exit_code == 0, result.output
+    assert re.search(r'Fetched remote branch upstream/master \(.+ in .+s\)',
+                     result.output)
+    assert clone.git.rev_list('--count', 'upstream/master') == '1'
+
+    writer.git.commit('--allow-empty', '-m', 'Commit 3.')
+    writer.git.push('upstream', 'master')
+    result = CliRunner().invoke(cli.bro, args + ['dev2'])
+    assert result.exit_code == 0
+    assert clone.git.rev_list('--count', 'upstream/master') == '2'
+
+
+def test_pickup_existing(config_file, make_clone, mocker):
+    clone = make_clone('clone')
+    clone.create_head('taken')
+    args = ['--path', clone.working_dir, 'pickup']
+    fetch = mocker.spy(git.Remote, 'fetch')
+
+    result = CliRunner().invoke(cli.bro, args + ['new', 'taken'])
+    assert result.exit_code == 1
+    assert 'Branch taken already exists.' in result.output
+    result = CliRunner().invoke(cli.bro, args + ['new', 'other', 'new'])
+    assert result.exit_code == 1
+    assert 'Branch new already exists.' in result.output
+    # Nothing is fetched or created.
+    assert fetch.call_count == 0
+    assert [head.name for head in clone.heads] == ['master', 'taken']
+    assert clone.active_branch.name == 'master'
+
+
+def test_pull_request_get(config_file, make_clone, mocker):
+    clone = make_clone('clone')
+    writer = make_clone('writer')
+    for pr_id in (7, 8):
+        writer.git.commit('--allow-empty', '-m', f'Pull request {pr_id}.')
+        writer.git.push('upstream', f'HEAD:refs/pull/{pr_id}/head')
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text('[github]\nusername = bro\naccess_token = t\n')
+    args = ['--path', clone.working_dir, 'pull-request', 'get']
+    fetch = mocker.spy(git.Remote, 'fetch')
+
+    result = CliRunner().invoke(cli.bro, args + ['7', '8:review', '-w'])
+    assert result.exit_code == 0, result.output
+    assert fetch.call_count == 1
+    worktrees = os.path.join(os.path.dirname(clone.working_dir),
+                             'clone-worktrees')
+    assert f'Checked out review at {worktrees}/review.' in result.output
+    assert sorted(os.listdir(worktrees)) == ['pr-7', 'review']
+
+    # Worktrees are reused.
+    result = CliRunner().invoke(cli.bro, args + ['7', '8:review', '-w'])
+    assert result.exit_code == 0, result.output
+
+    result = CliRunner().invoke(cli.bro, args + ['7', 'feature', '-c'])
+    assert result.exit_code == 0, result.output
+    assert clone.active_branch.name == 'feature'
+
+    result = CliRunner().invoke(cli.bro, args + ['seven'])
+    assert result.exit_code == 2
+
+
+def test_pull_request_stats(config_file, make_clone, mocker, monkeypatch,
+                            tmp_path):
+    monkeypatch.setattr(cli, 'STATS_CACHE', tmp_path / 'stats.sqlite')
+    clone = make_clone('clone')
+    writer = make_clone('writer')
+    os.makedirs(os.path.join(writer.working_dir, 'src'))
+    with open(os.path.join(writer.working_dir, 'src', 'a.py'), 'w') as f:
+        f.write('a\nb\n')
+    writer.git.add('src/a.py')
+    writer.git.commit('-m', 'Pull request 7.')
+    writer.git.push('upstream', 'HEAD:refs/pull/7/head')
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text('[github]\nusername = bro\naccess_token = t\n')
+    args = ['--path', clone.working_dir, 'pull-request', 'stats', '7']
+    fetch = mocker.spy(git.Remote, 'fetch')
+
+    result = CliRunner().invoke(cli.bro, args + ['--dirs', '1'])
+    assert result.exit_code == 0, result.output
+    assert re.search(r'#7\s+1\s+1\s+\+2\s+-0\n\s+src\s+1\s+\+2\s+-0$',
+                     result.output, re.MULTILINE)
+    assert fetch.call_count == 1
+
+    # Fetched prs and base are not fetched again.
+    result = CliRunner().invoke(cli.bro, args + ['-f', 'jsonl'])
+    assert result.exit_code == 0, result.output
+    assert fetch.call_count == 1
+    stats = json.loads(result.output)
+    assert (stats['commits'], stats['additions'], stats['changed_files'],
+            stats['directories']) == (1, 2, 1, {})
+
+    result = CliRunner().invoke(cli.bro, args + ['--fetch'])
+    assert result.exit_code == 0, result.output
+    assert fetch.call_count == 3
+
+
+def test_status(config_file, make_clone, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, 'STATS_CACHE', tmp_path / 'stats.sqlite')
+    clone = make_clone('clone')
+    clone.git.checkout('-b', 'feature')
+    clone.git.commit('--allow-empty', '-m', 'Feature.')
+    clone.git.push('-u', 'origin', 'feature')
+    clone.git.commit('--allow-empty', '-m', 'Unpushed.')
+    clone.git.checkout('-b', 'local', 'master')
+    writer = make_clone('writer')
+    writer.git.commit('--allow-empty', '-m', 'Moved on.')
+    writer.git.push('upstream', 'master')
+    clone.git.fetch('upstream')
+
+    result = CliRunner().invoke(cli.bro, ['--path', clone.working_dir,
+                                          'status'])
+    assert result.exit_code == 0, result.output
+    rows = [line.split() for line in result.output.splitlines()[2:]]
+    assert rows == [['feature', 'origin/feature', '+1', '-0', '+2', '-1'],
+                    ['*', 'local', '+0', '-1'],
+                    ['master', 'upstream/master', '+0', '-1', '+0', '-1']]
+
+
+@pytest.mark.parametrize('args, error', [
+    (['comment', '1'], 'A --message is needed to comment.'),
+    (['merge'], 'Give pull request numbers, or --base/--head.'),
+])
+def test_pull_request_batch_usage(config_file, make_clone, args, error):
+    clone = make_clone('clone')
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text('[github]\nusername = bro\naccess_token = t\n')
+
+    result = CliRunner().invoke(
+        cli.bro,
+        ['--path', clone.working_dir, 'pull-request', 'batch', 'bro'] + args)
+    assert result.exit_code == 1
+    assert error in result.output
+
+
+def test_pull_request_batch_resume(config_file, make_clone, tmp_path,
+                                   monkeypatch):
+    from bro import hub
+    monkeypatch.setattr(cli, 'BATCH_JOURNAL_DIR', tmp_path / 'batch')
+    calls = []
+
+    def batch_pull_requests(owner, repo, auth, action, numbers, **kwargs):
+        calls.append(numbers)
+        for number in numbers:
+            yield hub.BatchResult(number, number != 12, 'Not mergeable.')
+
+    monkeypatch.setattr(hub, 'batch_pull_requests', batch_pull_requests)
+    clone = make_clone('clone')
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text('[github]\nusername = bro\naccess_token = t\n')
+    args = ['--path', clone.working_dir, 'pull-request', 'batch', 'bro',
+            'close']
+
+    result = CliRunner().invoke(cli.bro, args + ['#12', '13'])
+    assert result.exit_code == 2
+    assert calls == []
+
+    result = CliRunner().invoke(cli.bro, args + ['13', '9', '12'])
+    assert result.exit_code == 1
+    rows = [line.split()[:2] for line in result.output.splitlines()
+            if line.split()[0].isdigit()]
+    assert rows[:3] == [['9', 'ok'], ['12', 'failed'], ['13', 'ok']]
+
+    result = CliRunner().invoke(cli.bro, args + ['13', '9', '12', '--resume'])
+    assert calls[-1] == [12]
+    assert 'Skipped 2 done before.' in result.output
+
+
+def test_workspace_failed(config_file, make_clone, tmp_path):
+    clone = make_clone('clone')
+    manifest = tmp_path / 'workspace'
+    manifest.write_text('clone\nmissing\n')
+
+    result = CliRunner().invoke(cli.bro, [
+        '--path', clone.working_dir, 'workspace', '-m',
+        str(manifest), 'pickup', 'dev'
+    ])
+    assert result.exit_code == 1
+    assert '1 of 2 repos failed.' in result.output
+
+
+def test_sweep(config_file, make_clone):
+    clone = make_clone('clone')
+    clone.create_head('done')
+    clone.git.push('origin', 'done')
+    clone.git.commit('--allow-empty', '-m', 'Unmerged.')
+    clone.git.checkout('-b', 'wip')
+    clone.git.push('origin', 'wip')
+    clone.git.checkout('master')
+    # Checked out the way `pull-request get --worktree` does.
+    clone.git.worktree('add', '--no-track', '-B', 'pr-7',
+                       os.path.join(os.path.dirname(clone.working_dir),
+                                    'worktrees', 'pr-7'), 'upstream/master')
+    # Rebased and force-pushed after the clone fetched it.
+    clone.git.fetch('origin')
+    writer = make_clone('writer')
+    writer.git.fetch('origin')
+    writer.git.checkout('-b', 'wip', 'origin/wip')
+    writer.git.commit('--amend', '--allow-empty', '-m', 'Rebased.')
+    writer.git.push('--force', 'origin', 'wip')
+    args = ['--path', clone.working_dir, 'sweep']
+
+    result = CliRunner().invoke(cli.bro, args + ['--dry-run'])
+    assert result.exit_code == 0
+    assert '  done\n  origin/done\n' in result.output
+    assert 'wip' not in result.output
+    assert 'pr-7' not in result.output
+    assert 'done' in [head.name for head in clone.heads]
+
+    result = CliRunner().invoke(cli.bro, args, input='y\n')
+    assert result.exit_code == 0, result.output
+    assert [head.name for head in clone.heads] == ['master', 'pr-7', 'wip']
+    assert [ref.remote_head
+            for ref in clone.remotes.origin.refs] == ['master', 'wip']
+
+
+def test_sweep_into(config_file, make_clone):
+    clone = make_clone('clone')
+    for branch in ('develop', 'done', 'current'):
+        clone.create_head(branch)
+        clone.git.push('origin', branch)
+    clone.git.checkout('current')
+    args = ['--path', clone.working_dir, 'sweep', '--yes']
+
+    for into in ('develop', 'origin/develop'):
+        result = CliRunner().invoke(cli.bro, args + ['--into', into, '-n'])
+        assert result.exit_code == 0, result.output
+        # The target and the current branch stay, on origin too.
+        assert result.output.endswith(':\n  done\n  origin/done\n')
+
+    result = CliRunner().invoke(cli.bro, args + ['--into', 'develop'])
+    assert result.exit_code == 0, result.output
+    assert [head.name
+            for head in clone.heads] == ['current', 'develop', 'master']
+    assert [ref.remote_head for ref in clone.remotes.origin.refs
+            ] == ['current', 'develop', 'master']
+
+
+def test_pull_request_status(tmp_path, config_file, monkeypatch):
+    from bro.hub import PullRequest
+    from bro.store import PullRequestStore
+
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text('[github]\nusername = me\naccess_token = token\n')
+    store_path = tmp_path / 'pulls.sqlite'
+    monkeypatch.setattr(cli, 'PULLS_STORE', store_path)
+    repo = tmp_path / 'gitbro'
+    repo.mkdir()
+
+    def pr(number, login, **kwargs):
+        return PullRequest(number=number,
+                           state='open',
+                           title=f'Pull request {number}',
+                           user={'login': login},
+                           base={'label': 'bro:master'},
+                           **kwargs)
+
+    store = PullRequestStore(store_path)
+    store.upsert('bro', 'gitbro', [
+        pr(1, 'me', mergeable=False),
+        pr(2, 'sis', requested_reviewers=[{
+            'login': 'me'
+        }]),
+        pr(3, 'sis')
+    ],
+                 watermark='')
+    store.close()
+
+    result = CliRunner().invoke(
+        cli.bro, ['--path', str(repo), 'pull-request', 'status', 'bro'])
+    assert result.exit_code == 0
+    mine, _, reviews = result.output.partition('Review requests:')
+    assert re.search(r'1 +Pull request 1 +bro:master +conflicts', mine)
+    assert re.search(r'2 +Pull request 2 +sis', reviews)
+    assert 'Pull request 3' not in result.output
+    assert 'Synced 0 minutes ago.' in result.output
@@ -0,0 +1,162 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from bro import cli, daemon
+
+
+class Streams:
+    '''Standard streams of a client, with the output it was relayed.'''
+
+    def __init__(self, stdin=''):
+        self.stdin = io.StringIO(stdin)
+        self.stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+        self.stderr = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+
+    @property
+    def output(self):
+        return b''.join(stream.buffer.getvalue()
+                        for stream in (self.stdout, self.stderr)).decode()
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    config_file = tmp_path / '.config/bro'
+    monkeypatch.setattr(cli, 'CONFIG_FILE', config_file)
+    return config_file
+
+
+@pytest.fixture
+def socket_path(tmp_path, config_file, monkeypatch):
+    '''Path of a daemon served in a thread for the test.'''
+    monkeypatch.setattr(cli, 'SHARED_STATE', None)
+    monkeypatch.delenv(daemon.NO_DAEMON_ENV, raising=False)
+    path = tmp_path / 'daemon.sock'
+    thread = threading.Thread(target=daemon.serve,
+                              args=(path, 10),
+                              daemon=True)
+    thread.start()
+    while not daemon.request({'ping': True}, path):
+        thread.join(0.01)
+    yield path
+    daemon.request({'stop': True}, path)
+    thread.join()
+    assert not path.exists()
+
+
+def run(socket_path, *args, stdin=''):
+    streams = Streams(stdin)
+    saved = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin, sys.stdout, sys.stderr = (streams.stdin, streams.stdout,
+                                         streams.stderr)
+    try:
+        code = daemon.run_in_daemon(list(args), socket_path)
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved
+    return code, streams.output
+
+
+def test_run(socket_path, make_clone):
+    clone = make_clone('clone')
+    clone.create_head('done')
+    args = ['--path', clone.working_dir, 'sweep']
+
+    code, output = run(socket_path, *args, '--dry-run')
+    assert code == 0
+    assert '  done\n' in output
+
+    # Prompts read lines from stdin of the client.
+    code, output = run(socket_path, *args, stdin='y\n')
+    assert code == 0
+    assert 'remote branches? [y/N]: Deleted 1 local' in output
+    assert [head.name for head in clone.heads] == ['master']
+
+    code, output = run(socket_path, '--path', clone.working_dir, 'pipeline',
+                       '--through', 'nope')
+    assert code == 1
+    assert 'Branch nope does not exist.' in output
+
+    status = daemon.request({'ping': True}, socket_path)
+    assert status['served'] == 3
+    assert status['repos'] == [clone.working_dir]
+
+
+def test_run_in_client(socket_path, monkeypatch):
+    assert run(socket_path, 'daemon', 'status')[0] is None
+    # Making a pull request opens an editor.
+    assert run(socket_path, 'pr', 'make', 'bro')[0] is None
+    # So do prompts for a github password, until a token is saved.
+    assert run(socket_path, '-p', '.', 'pr', 'list', 'bro')[0] is None
+
+    monkeypatch.setenv(daemon.NO_DAEMON_ENV, '1')
+    assert run(socket_path, '--help')[0] is None
+
+
+def test_client_env(tmp_path, make_clone, monkeypatch):
+    '''Variables set in the client only, like a new ssh agent, reach git
+    run by a daemon started before.
+    '''
+    clone = make_clone('clone')
+    path = tmp_path / 'daemon.sock'
+    env = dict(os.environ, HOME=str(tmp_path), PYTHONPATH=os.getcwd())
+    env.pop('GIT_TRACE', None)
+    env.pop(daemon.NO_DAEMON_ENV, None)
+    code = f'from bro.daemon import serve; serve({str(path)!r}, 10)'
+    server = subprocess.Popen([sys.executable, '-c', code], env=env)
+    try:
+        deadline = time.monotonic() + 10
+        while not daemon.request({'ping': True}, path):
+            assert time.monotonic() < deadline and server.poll() is None
+            time.sleep(0.05)
+
+        trace = tmp_path / 'trace.log'
+        monkeypatch.delenv(daemon.NO_DAEMON_ENV, raising=False)
+        monkeypatch.setenv('GIT_TRACE', str(trace))
+        code, output = run(path, '--path', clone.working_dir, 'status')
+        assert code == 0, output
+        assert 'for-each-ref' in trace.read_text()
+
+        # The environment of the daemon is back after the command.
+        trace.unlink()
+        monkeypatch.delenv('GIT_TRACE')
+        assert run(path, '--path', clone.working_dir, 'status')[0] == 0
+        assert not trace.exists()
+    finally:
+        daemon.request({'stop': True}, path)
+        server.wait(10)
+
+
+def test_client_imports():
+    code = ('import sys, bro.daemon; '
+            "print(*[m for m in ('click', 'git', 'requests') "
+            'if m in sys.modules])')
+    output = subprocess.run([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE,
+                            check=True,
+                            universal_newlines=True).stdout
+    assert output.strip() == ''
+
+
+def test_not_running(tmp_path):
+    assert daemon.run_in_daemon(['--help'], tmp_path / 'none.sock') is None
+    assert daemon.request({'ping': True}, tmp_path / 'none.sock') is None
+
+
+def test_shared_context(tmp_path, config_file, make_clone):
+    clone = make_clone('clone')
+    shared = {}
+    ctx = cli.LazyContext(clone.working_dir, shared)
+    repo, config = ctx['repo'], ctx['config']
+
+    ctx = cli.LazyContext(clone.working_dir, shared)
+    assert ctx['repo'] is repo
+    assert ctx['config'] is config
+
+    config_file.write_text('[git]\nmain_branch = main\n')
+    ctx = cli.LazyContext(clone.working_dir, shared)
+    assert ctx['config']['main_branch'] == 'main'
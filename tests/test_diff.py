@@ -0,0 +1,56 @@
+from bro.diff import FileDiff, Hunk, iter_lines, parse_diff
+
+DIFF = b'''diff --git a/bro/git.py b/bro/git.py
+index 3b18e51..a9c3f2e 100644
+--- a/bro/git.py
++++ b/bro/git.py
+@@ -1,4 +1,5 @@ imports
+ from logging import getLogger
+-from pathlib import Path
++from pathlib import PurePath
++from time import monotonic
+\x20
+ LOGGER = getLogger(__name__)
+@@ -20 +21 @@ class GitRepo:
+--- not a header
++++ not a header either
+diff --git a/README.md b/README.md
+deleted file mode 100644
+index 3b18e51..0000000
+--- a/README.md
++++ /dev/null
+@@ -1,2 +0,0 @@
+-# gitbro
+-No newline here
+\\ No newline at end of file
+diff --git a/old.py b/new.py
+similarity index 100%
+rename from old.py
+rename to new.py
+diff --git a/logo.png b/logo.png
+new file mode 100644
+Binary files /dev/null and b/logo.png differ
+'''
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_iter_lines():
+    for size in (1, 7, 1024):
+        assert list(iter_lines(chunked(DIFF, size))) == DIFF.decode().split(
+            '\n')[:-1]
+
+
+def test_parse_diff():
+    records = list(parse_diff(iter_lines(chunked(DIFF, 5))))
+    assert records == [
+        Hunk('bro/git.py', 1, 4, 1, 5, 'imports', 2, 1),
+        Hunk('bro/git.py', 20, 1, 21, 1, 'class GitRepo:', 1, 1),
+        FileDiff('bro/git.py', 'bro/git.py', 'modified', 3, 2, 2),
+        Hunk('README.md', 1, 2, 0, 0, '', 0, 2),
+        FileDiff('README.md', None, 'deleted', 0, 2, 1),
+        FileDiff('old.py', 'new.py', 'renamed', 0, 0, 0),
+        FileDiff(None, 'logo.png', 'binary', 0, 0, 0),
+    ]
@@ -1,8 +1,14 @@
 import logging
+import os
 
 import git
 import pytest
 
+import bro.git
+from bro.exceptions import GitCmdError, MergeConflict
+from bro.git import GitRepo
+from bro.merge import TreeMerger
+
 
 @pytest.mark.usefixtures('git_repo')
 class TestGitBranch:
@@ -46,6 +52,89 @@ class TestGitRemote:
 
         assert 'Fetched origin/master' in caplog.text
 
+    def test_fetch_many(self, make_clone, mocker):
+        for branch in ('release', 'hotfix'):
+            make_clone.upstream.create_head(branch)
+        repo = GitRepo(make_clone('clone').working_dir)
+        fetch = mocker.spy(git.Remote, 'fetch')
+
+        repo.fetch('upstream', 'master', 'release', 'hotfix')
+
+        fetch.assert_called_once()
+        assert {'upstream/release', 'upstream/hotfix'} <= {
+            ref.name
+            for ref in repo.repo.remotes.upstream.refs
+        }
+
+    def test_fetch_force_pushed(self, make_clone):
+        repo = GitRepo(make_clone('clone').working_dir)
+        writer = make_clone('writer')
+        writer.git.checkout('-b', 'feature')
+        writer.git.commit('--allow-empty', '-m', 'Feature.')
+        writer.git.push('upstream', 'feature')
+        repo.fetch('upstream', 'feature')
+
+        # Rebased and force-pushed, as the default pipeline does.
+        writer.git.commit('--amend', '--allow-empty', '-m', 'Amended.')
+        writer.git.push('--force', 'upstream', 'feature')
+        repo.fetch('upstream', prune=True)
+        assert repo.refs.sha('refs/remotes/upstream/feature') == (
+            writer.head.commit.hexsha)
+
+    @pytest.fixture
+    def behind(self, make_clone):
+        '''Repo cloned before upstream got a branch with three commits on
+        top of master, also as pull request 7.
+        '''
+        repo = GitRepo(make_clone('clone').working_dir)
+        writer = make_clone('writer')
+        writer.git.checkout('-b', 'feature')
+        for n in range(3):
+            path = os.path.join(writer.working_dir, f'file{n}')
+            with open(path, 'w') as f:
+                f.write(f'{n}\n')
+            writer.git.add(path)
+            writer.git.commit('-m', f'Add file {n}.')
+        writer.git.push('upstream', 'feature', 'feature:refs/pull/7/head')
+        make_clone.upstream.git.config('uploadpack.allowFilter', 'true')
+        return repo
+
+    def test_fetch_shallow(self, behind):
+        stats = behind.fetch('upstream', 'feature', depth=1)
+        assert behind.repo.git.rev_list('--count', 'upstream/feature') == '1'
+        assert 'in' in stats.summary()
+
+        behind.fetch_pull_request('upstream', 7, 'pr-7', shallow_since='1970')
+        assert behind.repo.git.rev_list('--count', 'pr-7') == '4'
+
+    def test_fetch_partial(self, behind):
+        behind.fetch('upstream', 'feature', filter_spec='blob:none')
+        missing = behind.repo.git.rev_list('--objects', '--missing=print',
+                                           'upstream/feature')
+        assert missing.count('\n?') == 3
+        assert behind.repo.git.config('remote.upstream.promisor') == 'true'
+        # Blobs are backfilled from the promisor remote.
+        assert behind.repo.git.show('upstream/feature:file2') == '2'
+
+    def test_worktrees(self, behind, tmp_path):
+        behind.fetch_pull_requests(
+            'upstream', [(7, 'refs/remotes/upstream/pull/7')], force=True)
+        path = tmp_path / 'worktrees/pr-7'
+
+        errors = behind.worktrees_checkout([
+            (path, 'pr-7', 'upstream/pull/7'),
+            (tmp_path / 'worktrees/master', 'master', 'upstream/master')
+        ])
+        assert errors[0] is None
+        # Master is checked out in the main worktree.
+        assert isinstance(errors[1], GitCmdError)
+        assert (path / 'file2').read_text() == '2\n'
+
+        (path / 'notes.txt').write_text('Looks good.\n')
+        behind.worktree_checkout(path, 'pr-7', 'upstream/master')
+        assert not (path / 'file2').exists()
+        assert (path / 'notes.txt').exists()
+
     @pytest.mark.parametrize(
         'args, push_args, output',
         [(['origin', 'master'], ['origin', 'master'
@@ -71,3 +160,171 @@ class TestGitRemote:
             git_repo.executor.pull.assert_called_once_with(pull_args)
 
         assert output in caplog.text
+
+
+class TestGitMerge:
+    def commit(self, repo, branch, files, message='Change.'):
+        repo.repo.git.checkout(branch)
+        for path, content in files.items():
+            path = repo.path / path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        repo.repo.git.add(list(files))
+        repo.repo.git.commit('-m', message)
+        return repo.repo.head.commit
+
+    @pytest.fixture
+    def repo(self, make_clone):
+        repo = GitRepo(make_clone('clone').working_dir)
+        self.commit(repo, 'master', {
+            'a/one.txt': 'one\n',
+            'b/two.txt': 'two\n',
+            'c/three.txt': '1\n2\n3\n4\n5\n6\n7\n'
+        })
+        repo.branch_create('feature')
+        return repo
+
+    def test_up_to_date(self, repo):
+        head = repo.repo.head.commit
+        assert repo.merge('feature') == head
+        assert repo.repo.head.commit == head
+
+    def test_fast_forward(self, repo, mocker):
+        feature = self.commit(repo, 'feature', {'a/one.txt': 'uno\n'})
+        repo.repo.git.checkout('master')
+        merge_trees = mocker.spy(bro.git, 'merge_trees')
+
+        assert repo.merge('feature') == feature
+        assert repo.repo.head.commit == feature
+        assert (repo.path / 'a/one.txt').read_text() == 'uno\n'
+        assert not repo.repo.is_dirty()
+        merge_trees.assert_not_called()
+
+    def test_merge(self, repo, mocker):
+        theirs = self.commit(repo, 'feature', {
+            'a/one.txt': 'uno\n',
+            'c/three.txt': '1\n2\n3\n4\n5\n6\nseven\n'
+        })
+        ours = self.commit(repo, 'master', {
+            'd/four.txt': 'four\n',
+            'c/three.txt': 'one\n2\n3\n4\n5\n6\n7\n'
+        })
+        entries = mocker.spy(TreeMerger, '_entries')
+
+        commit = repo.merge('feature')
+
+        assert list(commit.parents) == [ours, theirs]
+        assert repo.repo.head.commit == commit
+        assert (repo.path / 'a/one.txt').read_text() == 'uno\n'
+        assert (repo.path / 'd/four.txt').read_text() == 'four\n'
+        assert (repo.path / 'c/three.txt').read_text() == (
+            'one\n2\n3\n4\n5\n6\nseven\n')
+        assert not repo.repo.is_dirty()
+        # Only the root and c/ are read, b/ is the same on both sides.
+        assert entries.call_count == 6
+
+    def test_conflict(self, repo):
+        self.commit(repo, 'feature', {'a/one.txt': 'uno\n'})
+        ours = self.commit(repo, 'master', {'a/one.txt': 'eins\n'})
+
+        with pytest.raises(MergeConflict) as e:
+            repo.merge('feature')
+
+        assert e.value.paths == ['a/one.txt']
+        assert repo.repo.head.commit == ours
+        assert (repo.path / 'a/one.txt').read_text() == 'eins\n'
+
+
+class TestGitSweep:
+    @pytest.fixture
+    def repo(self, make_clone):
+        clone = make_clone('clone')
+        clone.git.commit('--allow-empty', '-m', 'Unmerged.')
+        clone.create_head('unmerged')
+        clone.git.reset('--hard', 'HEAD~')
+        for branch in ('done', 'done-too', 'unmerged'):
+            if branch != 'unmerged':
+                clone.create_head(branch)
+            clone.git.push('origin', branch)
+        return GitRepo(clone.working_dir)
+
+    def test_merged_branches(self, repo, mocker, tmp_path):
+        repo.fetch('origin')
+        repo.worktree_checkout(tmp_path / 'worktrees/pr-7', 'pr-7',
+                               'upstream/master')
+        execute = mocker.spy(git.cmd.Git, 'execute')
+
+        branches, remote_branches = repo.merged_branches(
+            'upstream/master', 'origin')
+
+        # Branches checked out in worktrees, master too, are left out.
+        assert sorted(branches) == ['done', 'done-too']
+        assert sorted(remote_branches) == [('origin', 'done'),
+                                           ('origin', 'done-too'),
+                                           ('origin', 'master')]
+        execute.assert_called_once()
+
+    def test_delete_many(self, repo, mocker):
+        execute = mocker.spy(git.cmd.Git, 'execute')
+
+        repo.branch_delete('done', 'done-too')
+        repo.push_delete('origin', 'done', 'done-too')
+
+        assert not {'done', 'done-too'} & set(repo.refs.branches())
+        remote = repo.repo.remotes.origin
+        assert [ref.remote_head for ref in remote.refs] == ['unmerged']
+        assert 'unmerged' in repo.refs.branches()
+        commands = [call.args[1][1] for call in execute.call_args_list]
+        assert commands.count('branch') == 1
+        assert commands.count('push') == 1
+
+
+class TestGitStatus:
+    @pytest.fixture
+    def repo(self, make_clone):
+        '''Clone whose branches forked from master at different commits,
+        one merging master back, while master moved on.
+        '''
+        clone = make_clone('clone')
+        clone.git.checkout('-b', 'old')
+        for n in range(3):
+            clone.git.commit('--allow-empty', '-m', f'Old {n}.')
+        clone.git.checkout('master')
+        clone.git.commit('--allow-empty', '-m', 'Moved on.')
+        clone.git.checkout('-b', 'merging')
+        clone.git.commit('--allow-empty', '-m', 'Merging.')
+        clone.git.checkout('master')
+        clone.git.commit('--allow-empty', '-m', 'Moved on again.')
+        clone.git.checkout('merging')
+        clone.git.merge('--no-edit', 'master')
+        clone.git.checkout('master')
+        clone.git.commit('--allow-empty', '-m', 'Moved on once more.')
+        clone.create_head('same', 'master')
+        clone.git.branch('--set-upstream-to', 'upstream/master', 'old')
+        return GitRepo(clone.working_dir)
+
+    def test_branch_upstreams(self, repo):
+        assert [(branch, upstream, current)
+                for branch, _, upstream, current in repo.branch_upstreams()
+                ] == [('master', 'refs/remotes/upstream/master', True),
+                      ('merging', None, False),
+                      ('old', 'refs/remotes/upstream/master', False),
+                      ('same', None, False)]
+
+    def test_ahead_behind(self, repo, mocker):
+        shas = {branch: sha for branch, sha, _, _ in repo.branch_upstreams()}
+        shas['upstream'] = repo.resolve('refs/remotes/upstream/master')
+        pairs = [(shas[left], shas[right])
+                 for left in ('old', 'merging', 'same', 'master')
+                 for right in ('master', 'upstream')]
+        execute = mocker.spy(git.cmd.Git, 'execute')
+
+        counts = repo.ahead_behind(pairs)
+        assert execute.call_count == 2
+
+        for left, right in pairs:
+            output = repo.executor.rev_list('--left-right', '--count',
+                                            f'{left}...{right}')
+            assert counts[left, right] == tuple(map(int, output.split()))
+        assert counts[shas['merging'], shas['master']] == (2, 1)
+        assert counts[shas['old'], shas['upstream']] == (3, 0)
@@ -0,0 +1,276 @@
+import json
+import re
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from bro import hub
+from bro.api import API
+from bro.exceptions import GithubError
+
+
+def pr_json(number, **kwargs):
+    return dict(number=number,
+                head={'label': f'bro:dev-{number}'},
+                base={'label': 'bro:master'},
+                **kwargs)
+
+
+@pytest.fixture
+def github_api(github_server, monkeypatch):
+    api = API(github_server.url)
+    monkeypatch.setattr(hub, 'GITHUB_API', api)
+    return api
+
+
+class TestListPullRequests:
+    def paginate(self, github_server, pages):
+        def route(handler):
+            query = parse_qs(urlparse(handler.path).query)
+            page = int(query.get('page', [1])[0])
+            headers = {}
+            if page < len(pages):
+                next_url = (f'{github_server.url}/repos/bro/gitbro/pulls'
+                            f'?state=all&page={page + 1}')
+                headers['Link'] = f'<{next_url}>; rel="next"'
+            return 200, headers, pages[page - 1]
+
+        github_server.routes[('GET', '/repos/bro/gitbro/pulls')] = route
+
+    def test_pagination(self, github_server, github_api):
+        pages = [[pr_json(n) for n in range(p * 3, p * 3 + 3)]
+                 for p in range(3)]
+        self.paginate(github_server, pages)
+
+        prs = hub.list_pull_requests('bro', 'gitbro', None, state='all')
+        assert [pr.number for pr in prs] == list(range(9))
+        assert len(github_server.requests) == 3
+
+    def test_filters(self, github_server, github_api):
+        self.paginate(github_server, [[pr_json(1)]])
+
+        prs = list(
+            hub.list_pull_requests('bro',
+                                   'gitbro',
+                                   None,
+                                   state='closed',
+                                   base='master',
+                                   head='bro:dev-1'))
+        assert len(prs) == 1
+
+        path = github_server.requests[0][1]
+        for param in ('state=closed', 'base=master', 'head=bro%3Adev-1'):
+            assert param in path
+
+    def test_lazy(self, github_server, github_api):
+        pages = [[pr_json(n)] for n in range(5)]
+        self.paginate(github_server, pages)
+
+        prs = hub.list_pull_requests('bro', 'gitbro', None)
+        assert next(prs).number == 0
+        prs.close()
+        # Only the current page and the prefetched one are requested.
+        assert len(github_server.requests) == 2
+
+
+class TestPullRequest:
+    def test_compact(self):
+        pr = hub.PullRequest.from_json(**pr_json(1,
+                                                 title='Fix',
+                                                 labels=['bug'],
+                                                 user={
+                                                     'login': 'bro',
+                                                     'followers_url': ''
+                                                 }))
+        assert not hasattr(pr, '__dict__')
+        assert not hasattr(pr, 'labels')
+        assert pr.head == {'label': 'bro:dev-1', 'ref': None, 'sha': None}
+        assert pr.meta['head'] == 'bro:dev-1'
+        assert pr.content['title'] == 'Fix'
+        assert pr.extra['author']['login'] == 'bro'
+
+    def test_cached_views(self):
+        pr = hub.PullRequest.from_json(**pr_json(1))
+        assert pr.meta is pr.meta
+        assert pr.content is pr.content
+        assert pr.extra is pr.extra
+
+    def test_batch(self):
+        batch = hub.PullRequestBatch.from_json(
+            pr_json(n, additions=None if n == 2 else n) for n in range(5))
+
+        assert len(batch) == 5
+        assert list(batch.column('number')) == list(range(5))
+        assert batch[3].meta == hub.PullRequest.from_json(
+            **pr_json(3, additions=3)).meta
+        assert [pr.content['additions'] for pr in batch] == [0, 1, -1, 3, 4]
+        assert [pr.number for pr in batch[1:3]] == [1, 2]
+
+
+class TestPullRequestDiff:
+    @pytest.fixture
+    def patch_api(self, github_server, monkeypatch):
+        api = API(github_server.url)
+        monkeypatch.setattr(hub, 'GITHUB_PATCH_API', api)
+        return api
+
+    def test_stream(self, github_server, patch_api):
+        diff = b'diff --git a/x b/x\n' * 1000
+        github_server.routes[('GET', '/raw/bro/gitbro/pull/7.diff')] = (200,
+                                                                        {},
+                                                                        diff)
+
+        chunks = list(
+            hub.iter_pull_request_diff('bro', 'gitbro', 7, chunk_size=1024))
+        assert len(chunks) > 1
+        assert max(len(chunk) for chunk in chunks) <= 1024
+        assert b''.join(chunks) == diff
+
+    def test_download(self, github_server, patch_api, tmp_path):
+        diff = b'diff --git a/x b/x\n' * 1000
+        github_server.routes[('GET', '/raw/bro/gitbro/pull/7.diff')] = (200,
+                                                                        {},
+                                                                        diff)
+
+        path = tmp_path / '7.diff'
+        assert hub.download_pull_request_diff('bro', 'gitbro', 7,
+                                              path) == len(diff)
+        assert path.read_bytes() == diff
+
+
+class TestBatchPullRequests:
+    def test_batch(self, github_server, github_api):
+        github_server.latency = 0.1
+        for n in range(6):
+            github_server.routes[('PUT', f'/repos/bro/gitbro/pulls/{n}/merge'
+                                  )] = (405 if n == 4 else 200, {}, {
+                                      'merged': n != 4
+                                  })
+
+        start = time.monotonic()
+        results = list(
+            hub.batch_pull_requests('bro',
+                                    'gitbro',
+                                    None,
+                                    'merge',
+                                    range(6),
+                                    workers=6,
+                                    commit_message='Release.'))
+        assert time.monotonic() - start < 0.5
+
+        assert sorted(r.number for r in results) == list(range(6))
+        failed = [r for r in results if not r.ok]
+        assert [r.number for r in failed] == [4]
+        assert '405' in failed[0].result
+        assert all(b'Release.' in body for *_, body in github_server.requests)
+
+    def test_comment(self, github_server, github_api):
+        github_server.routes[('POST',
+                              '/repos/bro/gitbro/issues/1/comments')] = (201,
+                                                                         {},
+                                                                         {})
+        results = list(
+            hub.batch_pull_requests('bro',
+                                    'gitbro',
+                                    None,
+                                    'comment', [1],
+                                    comment='Shipped in 0.2.'))
+        assert results == [hub.BatchResult(1, True, {})]
+
+
+def pr_node(number, **kwargs):
+    node = {
+        'databaseId': 1000 + number,
+        'number': number,
+        'state': 'OPEN',
+        'merged': False,
+        'mergeable': 'MERGEABLE',
+        'title': f'Pull request {number}',
+        'url': f'https://github.com/bro/gitbro/pull/{number}',
+        'commits': {
+            'totalCount': 2
+        },
+        'author': {
+            '__typename': 'User',
+            'login': 'bro',
+            'databaseId': 1
+        },
+        'headRefName': f'dev-{number}',
+        'headRepositoryOwner': {
+            'login': 'fork'
+        },
+        'baseRefName': 'master',
+        'reviewRequests': {
+            'nodes': [{
+                'requestedReviewer': {
+                    'login': 'reviewer'
+                }
+            }, {
+                'requestedReviewer': {}
+            }]
+        }
+    }
+    node.update(kwargs)
+    return node
+
+
+class TestGetPullRequests:
+    @pytest.fixture
+    def graphql(self, github_server):
+        '''Stand-in graphql endpoint answering aliased pull requests.'''
+        nodes = {}
+
+        def route(handler):
+            body = json.loads(handler.server.requests[-1][3])
+            assert body['variables'] == {'owner': 'bro', 'repo': 'gitbro'}
+            assert 'fragment pullRequest on PullRequest' in body['query']
+            aliases = re.findall(r'(pr\d+): pullRequest\(number: (\d+)\)',
+                                 body['query'])
+            repository = {
+                alias: nodes.get(int(number))
+                for alias, number in aliases
+            }
+            return 200, {}, {'data': {'repository': repository}}
+
+        github_server.routes[('POST', '/graphql')] = route
+        return nodes
+
+    def test_chunks(self, github_server, github_api, graphql):
+        graphql.update((n, pr_node(n)) for n in range(1, 121))
+
+        prs = hub.get_pull_requests('bro', 'gitbro', range(120, 0, -1), None)
+
+        assert [pr.number for pr in prs] == list(range(120, 0, -1))
+        assert len(github_server.requests) == 3
+
+    def test_fields(self, github_server, github_api, graphql):
+        graphql[7] = pr_node(7, state='MERGED', merged=True,
+                             mergeable='UNKNOWN')
+
+        pr, = hub.get_pull_requests('bro', 'gitbro', [7, 8, 7], None)
+
+        assert pr.meta['id'] == 1007
+        assert pr.meta['state'] == 'closed' and pr.merged
+        assert pr.mergeable is None
+        assert pr.meta['head'] == 'fork:dev-7'
+        assert pr.meta['base'] == 'bro:master'
+        assert pr.content['commits'] == 2
+        assert pr.requested_reviewers == [{'login': 'reviewer'}]
+        assert pr.extra['author']['type'] == 'User'
+        assert pr.extra['urls']['diff_url'].endswith('/pull/7.diff')
+        assert pr.comments_url == (
+            f'{github_server.url}/repos/bro/gitbro/issues/7/comments')
+
+    def test_errors(self, github_server, github_api):
+        github_server.routes[('POST', '/graphql')] = (200, {}, {
+            'data': {
+                'repository': None
+            },
+            'errors': [{
+                'message': 'Could not resolve to a Repository.'
+            }]
+        })
+
+        with pytest.raises(GithubError, match='Could not resolve'):
+            hub.get_pull_requests('bro', 'gitbro', [1], None)
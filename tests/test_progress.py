@@ -0,0 +1,68 @@
+from io import StringIO
+
+import pytest
+
+from bro import progress
+from bro.progress import ProgressDisplayer, format_size
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(progress, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_format_size():
+    assert format_size(512) == '512 B'
+    assert format_size(1536) == '1.5 KiB'
+    assert format_size(3 * 1024**3) == '3.0 GiB'
+
+
+def test_throttle(clock):
+    stream = StringIO()
+    displayer = ProgressDisplayer(stream, interval=0.1)
+    draw = []
+    displayer._draw = lambda line, end: draw.append((line, end))
+
+    receiving = ProgressDisplayer.RECEIVING
+    displayer.update(receiving | ProgressDisplayer.BEGIN, 0, 1000)
+    for count in range(1, 1000):
+        clock[0] += 0.001
+        displayer.update(receiving, count, 1000, ', 1.00 MiB | 1 MiB/s')
+    displayer.update(receiving | ProgressDisplayer.END, 1000, 1000,
+                     ', 2.00 MiB | 2 MiB/s, done.')
+
+    # One draw per interval plus the first and the final one.
+    assert 10 <= len(draw) <= 12
+    assert draw[-1][1]
+    assert displayer.bytes == 2 * 1024 * 1024
+
+
+def test_rates(clock):
+    stream = StringIO()
+    displayer = ProgressDisplayer(stream, interval=0)
+    displayer.update(ProgressDisplayer.RECEIVING | ProgressDisplayer.BEGIN, 0,
+                     100)
+    clock[0] += 2
+    displayer.update(ProgressDisplayer.RECEIVING, 50, 100,
+                     ', 100.00 KiB | 50 KiB/s')
+
+    line = stream.getvalue().split('\r')[-1].strip()
+    assert line == ('Receiving: 50/100 (50%), 25 objects/s, '
+                    '100.0 KiB, 50.0 KiB/s, eta 2s')
+
+
+def test_phases_without_total(clock):
+    stream = StringIO()
+    displayer = ProgressDisplayer(stream, interval=0)
+    displayer.update(ProgressDisplayer.COUNTING, 10, None)
+    displayer.update(ProgressDisplayer.COUNTING | ProgressDisplayer.END, 20,
+                     None)
+    displayer.update(ProgressDisplayer.RESOLVING, 1, 2)
+
+    assert [phase.name for phase in displayer.phases] == [
+        'Counting', 'Resolving'
+    ]
+    assert stream.getvalue().count('\n') == 1
+    assert displayer.summary().startswith('done in')
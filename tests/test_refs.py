@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from bro.refs import RefIndex
+
+
+def age(git_dir, seconds=60):
+    '''Move mtimes of ref files to the past, out of the racy window.'''
+    for root, _, files in os.walk(git_dir):
+        for path in [root] + [os.path.join(root, name) for name in files]:
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns,
+                               stat.st_mtime_ns - seconds * 10**9))
+
+
+@pytest.fixture
+def git_dir(tmp_path):
+    git_dir = tmp_path / '.git'
+    (git_dir / 'refs/heads/feature').mkdir(parents=True)
+    (git_dir / 'refs/remotes/upstream').mkdir(parents=True)
+    (git_dir / 'packed-refs').write_text(
+        '# pack-refs with: peeled fully-peeled sorted\n'
+        f'{"1" * 40} refs/heads/master\n'
+        f'{"2" * 40} refs/remotes/upstream/master\n'
+        f'{"3" * 40} refs/tags/v0.1.0\n'
+        f'^{"4" * 40}\n')
+    (git_dir / 'refs/heads/master').write_text('a' * 40 + '\n')
+    (git_dir / 'refs/heads/feature/x').write_text('b' * 40 + '\n')
+    (git_dir / 'refs/remotes/upstream/HEAD').write_text(
+        'ref: refs/remotes/upstream/master\n')
+    (git_dir / 'config').write_text('[core]\n\tbare = false\n'
+                                    '[remote "upstream"]\n\turl = x\n'
+                                    '[remote "origin"]\n\turl = y\n')
+    age(git_dir)
+    return git_dir
+
+
+def test_snapshot(git_dir):
+    index = RefIndex(git_dir)
+
+    # Loose refs take precedence over packed ones.
+    assert index.sha('refs/heads/master') == 'a' * 40
+    assert index.sha('refs/remotes/upstream/master') == '2' * 40
+    assert index.sha('refs/tags/v0.1.0') == '3' * 40
+    assert index.sha('refs/remotes/upstream/HEAD') == (
+        'ref: refs/remotes/upstream/master')
+    assert sorted(index.branches()) == ['feature/x', 'master']
+    assert index.remotes == {'upstream', 'origin'}
+
+
+def test_reuse(git_dir, mocker):
+    index = RefIndex(git_dir)
+    load = mocker.spy(index, '_load')
+    for _ in range(5):
+        assert index.has_branch('master')
+    assert load.call_count == 1
+
+
+def test_reload_on_change(git_dir):
+    index = RefIndex(git_dir)
+    assert not index.has_branch('feature/y')
+
+    (git_dir / 'refs/heads/feature/y').write_text('c' * 40 + '\n')
+    assert index.has_branch('feature/y')
+
+    (git_dir / 'refs/heads/feature/y').unlink()
+    assert not index.has_branch('feature/y')
+
+    with open(git_dir / 'config', 'a') as f:
+        f.write('[remote "fork"]\n\turl = z\n')
+    assert 'fork' in index.remotes
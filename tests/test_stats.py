@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from bro.exceptions import GitCmdError
+from bro.git import GitRepo
+from bro.stats import DiffStats, StatsCache, ahead_behind, diff_stats
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = StatsCache(tmp_path / 'stats.sqlite')
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def pull(make_clone):
+    '''Clone with a pr branch forked from master, which moved on since.'''
+    clone = make_clone('clone')
+    root = clone.working_dir
+    clone.git.checkout('-b', 'pr')
+    with open(f'{root}/README.md', 'a') as f:
+        f.write('More.\n')
+    clone.git.mv('README.md', 'README.txt')
+    clone.git.add('README.txt')
+    clone.git.commit('-m', 'Rename readme.')
+    for path, text in (('src/bro/a.py', 'a\nb\n'), ('src/c.py', 'c\n'),
+                       ('docs/logo.png', '\0png')):
+        os.makedirs(os.path.dirname(f'{root}/{path}'), exist_ok=True)
+        with open(f'{root}/{path}', 'w') as f:
+            f.write(text)
+        clone.git.add(path)
+    clone.git.commit('-m', 'Add files.')
+    clone.git.checkout('master')
+    clone.git.commit('--allow-empty', '-m', 'Moved on.')
+    return GitRepo(root)
+
+
+def test_numstat(pull):
+    commits, files = pull.numstat('master', 'pr')
+    assert commits == 2
+    assert sorted(files) == [('README.txt', 1, 0), ('docs/logo.png', 0, 0),
+                             ('src/bro/a.py', 2, 0), ('src/c.py', 1, 0)]
+    with pytest.raises(GitCmdError):
+        pull.resolve('nope')
+
+
+def test_directories():
+    stats = DiffStats(1, [('README.md', 1, 1), ('src/bro/a.py', 2, 0),
+                          ('src/c.py', 1, 3)])
+    assert (stats.additions, stats.deletions, stats.changed_files) == (4, 4, 3)
+    assert stats.directories() == [('.', (1, 1, 1)), ('src', (3, 3, 2))]
+    assert stats.directories(2) == [('.', (1, 1, 1)), ('src', (1, 3, 1)),
+                                    ('src/bro', (2, 0, 1))]
+
+
+def test_diff_stats(pull, cache, mocker):
+    numstat = mocker.spy(GitRepo, 'numstat')
+    base, head, stats = diff_stats(pull, 'refs/heads/master', 'refs/heads/pr',
+                                   cache)
+    assert head == pull.repo.heads.pr.commit.hexsha
+    assert (stats.commits, stats.additions) == (2, 4)
+
+    # Same shas are served from the cache, with figures intact.
+    assert diff_stats(pull, base, head, cache)[2] == stats
+    assert StatsCache(cache.path).get(base, head) == stats
+    assert numstat.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ahead_behind(pull, cache, mocker):
+    walk = mocker.spy(GitRepo, 'ahead_behind')
+    pr, master = (pull.resolve(f'refs/heads/{b}') for b in ('pr', 'master'))
+    pairs = [(pr, master), (master, master)]
+
+    assert ahead_behind(pull, pairs, cache) == {
+        (pr, master): (2, 1),
+        (master, master): (0, 0)
+    }
+    # Equal shas need no walk, and counts are kept across caches.
+    assert walk.call_args.args[1] == [(pr, master)]
+    counts = ahead_behind(pull, pairs, StatsCache(cache.path))
+    assert counts[pr, master] == (2, 1)
+    assert walk.call_count == 1
@@ -0,0 +1,137 @@
+import json
+import re
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from bro import hub
+from bro.api import API
+from bro.hub import PullRequest
+from bro.store import PullRequestStore, sync
+
+
+def pr_json(number, updated_at, state='open', login='bro', reviewers=()):
+    return {
+        'id': 1000 + number,
+        'number': number,
+        'state': state,
+        'title': f'Pull request {number}',
+        'updated_at': updated_at,
+        'user': {
+            'login': login
+        },
+        'head': {
+            'label': f'{login}:dev-{number}'
+        },
+        'base': {
+            'label': 'bro:master'
+        },
+        'requested_reviewers': [{
+            'login': reviewer
+        } for reviewer in reviewers]
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PullRequestStore(tmp_path / 'pulls.sqlite')
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def github(github_server, monkeypatch):
+    '''Stand-in github listing pull requests by update time, whose graphql
+    endpoint tells every open pull request is mergeable.
+    '''
+    monkeypatch.setattr(hub, 'GITHUB_API', API(github_server.url))
+    pulls = {}
+
+    def listing(handler):
+        query = parse_qs(urlparse(handler.path).query)
+        assert query['sort'] == ['updated']
+        assert query['direction'] == ['desc']
+        return 200, {}, sorted(pulls.values(),
+                               key=lambda pr: pr['updated_at'],
+                               reverse=True)
+
+    def graphql(handler):
+        body = json.loads(handler.server.requests[-1][3])
+        repository = {}
+        for alias, number in re.findall(
+                r'(pr\d+): pullRequest\(number: (\d+)\)', body['query']):
+            pr = pulls[int(number)]
+            repository[alias] = {
+                'databaseId': pr['id'],
+                'number': pr['number'],
+                'state': pr['state'].upper(),
+                'merged': False,
+                'mergeable': 'MERGEABLE',
+                'title': pr['title'],
+                'url': f'https://github.com/bro/gitbro/pull/{number}',
+                'updatedAt': pr['updated_at'],
+                'author': {
+                    'login': pr['user']['login']
+                },
+                'headRefName': f'dev-{number}',
+                'baseRefName': 'master',
+                'reviewRequests': {
+                    'nodes': [{
+                        'requestedReviewer': reviewer
+                    } for reviewer in pr['requested_reviewers']]
+                }
+            }
+        return 200, {}, {'data': {'repository': repository}}
+
+    github_server.routes[('GET', '/repos/bro/gitbro/pulls')] = listing
+    github_server.routes[('POST', '/graphql')] = graphql
+    return pulls
+
+
+class TestPullRequestStore:
+    def test_upsert(self, store):
+        store.upsert('bro', 'gitbro', [
+            PullRequest(**pr_json(1, '2020-01-01T00:00:00Z')),
+            PullRequest(**pr_json(2, '2020-01-02T00:00:00Z', login='sis')),
+            PullRequest(**pr_json(3, '2020-01-03T00:00:00Z', state='closed'))
+        ],
+                     watermark='2020-01-03T00:00:00Z')
+
+        assert store.get('bro', 'gitbro', 2).user['login'] == 'sis'
+        assert store.get('bro', 'other', 2) is None
+        assert [pr.number
+                for pr in store.authored('bro', 'gitbro', 'bro')] == [1]
+        assert store.last_sync('bro', 'gitbro')[0] == '2020-01-03T00:00:00Z'
+        assert store.last_sync('bro', 'other') == (None, None)
+
+    def test_review_requests(self, store):
+        store.upsert('bro', 'gitbro', [
+            PullRequest(**pr_json(n, f'2020-01-0{n}T00:00:00Z',
+                                  reviewers=['me'])) for n in (1, 2)
+        ])
+        assert [pr.number for pr in store.review_requests(
+            'bro', 'gitbro', 'me')] == [2, 1]
+
+        # Reviewers of an updated pull request replace the stored ones.
+        store.upsert('bro', 'gitbro',
+                     [PullRequest(**pr_json(2, '2020-01-04T00:00:00Z'))])
+        assert [pr.number for pr in store.review_requests(
+            'bro', 'gitbro', 'me')] == [1]
+
+
+def test_sync(store, github, github_server):
+    github.update((n, pr_json(n, f'2020-01-0{n}T00:00:00Z'))
+                  for n in range(1, 4))
+    assert sync(store, 'bro', 'gitbro', ('bro', 'token')) == 3
+    assert store.get('bro', 'gitbro', 1).mergeable is True
+    assert store.last_sync('bro', 'gitbro')[0] == '2020-01-03T00:00:00Z'
+
+    github[2] = pr_json(2, '2020-01-05T00:00:00Z', state='closed')
+    github_server.requests.clear()
+    assert sync(store, 'bro', 'gitbro', ('bro', 'token')) == 2
+    # Pull requests updated at the watermark are listed again.
+    assert [method
+            for method, *_ in github_server.requests] == ['GET', 'POST']
+    assert store.get('bro', 'gitbro', 2).state == 'closed'
+    assert [pr.number
+            for pr in store.authored('bro', 'gitbro', 'bro')] == [3, 1]
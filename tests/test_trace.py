@@ -0,0 +1,73 @@
+import json
+
+import git
+import pytest
+
+from bro import trace
+from bro.git import GitRepo
+
+
+@pytest.fixture
+def tracer():
+    tracer = trace.enable()
+    yield tracer
+    trace.disable()
+
+
+class Traced:
+    @trace.traced()
+    def work(self, value, twice=False):
+        with trace.span('inner', size=value):
+            return value * 2 if twice else value
+
+
+def test_disabled():
+    execute = git.cmd.Git.execute
+    assert trace.TRACER is None
+    assert trace.span('noop') is trace.NULL_SPAN
+    assert Traced().work(1, twice=True) == 2
+    assert git.cmd.Git.execute is execute
+
+
+def test_spans(tracer):
+    assert Traced().work(3, twice=True) == 6
+    with pytest.raises(ZeroDivisionError):
+        with trace.span('failing'):
+            1 / 0
+
+    inner, work, failing = tracer.events
+    assert inner[0] == 'inner' and inner[5] == {'size': 3}
+    assert work[0] == 'Traced.work'
+    assert work[5] == {'args': ['3'], 'twice': 'True'}
+    # The outer span starts first and ends last.
+    assert work[2] <= inner[2] and work[3] >= inner[3]
+    assert failing[5] == {'error': 'ZeroDivisionError'}
+
+
+def test_git_calls(tracer, make_clone):
+    repo = GitRepo(make_clone('clone').working_dir)
+    repo.branch_create('feature')
+    repo.branch_checkout('feature')
+
+    names = [event[0] for event in tracer.events]
+    assert 'GitRepo.branch_checkout' in names
+    assert 'git checkout' in names
+    trace.disable()
+    assert git.cmd.Git.execute.__name__ == 'execute'
+    assert not hasattr(git.cmd.Git.execute, '__wrapped__')
+
+
+def test_write(tracer, tmp_path):
+    for _ in range(3):
+        with trace.span('fast'):
+            pass
+    with trace.span('slow'):
+        sum(range(100000))
+    tracer.write(tmp_path / 'trace.json')
+
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert [event['name'] for event in events] == ['fast'] * 3 + ['slow']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    summary = tracer.summary()
+    assert summary[0][:2] == ('slow', 1)
+    assert summary[1][:2] == ('fast', 3)
@@ -0,0 +1,54 @@
+import pytest
+
+from bro import workspace
+from bro.git import GitRepo
+
+CONFIG = {
+    'main_branch': 'master',
+    'origin_remote': 'origin',
+    'upstream_remote': 'upstream',
+}
+
+
+@pytest.fixture
+def manifest(tmp_path, make_clone):
+    for name in ('api', 'web', 'worker'):
+        make_clone(name)
+    manifest = tmp_path / 'workspace'
+    manifest.write_text('# services\napi\n\nweb\nworker\nmissing\n')
+    return manifest
+
+
+def test_read_manifest(manifest, tmp_path):
+    assert workspace.read_manifest(manifest) == [
+        str(tmp_path / name) for name in ('api', 'web', 'worker', 'missing')
+    ]
+
+
+def test_run(manifest, tmp_path):
+    paths = workspace.read_manifest(manifest)
+    results = {
+        result.path: result
+        for result in workspace.run('pickup', paths, CONFIG, 'dev', 'master')
+    }
+
+    assert not results.pop(str(tmp_path / 'missing')).ok
+    assert all(result.ok for result in results.values())
+    for path in results:
+        assert GitRepo(path).current_branch.name == 'dev'
+
+    results = list(
+        workspace.run('putout', paths[:-1], CONFIG, 'dev', True, workers=2))
+    assert all(result.ok for result in results)
+
+
+def test_run_task_error(make_clone, monkeypatch):
+    def broken(repo, config):
+        raise KeyError('upstream_remote')
+
+    monkeypatch.setitem(workspace.TASKS, 'broken', broken)
+    path = make_clone('api').working_dir
+
+    result = workspace.run_task('broken', path, CONFIG)
+    assert not result.ok
+    assert result.message == "KeyError: 'upstream_remote'"